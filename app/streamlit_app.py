@@ -4,6 +4,7 @@ import json
 import io
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -26,14 +27,22 @@ if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
 from pipeline.detect import Detector
-from pipeline.alerts import build_alert
+from pipeline.columnar import read_clean
+from pipeline.alerts import SEVERITY_NAMES, SORT_KEYS, build_alerts
+from pipeline.aggregate import aggregate_anomalies, build_group_alerts
+from pipeline.hypothesis import HYPOTHESIS_TYPES
 from pipeline.llm_assistant import explain_alert
+from pipeline import metrics
 
 # Actions (optional safety)
 try:
-    from pipeline.actions import create_incident_report
+    from pipeline.actions import create_incident_report, log_action
 except Exception:
     create_incident_report = None
+    log_action = None
+
+from pipeline.actionlog import new_incident_id
+from pipeline.store import get_store
 
 # Hypothesis layer (optional)
 try:
@@ -41,12 +50,11 @@ try:
 except Exception:
     infer_attack_hypothesis = None
 
-# OpenAI (optional)
-OPENAI_AVAILABLE = True
-try:
-    from openai import OpenAI
-except Exception:
-    OPENAI_AVAILABLE = False
+# OpenAI (optional) – one shared client + persistent response cache
+from pipeline.llm_cache import alert_signature, cached_completion, get_client
+
+# bump when the prompt below changes (invalidates cached answers)
+PROMPT_VERSION = "streamlit_explain/v1"
 
 
 # ------------------------------------------------------------------
@@ -230,12 +238,10 @@ sample_size = st.sidebar.selectbox(
     index=1,
 )
 
-max_alerts = st.sidebar.slider(
-    "عدد التنبيهات المعروضة",
-    min_value=50,
-    max_value=300,
-    value=150,
-    step=50,
+page_size = st.sidebar.selectbox(
+    "عدد التنبيهات في الصفحة",
+    [25, 50, 100, 200],
+    index=1,
 )
 
 st.sidebar.markdown("---")
@@ -248,6 +254,27 @@ enable_ai = st.sidebar.checkbox(
 
 model_name = st.sidebar.text_input("Model", value="gpt-4o-mini")
 
+st.sidebar.markdown("---")
+metrics_box = st.sidebar.empty()
+
+
+def show_run_metrics():
+    # ملخص توقيت المراحل لهذا التشغيل (pipeline/metrics.py)
+    summary = metrics.run_summary()
+    with metrics_box.container():
+        with st.expander("⏱️ أداء التشغيل", expanded=False):
+            if summary["stages"]:
+                st.dataframe(
+                    pd.DataFrame(summary["stages"])[["stage", "calls", "total_s", "rows_per_s", "rss_hwm_growth_mb"]],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            for name, value in summary["counters"].items():
+                st.caption(f"{name}: {value:,.0f}")
+
+
+metrics.begin_run()
+
 
 
 # ------------------------------------------------------------------
@@ -257,7 +284,7 @@ DATA_PATH = os.path.join(BASE_DIR, "data", "clean", "Wednesday-WorkingHours.pcap
 
 @st.cache_data(show_spinner=False)
 def load_data(n):
-    df_ = pd.read_csv(DATA_PATH)
+    df_ = read_clean(DATA_PATH)
     if n != "ALL":
         df_ = df_.sample(n=int(n), random_state=42).reset_index(drop=True)
     return df_
@@ -266,6 +293,35 @@ def load_data(n):
 def load_detector():
     return Detector()
 
+# الدرجات ما تعتمد على q: تنحسب مرة وحدة لكل (ملف، حجم عينة، إصدار النماذج)،
+# وتحريك السلايدر يحسب العتبة والتنبيهات من الدرجات المرتبة فقط (بدون إعادة تقييم)
+# cache_resource: نفس المصفوفات بدون نسخ/unpickle في كل rerun
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_raw_scores(data_path, n, model_version):
+    return load_detector().raw_scores(load_data(n))
+
+# كل التنبيهات عند q كأعمدة (severity / hypothesis / port / evidence) بعمليات numpy؛
+# تفاصيل التنبيه الواحد (dict) ما تنبني إلا للتنبيه المختار
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_alert_batch(data_path, n, model_version, q_):
+    detector_ = load_detector()
+    result_ = detector_.apply_threshold(load_raw_scores(data_path, n, model_version), q=q_)
+    batch_ = build_alerts(load_data(n), result_, detector=detector_, evidence="attribution")
+    # يتسجّل في الـstore مرة وحدة لكل (ملف، حجم عينة، إصدار، q)
+    get_store().insert_alerts(batch_, model_version, df=load_data(n), detect_result=result_)
+    return batch_
+
+# العرض المجمّع: تنبيه واحد لكل سلوك (منفذ + cluster + الخصائص + نطاق الدرجة)
+# فوق نفس الـbatch، مع فرضية أشد عضو في كل مجموعة
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_alert_groups(data_path, n, model_version, q_):
+    batch_ = load_alert_batch(data_path, n, model_version, q_)
+    result_ = load_detector().apply_threshold(load_raw_scores(data_path, n, model_version), q=q_)
+    groups_ = aggregate_anomalies(load_data(n), result_, detector=load_detector(), batch=batch_)
+    heads = np.array([r[0] for r in groups_["representatives"]], dtype=np.int64)
+    groups_["hypothesis"] = batch_.hypothesis[np.searchsorted(batch_.indices, heads)]
+    return groups_
+
 if not os.path.exists(DATA_PATH):
     st.error(f"❌ Data file not found: {DATA_PATH}")
     st.stop()
@@ -274,10 +330,13 @@ df = load_data(sample_size)
 detector = load_detector()
 
 with st.spinner("Running anomaly detection..."):
-    result = detector.score(df, q=q)
+    raw = load_raw_scores(DATA_PATH, sample_size, detector.model_version)
+
+result = detector.apply_threshold(raw, q=q)
 
-anomaly_idx = result["is_anomaly"].nonzero()[0]
-total_alerts = len(anomaly_idx)
+show_run_metrics()
+
+total_alerts = int(result["is_anomaly"].sum())
 
 # ------------------------------------------------------------------
 # Dashboard
@@ -300,30 +359,120 @@ if total_alerts == 0:
     st.info("لا يوجد تنبيهات عند هذه الإعدادات.")
     st.stop()
 
-rows = []
-threshold_val = float(result["threshold"])
-
-for i in anomaly_idx[:max_alerts]:
-    score = float(result["if_scores"][i])
-    sev = "High" if score < threshold_val * 0.8 else "Medium" if score < threshold_val else "Low"
-    rows.append({"alert_id": int(i), "score": round(score, 4), "severity": sev})
+batch = load_alert_batch(DATA_PATH, sample_size, detector.model_version, q)
 
-alerts_df = pd.DataFrame(rows).sort_values("score").reset_index(drop=True)
+# فلترة + ترتيب + صفحات على مستوى المصفوفات (ما يُرسل للمتصفح إلا صفحة وحدة)
+f1, f2, f3 = st.columns(3)
+sev_filter = f1.multiselect("Severity", list(SEVERITY_NAMES[::-1]))
+hyp_filter = f2.multiselect("Hypothesis", list(HYPOTHESIS_TYPES))
+port_filter = f3.text_input("Destination Port", placeholder="80, 443")
 
-selected_id = st.selectbox(
-    "اختر تنبيه",
-    alerts_df["alert_id"].tolist(),
-    format_func=lambda x: f"Alert #{x}",
+s1, s2 = st.columns([0.7, 0.3])
+sort_by = s1.selectbox(
+    "ترتيب حسب",
+    SORT_KEYS,
+    format_func=lambda k: {"score": "Score", "severity": "Severity", "port": "Port", "alert_id": "Alert ID"}[k],
 )
+descending = s2.checkbox("تنازلي", value=sort_by == "severity")
+
+ports = None
+if port_filter.strip():
+    try:
+        ports = [int(p) for p in port_filter.replace(",", " ").split()]
+    except ValueError:
+        st.warning("⚠️ Destination Port: أرقام فقط (مثال: 80, 443)")
+
+grouped = st.toggle("تجميع التنبيهات المتشابهة", value=False, help="تنبيه واحد لكل مجموعة تنبيهات متشابهة")
+
+if grouped:
+    groups = load_alert_groups(DATA_PATH, sample_size, detector.model_version, q)
+    keep = np.ones(len(groups), dtype=bool)
+    if sev_filter:
+        keep &= groups["severity"].isin(sev_filter).to_numpy()
+    if hyp_filter:
+        keep &= groups["hypothesis"].isin(hyp_filter).to_numpy()
+    if ports is not None:
+        keep &= groups["destination_port"].isin(ports).to_numpy()
+    sort_col = {"score": "score_min", "severity": "severity", "port": "destination_port", "alert_id": "first_index"}[sort_by]
+    view = groups[keep]
+    if sort_by == "severity":
+        view = view.assign(_rank=view["severity"].map({n: i for i, n in enumerate(SEVERITY_NAMES)}))
+        sort_col = "_rank"
+    view = view.sort_values([sort_col, "score_min"], ascending=[not descending, True], kind="stable")
+    n_matching = len(view)
+else:
+    order, n_matching = batch.query(
+        severity=sev_filter or None,
+        hypothesis=hyp_filter or None,
+        ports=ports,
+        sort_by=sort_by,
+        descending=descending,
+        limit=None,
+    )
+n_pages = max(1, -(-n_matching // page_size))
+page = st.number_input(f"الصفحة (من {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1)
+page_slice = slice((int(page) - 1) * page_size, int(page) * page_size)
+if grouped:
+    st.caption(f"{n_matching:,} مجموعة مطابقة من {len(groups):,} ({len(batch):,} تنبيه)")
+else:
+    positions = order[page_slice]
+    st.caption(f"{n_matching:,} تنبيه مطابق من {len(batch):,}")
+
+if n_matching == 0:
+    st.info("لا يوجد تنبيهات تطابق الفلاتر.")
+    st.markdown('</div>', unsafe_allow_html=True)
+    st.stop()
+
+if grouped:
+    page_groups = view.iloc[page_slice]
+    alerts_df = pd.DataFrame({
+        "group_id": page_groups["group_id"],
+        "count": page_groups["count"],
+        "score_min": page_groups["score_min"].round(4),
+        "score_max": page_groups["score_max"].round(4),
+        "severity": page_groups["severity"],
+        "hypothesis": page_groups["hypothesis"],
+        "port": page_groups["destination_port"],
+        "cluster": page_groups["cluster"],
+        "top_features": [", ".join(f) for f in page_groups["top_features"]],
+    })
+    selected_id = st.selectbox(
+        "اختر مجموعة",
+        alerts_df["group_id"].tolist(),
+        format_func=lambda x: f"Group #{x} ({int(groups.at[x, 'count']):,} alerts)",
+    )
+else:
+    alerts_df = batch.to_frame(positions)
+    alerts_df["score"] = alerts_df["score"].round(4)
+
+    selected_id = st.selectbox(
+        "اختر تنبيه",
+        alerts_df["alert_id"].tolist(),
+        format_func=lambda x: f"Alert #{x}",
+    )
 
 st.dataframe(alerts_df, use_container_width=True, hide_index=True)
 st.markdown('</div>', unsafe_allow_html=True)
 
 # ------------------------------------------------------------------
-# Build alert + assistant baseline
+# Build alert + assistant baseline (المختار فقط، ومحفوظ في session_state)
 # ------------------------------------------------------------------
-alert = build_alert(df, result, int(selected_id))
-assist = explain_alert(alert)
+MAX_ALERT_DETAILS = 256
+
+details = st.session_state.setdefault("alert_details", {})
+detail_key = (DATA_PATH, sample_size, detector.model_version, q, "group" if grouped else "alert", int(selected_id))
+if detail_key not in details:
+    if grouped:
+        # تنبيه المجموعة من أشد عضو فيها + قسم "aggregation" (العدد، نطاق الدرجة، ...)
+        alert_ = build_group_alerts(df, result, groups.iloc[[int(selected_id)]], batch=batch)[0]
+    else:
+        alert_ = batch.get(int(selected_id))
+    details[detail_key] = {"alert": alert_, "assist": explain_alert(alert_)}
+    while len(details) > MAX_ALERT_DETAILS:
+        details.pop(next(iter(details)))
+
+alert = details[detail_key]["alert"]
+assist = details[detail_key]["assist"]
 
 # ------------------------------------------------------------------
 # Hypothesis (robust normalization)
@@ -412,6 +561,15 @@ st.success(f"✅ Why this hypothesis?\n\n{hypo['why']}")
 st.markdown("### 🔎 Evidence (Top Features)")
 st.write(", ".join(alert["evidence"]["top_features"]))
 
+aggregation = alert.get("aggregation")
+if aggregation:
+    st.caption(
+        f"🗂️ مجموعة #{aggregation['group_id']}: {aggregation['count']:,} تنبيه متشابه "
+        f"(Port {aggregation['destination_port']}, Cluster {aggregation['cluster']}, "
+        f"Score {aggregation['score_range'][0]:.4f} → {aggregation['score_range'][1]:.4f}, "
+        f"Rows {aggregation['first_index']}–{aggregation['last_index']})"
+    )
+
 st.markdown("---")
 
 # ------------------------------------------------------------------
@@ -440,11 +598,10 @@ with tab1:
 
     if enable_ai:
         try:
-            api_key = os.getenv("OPENAI_API_KEY", "").strip()
-            if not api_key or not OPENAI_AVAILABLE:
-                raise RuntimeError("Chat AI غير متاح (لا يوجد مفتاح أو مكتبة).")
-
-            client = OpenAI(api_key=api_key)
+            # الرد يُحفظ حسب توقيع التنبيه، فإعادة التشغيل أو تنبيه مشابه لا يستدعي الـAPI
+            signature = alert_signature(alert, hypo.get("label"), model_name, PROMPT_VERSION)
+            if aggregation:
+                signature["aggregated"] = True
 
             prompt = f"""
 أنت مساعد محلل SOC.
@@ -463,16 +620,24 @@ Hypothesis:
 
 Evidence (Top Features):
 {json.dumps(alert.get("evidence", {}), ensure_ascii=False)}
+"""
+            if aggregation:
+                # بدون العدد/المنفذ: الرد يُحفظ حسب التوقيع ويُعاد لمجموعات مشابهة
+                prompt += """
+Aggregation:
+هذا التنبيه يمثل مجموعة تدفقات متشابهة (نفس المنفذ والـcluster والخصائص)، أي سلوك متكرر وليس حدثًا منفردًا.
 """
 
-            resp = client.chat.completions.create(
-                model=model_name,
+            out = cached_completion(
                 messages=[{"role": "user", "content": prompt}],
+                model=model_name,
+                signature=signature,
                 temperature=0.25,
+                client=get_client(),
             )
 
-            st.caption("Source: Chat AI")
-            st.write(resp.choices[0].message.content)
+            st.caption("Source: Chat AI (cached)" if out["cached"] else "Source: Chat AI")
+            st.write(out["text"])
 
         except Exception:
             # IMPORTANT: do not break app if quota/429 happens
@@ -496,12 +661,24 @@ with tab2:
 
         payload = build_incident_payload(alert, hypo, None)
 
-        filename = f"incident_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+        # معرّف فريد (وقت + لاحقة عشوائية) حتى لا تتصادم تقارير بنفس الثانية
+        incident_id = new_incident_id()
+        payload["incident_id"] = incident_id
+        filename = f"incident_{incident_id}.json"
         path = os.path.join(out_dir, filename)
 
         # 1) حفظ داخل المشروع
-        with open(path, "w", encoding="utf-8") as f:
+        with open(path, "x", encoding="utf-8") as f:
             json.dump(payload, f, ensure_ascii=False, indent=2)
+        get_store().insert_incident(payload, path=path, model_version=detector.model_version)
+
+        if log_action is not None:
+            log_action({
+                "action": "create_incident_report",
+                "status": "created",
+                "incident_id": incident_id,
+                "path": path,
+            })
 
         st.success(f"✅ تم حفظ التقرير داخل المشروع: {path}")
 
@@ -525,4 +702,7 @@ limit: 1000 req/min
 notes: review with SOC analyst before applying
 """,
                 language="yaml",
-            )
\ No newline at end of file
+            )
+
+show_run_metrics()
+metrics.write_prometheus()
@@ -0,0 +1,7 @@
+"""
+Benchmark suite: synthetic CICIDS-shaped flows + timing runner.
+
+    python -m benchmarks run --sizes 1000 10000 100000
+    python -m benchmarks serve --concurrency 1 8 64 256
+    python -m benchmarks compare benchmarks/results/baseline.json
+"""
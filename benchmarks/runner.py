@@ -0,0 +1,242 @@
+"""
+Repeatable benchmarks for the detection pipeline.
+
+Batch stages (Detector._prepare, Detector.score, build_alerts) are timed on
+whole synthetic batches; per-alert stages (build_alert, explain_alert,
+infer_attack_hypothesis, LogProcessor.extract_features) are timed over a
+fixed number of calls per size; LogProcessor.extract_many parses one log
+line per row. Each case reports min / median seconds and
+items per second, and results are written as JSON so a later run can be
+compared against a saved baseline.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.detect import Detector
+from pipeline.alerts import build_alert, build_alerts
+from pipeline.hypothesis import infer_attack_hypothesis
+from pipeline.llm_assistant import explain_alert
+from pipeline.ingest import LogProcessor
+
+from benchmarks.synthetic import generate_flows
+
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# per-alert stages are timed over at most this many calls per size
+MAX_CALLS = 500
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _time(fn, repeat: int) -> list:
+    fn()  # warm-up (lazy loads, caches)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _record(name: str, rows: int, items: int, times: list) -> dict:
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "rows": rows,
+        "items": items,
+        "repeat": len(times),
+        "min_s": min(times),
+        "median_s": median,
+        "items_per_s": items / median if median > 0 else None,
+    }
+
+
+def _log_lines(df, n: int) -> list:
+    cols = ["Destination Port", "Flow Duration", "Total Fwd Packets", "Total Backward Packets"]
+    vals = df[cols].head(n).to_numpy(dtype=np.int64)
+    return [f"ALERT flow PORT:{p} DUR:{d} FWD:{f} BACK:{b}" for p, d, f, b in vals]
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat: int = 5, seed: int = 0, q: float = 0.01) -> dict:
+    detector = Detector()
+    processor = LogProcessor(detector.feature_columns)
+    results = []
+
+    for n in sizes:
+        df = generate_flows(n, seed=seed)
+        print(f"▶ rows={n:,}")
+
+        results.append(_record("Detector._prepare", n, n, _time(lambda: detector._prepare(df), repeat)))
+
+        result = detector.score(df, q=q)
+        results.append(_record("Detector.score", n, n, _time(lambda: detector.score(df, q=q), repeat)))
+
+        anomalies = np.flatnonzero(result["is_anomaly"])
+        results.append(_record(
+            "build_alerts", n, len(anomalies),
+            _time(lambda: build_alerts(df, result, anomalies, detector=detector), repeat),
+        ))
+
+        calls = anomalies[:MAX_CALLS]
+        results.append(_record(
+            "build_alert", n, len(calls),
+            _time(lambda: [build_alert(df, result, int(i)) for i in calls], repeat),
+        ))
+
+        alerts = [build_alert(df, result, int(i)) for i in calls]
+        results.append(_record(
+            "explain_alert", n, len(alerts),
+            _time(lambda: [explain_alert(a) for a in alerts], repeat),
+        ))
+
+        evidence = [(a["evidence"]["top_features"], a["ml"]["severity"]) for a in alerts]
+        results.append(_record(
+            "infer_attack_hypothesis", n, len(evidence),
+            _time(lambda: [infer_attack_hypothesis(f, s) for f, s in evidence], repeat),
+        ))
+
+        lines = _log_lines(df, MAX_CALLS)
+        results.append(_record(
+            "LogProcessor.extract_features", n, len(lines),
+            _time(lambda: [processor.extract_features(line) for line in lines], repeat),
+        ))
+
+        all_lines = _log_lines(df, n)
+        results.append(_record(
+            "LogProcessor.extract_many", n, len(all_lines),
+            _time(lambda: processor.extract_many(all_lines), repeat),
+        ))
+
+        for r in results[-8:]:
+            rate = f"{r['items_per_s']:,.0f}/s" if r["items_per_s"] else "-"
+            print(f"  {r['name']:<32} median={r['median_s'] * 1e3:9.2f} ms  {rate}")
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model_version": detector.model_version,
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def save_results(results: dict, path: str) -> str:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.15) -> list:
+    """
+    Matches cases by (name, rows) and flags the ones whose median time grew
+    by more than `tolerance` (0.15 = 15%) over the baseline.
+    """
+    base = {(r["name"], r["rows"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = base.get((r["name"], r["rows"]))
+        if b is None or not b["median_s"]:
+            continue
+        ratio = r["median_s"] / b["median_s"]
+        rows.append({
+            "name": r["name"],
+            "rows": r["rows"],
+            "baseline_s": b["median_s"],
+            "current_s": r["median_s"],
+            "ratio": ratio,
+            "regression": ratio > 1.0 + tolerance,
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="run the benchmarks and write a JSON results file")
+    run.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--out", default=os.path.join(RESULTS_DIR, "latest.json"))
+
+    serve = sub.add_parser("serve", help="latency vs throughput of the scoring service")
+    serve.add_argument("--flows", type=int, default=20_000)
+    serve.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 256])
+    serve.add_argument("--window", type=int, default=1, help="flows in flight per connection")
+    serve.add_argument("--max-batch", type=int, default=512)
+    serve.add_argument("--max-wait-ms", type=float, default=5.0)
+    serve.add_argument("--seed", type=int, default=0)
+    serve.add_argument("--out", default=os.path.join(RESULTS_DIR, "serve.json"))
+
+    cmp_ = sub.add_parser("compare", help="compare a results file against a baseline")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current", nargs="?", default=os.path.join(RESULTS_DIR, "latest.json"))
+    cmp_.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "run":
+        results = run_benchmarks(args.sizes, args.repeat, args.seed)
+        print(f"✅ Results saved: {save_results(results, args.out)}")
+        return 0
+
+    if args.cmd == "serve":
+        from benchmarks.serve_load import run_load
+
+        results = run_load(
+            args.flows, args.concurrency, args.window,
+            args.max_batch, args.max_wait_ms / 1e3, args.seed,
+        )
+        print(f"✅ Results saved: {save_results(results, args.out)}")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.tolerance)
+    for r in rows:
+        mark = "❌ REGRESSION" if r["regression"] else "✅"
+        print(
+            f"{mark:<14} {r['name']:<32} rows={r['rows']:<8} "
+            f"{r['baseline_s'] * 1e3:9.2f} ms -> {r['current_s'] * 1e3:9.2f} ms  (x{r['ratio']:.2f})"
+        )
+
+    regressions = [r for r in rows if r["regression"]]
+    print(f"\n{len(regressions)} regression(s) out of {len(rows)} cases (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
@@ -0,0 +1,119 @@
+"""
+Latency vs throughput of the scoring service (pipeline.server).
+
+Starts a ScoringServer in-process on a free port and drives its TCP line
+protocol with closed-loop clients: each connection keeps `window` flows in
+flight and sends the next one as soon as a result comes back. Raising the
+number of connections raises the offered load, so the table shows how p50 /
+p99 latency grow with throughput for a given max_batch / max_wait.
+"""
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+
+import numpy as np
+
+from pipeline.detect import Detector
+from pipeline.server import MicroBatcher, ScoringServer
+
+from benchmarks.synthetic import generate_flows
+
+DEFAULT_CONCURRENCY = (1, 8, 64, 256)
+
+
+async def _client(port: int, lines: list, window: int, latencies: list) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2 ** 20)
+    sent_at = {}
+    next_line = 0
+
+    def send(n):
+        nonlocal next_line
+        for _ in range(n):
+            if next_line >= len(lines):
+                return
+            sent_at[next_line] = time.perf_counter()
+            writer.write(lines[next_line])
+            next_line += 1
+
+    send(window)
+    await writer.drain()
+    for i in range(len(lines)):
+        await reader.readline()
+        latencies.append(time.perf_counter() - sent_at.pop(i))
+        send(1)
+    writer.close()
+
+
+async def _run_level(port: int, batcher: MicroBatcher, lines: list, concurrency: int, window: int) -> dict:
+    per_client = [lines[i::concurrency] for i in range(concurrency)]
+    latencies = []
+    batcher.reset_stats()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(port, chunk, window, latencies) for chunk in per_client if chunk))
+    elapsed = time.perf_counter() - t0
+
+    lat = np.array(latencies) * 1e3
+    server = batcher.stats()
+    return {
+        "concurrency": concurrency,
+        "window": window,
+        "flows": len(lat),
+        "flows_per_s": len(lat) / elapsed,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "mean_batch": server["mean_batch"],
+        "max_queue_depth": server["max_queue_depth"],
+    }
+
+
+async def _run(detector, n_flows, concurrency, window, max_batch, max_wait, seed) -> list:
+    flows = generate_flows(n_flows, seed=seed, dirty=False).drop(columns=["Label"])
+    records = flows.to_dict(orient="records")
+    lines = [(json.dumps(dict(r, id=i)) + "\n").encode("utf-8") for i, r in enumerate(records)]
+
+    batcher = MicroBatcher(
+        detector, max_batch=max_batch, max_wait=max_wait,
+        max_queue=max(8192, max(concurrency) * window), overflow="block",
+    )
+    server = ScoringServer(batcher, http_port=None, tcp_port=0)
+    await server.start()
+    try:
+        port = server.ports["tcp"]
+        # warm-up: lazy model loading, first allocations
+        await _run_level(port, batcher, lines[:max_batch], 1, max_batch)
+        return [await _run_level(port, batcher, lines, c, window) for c in concurrency]
+    finally:
+        await server.close()
+
+
+def run_load(
+    n_flows: int = 20_000,
+    concurrency=DEFAULT_CONCURRENCY,
+    window: int = 1,
+    max_batch: int = 512,
+    max_wait: float = 0.005,
+    seed: int = 0,
+) -> dict:
+    detector = Detector()
+    levels = asyncio.run(_run(detector, n_flows, concurrency, window, max_batch, max_wait, seed))
+
+    print(f"▶ max_batch={max_batch} max_wait={max_wait * 1e3:g} ms window={window}")
+    for r in levels:
+        print(
+            f"  conn={r['concurrency']:<5} {r['flows_per_s']:>10,.0f} flows/s  "
+            f"p50={r['p50_ms']:8.2f} ms  p99={r['p99_ms']:8.2f} ms  batch={r['mean_batch']:7.1f}"
+        )
+
+    return {
+        "meta": {
+            "model_version": detector.model_version,
+            "n_flows": n_flows,
+            "max_batch": max_batch,
+            "max_wait_ms": max_wait * 1e3,
+            "seed": seed,
+        },
+        "levels": levels,
+    }
@@ -0,0 +1,249 @@
+"""
+Synthetic CICIDS-shaped flow generator.
+
+The real CICIDS2017 CSVs are not in the repo, so benchmarks run on flows
+generated here: the 78 columns of models/feature_columns.json, with
+internally consistent counts / lengths / rates, heavy-tailed durations and
+packet counts, and the dirt of the real exports (Infinity and NaN in the
+rate columns when the duration is 0, negative header lengths, -1 window
+sizes). A small share of DoS-like and scan-like rows is mixed in.
+"""
+from __future__ import annotations
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATS_PATH = os.path.join(BASE_DIR, "models", "feature_columns.json")
+
+COMMON_PORTS = np.array([80, 443, 53, 22, 21, 8080, 123, 137, 389, 3268, 445, 139])
+COMMON_PORT_P = np.array([30, 30, 20, 3, 1, 3, 3, 2, 2, 2, 2, 2], dtype=float)
+
+
+def _spread(rng, n, mean, scale):
+    """(min, max, std) around a per-flow mean."""
+    lo = mean * rng.uniform(0.0, 1.0, n)
+    hi = mean + (mean - lo) * rng.uniform(0.5, 3.0, n)
+    std = (hi - lo) * rng.uniform(0.0, 0.4, n) * scale
+    return lo, hi, std
+
+
+def generate_flows(
+    n_rows: int,
+    seed: int = 0,
+    attack_fraction: float = 0.1,
+    dirty: bool = True,
+    feature_columns: list | None = None,
+) -> pd.DataFrame:
+    """
+    Returns a DataFrame with the feature columns (in order) plus `Label`.
+    """
+    if feature_columns is None:
+        with open(FEATS_PATH, "r", encoding="utf-8") as f:
+            feature_columns = json.load(f)
+
+    rng = np.random.default_rng(seed)
+    n = int(n_rows)
+
+    kind = rng.choice(3, size=n, p=[1 - attack_fraction, attack_fraction / 2, attack_fraction / 2])
+    dos, scan = kind == 1, kind == 2
+
+    # ports
+    port = np.where(
+        rng.random(n) < 0.85,
+        rng.choice(COMMON_PORTS, size=n, p=COMMON_PORT_P / COMMON_PORT_P.sum()),
+        rng.integers(1024, 65536, n),
+    )
+    port[dos] = 80
+    port[scan] = rng.integers(1, 1024, scan.sum())
+
+    # packet counts (heavy tail)
+    fwd = np.minimum(1 + np.floor(rng.pareto(1.3, n) * 2), 200_000)
+    bwd = np.floor(fwd * rng.uniform(0.0, 1.5, n))
+    fwd[scan] = rng.integers(1, 3, scan.sum())
+    bwd[scan] = rng.integers(0, 2, scan.sum())
+    fwd[dos] = rng.integers(3, 12, dos.sum())
+    bwd[dos] = rng.integers(0, 8, dos.sum())
+    total = fwd + bwd
+
+    # duration in microseconds (lognormal, some zero-length flows)
+    duration = np.floor(rng.lognormal(10, 3, n))
+    duration[scan] = np.floor(rng.lognormal(3, 1, scan.sum()))
+    duration[dos] = np.floor(rng.lognormal(14, 1.5, dos.sum()))
+    duration = np.minimum(duration, 1.2e8)
+    duration[rng.random(n) < 0.005] = 0
+
+    # packet lengths
+    fwd_mean = np.minimum(rng.lognormal(4, 1.2, n), 1460)
+    fwd_mean[rng.random(n) < 0.2] = 0
+    fwd_mean[scan] = 0
+    bwd_mean = np.minimum(rng.lognormal(5, 1.5, n), 1460) * (bwd > 0)
+    fwd_min, fwd_max, fwd_std = _spread(rng, n, fwd_mean, 1.0)
+    bwd_min, bwd_max, bwd_std = _spread(rng, n, bwd_mean, 1.0)
+    fwd_bytes = np.floor(fwd * fwd_mean)
+    bwd_bytes = np.floor(bwd * bwd_mean)
+    all_bytes = fwd_bytes + bwd_bytes
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        flow_bps = all_bytes / duration * 1e6
+        flow_pps = total / duration * 1e6
+        fwd_pps = fwd / duration * 1e6
+        bwd_pps = bwd / duration * 1e6
+
+    # inter-arrival times
+    iat_mean = duration / np.maximum(total - 1, 1)
+    iat_std = iat_mean * rng.uniform(0.0, 2.0, n)
+    iat_max = np.minimum(duration, iat_mean + 3 * iat_std)
+    iat_min = iat_mean * rng.uniform(0.0, 0.2, n)
+
+    fwd_iat_total = np.where(fwd > 1, duration * rng.uniform(0.5, 1.0, n), 0)
+    fwd_iat_mean = fwd_iat_total / np.maximum(fwd - 1, 1)
+    _, fwd_iat_max, fwd_iat_std = _spread(rng, n, fwd_iat_mean, 1.0)
+    fwd_iat_min = fwd_iat_mean * rng.uniform(0.0, 0.3, n)
+
+    bwd_iat_total = np.where(bwd > 1, duration * rng.uniform(0.3, 1.0, n), 0)
+    bwd_iat_mean = bwd_iat_total / np.maximum(bwd - 1, 1)
+    _, bwd_iat_max, bwd_iat_std = _spread(rng, n, bwd_iat_mean, 1.0)
+    bwd_iat_min = bwd_iat_mean * rng.uniform(0.0, 0.3, n)
+
+    # headers, flags, windows
+    seg = rng.choice([20, 32, 40], size=n, p=[0.6, 0.3, 0.1])
+    fwd_hdr = fwd * seg
+    bwd_hdr = bwd * seg
+    if dirty:
+        neg = rng.random(n) < 0.001
+        fwd_hdr[neg] = -rng.integers(1, 2 ** 31, neg.sum())
+
+    def flag(p):
+        return (rng.random(n) < p).astype(float)
+
+    syn = flag(0.05)
+    syn[scan] = 1
+    ack = flag(0.4)
+    ack[dos] = 1
+
+    init_fwd = rng.choice([-1, 256, 8192, 29200, 65535], size=n, p=[0.3, 0.1, 0.3, 0.2, 0.1])
+    init_bwd = rng.choice([-1, 0, 235, 28960, 65160], size=n, p=[0.5, 0.1, 0.1, 0.2, 0.1])
+
+    # packet-level aggregates
+    pkt_min = np.where(bwd > 0, np.minimum(fwd_min, bwd_min), fwd_min)
+    pkt_max = np.maximum(fwd_max, bwd_max)
+    pkt_mean = np.where(total > 0, all_bytes / np.maximum(total, 1), 0)
+    pkt_std = (pkt_max - pkt_min) * rng.uniform(0.0, 0.4, n)
+
+    # active / idle (mostly zero, long-lived flows only)
+    long_lived = rng.random(n) < 0.1
+    active_mean = np.where(long_lived, rng.lognormal(11, 2, n), 0)
+    active_min, active_max, active_std = _spread(rng, n, active_mean, 1.0)
+    idle_mean = np.where(long_lived, rng.lognormal(16, 1, n), 0)
+    idle_min, idle_max, idle_std = _spread(rng, n, idle_mean, 0.2)
+
+    zeros = np.zeros(n)
+    cols = {
+        "Destination Port": port,
+        "Flow Duration": duration,
+        "Total Fwd Packets": fwd,
+        "Total Backward Packets": bwd,
+        "Total Length of Fwd Packets": fwd_bytes,
+        "Total Length of Bwd Packets": bwd_bytes,
+        "Fwd Packet Length Max": fwd_max,
+        "Fwd Packet Length Min": fwd_min,
+        "Fwd Packet Length Mean": fwd_mean,
+        "Fwd Packet Length Std": fwd_std,
+        "Bwd Packet Length Max": bwd_max,
+        "Bwd Packet Length Min": bwd_min,
+        "Bwd Packet Length Mean": bwd_mean,
+        "Bwd Packet Length Std": bwd_std,
+        "Flow Bytes/s": flow_bps,
+        "Flow Packets/s": flow_pps,
+        "Flow IAT Mean": iat_mean,
+        "Flow IAT Std": iat_std,
+        "Flow IAT Max": iat_max,
+        "Flow IAT Min": iat_min,
+        "Fwd IAT Total": fwd_iat_total,
+        "Fwd IAT Mean": fwd_iat_mean,
+        "Fwd IAT Std": fwd_iat_std,
+        "Fwd IAT Max": fwd_iat_max,
+        "Fwd IAT Min": fwd_iat_min,
+        "Bwd IAT Total": bwd_iat_total,
+        "Bwd IAT Mean": bwd_iat_mean,
+        "Bwd IAT Std": bwd_iat_std,
+        "Bwd IAT Max": bwd_iat_max,
+        "Bwd IAT Min": bwd_iat_min,
+        "Fwd PSH Flags": flag(0.05),
+        "Bwd PSH Flags": zeros,
+        "Fwd URG Flags": flag(0.0005),
+        "Bwd URG Flags": zeros,
+        "Fwd Header Length": fwd_hdr,
+        "Bwd Header Length": bwd_hdr,
+        "Fwd Packets/s": fwd_pps,
+        "Bwd Packets/s": bwd_pps,
+        "Min Packet Length": pkt_min,
+        "Max Packet Length": pkt_max,
+        "Packet Length Mean": pkt_mean,
+        "Packet Length Std": pkt_std,
+        "Packet Length Variance": pkt_std ** 2,
+        "FIN Flag Count": flag(0.03),
+        "SYN Flag Count": syn,
+        "RST Flag Count": flag(0.001),
+        "PSH Flag Count": flag(0.3),
+        "ACK Flag Count": ack,
+        "URG Flag Count": flag(0.1),
+        "CWE Flag Count": flag(0.0005),
+        "ECE Flag Count": flag(0.001),
+        "Down/Up Ratio": np.floor(bwd / np.maximum(fwd, 1)),
+        "Average Packet Size": pkt_mean * rng.uniform(1.0, 1.3, n),
+        "Avg Fwd Segment Size": fwd_mean,
+        "Avg Bwd Segment Size": bwd_mean,
+        "Fwd Header Length.1": fwd_hdr,
+        "Fwd Avg Bytes/Bulk": zeros,
+        "Fwd Avg Packets/Bulk": zeros,
+        "Fwd Avg Bulk Rate": zeros,
+        "Bwd Avg Bytes/Bulk": zeros,
+        "Bwd Avg Packets/Bulk": zeros,
+        "Bwd Avg Bulk Rate": zeros,
+        "Subflow Fwd Packets": fwd,
+        "Subflow Fwd Bytes": fwd_bytes,
+        "Subflow Bwd Packets": bwd,
+        "Subflow Bwd Bytes": bwd_bytes,
+        "Init_Win_bytes_forward": init_fwd,
+        "Init_Win_bytes_backward": init_bwd,
+        "act_data_pkt_fwd": np.floor(fwd * (fwd_mean > 0) * rng.uniform(0.0, 1.0, n)),
+        "min_seg_size_forward": seg,
+        "Active Mean": active_mean,
+        "Active Std": active_std,
+        "Active Max": active_max,
+        "Active Min": active_min,
+        "Idle Mean": idle_mean,
+        "Idle Std": idle_std,
+        "Idle Max": idle_max,
+        "Idle Min": idle_min,
+    }
+
+    # unknown columns (if feature_columns ever grows): generic heavy tail
+    data = {
+        c: cols[c] if c in cols else np.floor(rng.lognormal(2, 2, n))
+        for c in feature_columns
+    }
+    df = pd.DataFrame(data, columns=list(feature_columns))
+
+    if not dirty:
+        df = df.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+    df["Label"] = np.array(["BENIGN", "DoS Hulk", "PortScan"], dtype=object)[kind]
+    return df
+
+
+def write_csv(path: str, n_rows: int, seed: int = 0, chunksize: int = 200_000, **kwargs) -> str:
+    """
+    Writes a synthetic cleaned-style CSV in chunks (bounded memory).
+    """
+    header = True
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        chunk = generate_flows(min(chunksize, n_rows - start), seed=seed + i, **kwargs)
+        chunk.to_csv(path, mode="w" if header else "a", header=header, index=False)
+        header = False
+    return path
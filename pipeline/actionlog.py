@@ -0,0 +1,360 @@
+"""
+Buffered, rotating JSONL action log.
+
+`ActionLogWriter.write` only enqueues; a background thread drains the queue
+in batches, appends each batch with one write (under an advisory file lock
+when available) and fsyncs according to the policy:
+
+- "always":   after every batch
+- "interval": at most every `fsync_interval` seconds (default)
+- "never":    leave it to the OS
+
+The live file is rotated when it grows past `max_bytes` or gets older than
+`max_age` seconds; rotated segments are named by their start time and can be
+gzip-compressed.
+
+Every segment has a small sidecar index (`<segment>.idx`, one
+"<epoch> <byte offset>" line per batch), so `read_actions(start, end)` only
+opens the segments that overlap the range and seeks straight to the first
+relevant batch. Offsets are in uncompressed bytes, which is also what
+`gzip.open(...).seek` expects.
+"""
+from __future__ import annotations
+
+import os
+import glob
+import gzip
+import json
+import time
+import uuid
+import queue
+import bisect
+import shutil
+import threading
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+_STOP = object()
+
+
+def new_incident_id() -> str:
+    """Time-sortable and collision-free (random suffix), e.g. INC-20261018-103653-1f3a9c2e."""
+    return f"INC-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def _to_epoch(value) -> float:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _first_logged_at(path: str, default: float) -> float:
+    """logged_at of the first record in `path` (default if unreadable)."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    ts = _to_epoch(json.loads(line).get("logged_at"))
+                except (ValueError, AttributeError):
+                    return default
+                return default if ts is None else min(ts, default)
+    return default
+
+
+def _index_path(segment: str) -> str:
+    if segment.endswith(".gz"):
+        segment = segment[:-3]
+    return segment + ".idx"
+
+
+class ActionLogWriter:
+    """
+    Background writer for one JSONL log. Thread-safe; call `close()` (or use
+    it as a context manager) to flush and stop the thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.5,
+        max_batch: int = 1_000,
+        fsync: str = "interval",
+        fsync_interval: float = 5.0,
+        max_bytes: int = 64 * 2 ** 20,
+        max_age: float | None = 24 * 3600,
+        compress: bool = True,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync!r} (expected one of {FSYNC_POLICIES})")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._queue = queue.Queue()
+        self._last_fsync = time.monotonic()
+        self._opened_at = self._segment_start()
+        self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+        self._thread.start()
+
+    # --------------------------------------------------------------
+    # public API
+    # --------------------------------------------------------------
+    def write(self, payload: dict) -> None:
+        """
+        Serializes here, so a payload that is not JSON-serializable raises
+        in the caller instead of in the writer thread.
+        """
+        payload = dict(payload)
+        payload.setdefault("logged_at", datetime.utcnow().isoformat())
+        line = json.dumps(payload, ensure_ascii=False) + "\n"
+        self._queue.put((_to_epoch(payload["logged_at"]), line))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until everything written so far is on disk (and fsynced).
+        Returns False on timeout, or if the writer thread is no longer running.
+        """
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not done.wait(self.flush_interval):
+            if not self._thread.is_alive():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --------------------------------------------------------------
+    # writer thread
+    # --------------------------------------------------------------
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch, waiters = [], []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                try:
+                    self._maybe_rotate()
+                except Exception as e:
+                    print(f"⚠️ Action log rotation failed: {e}")
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write_batch(batch, force_sync=bool(waiters) or stop)
+                elif waiters or stop:
+                    self._sync_now()
+                self._maybe_rotate()
+            except Exception as e:
+                # keep the thread alive; the batch is lost but later ones are not
+                print(f"⚠️ Action log write failed ({len(batch)} records): {e}")
+            finally:
+                for w in waiters:
+                    w.set()
+
+    def _write_batch(self, batch: list, force_sync: bool) -> None:
+        data = "".join(line for _, line in batch).encode("utf-8")
+        first_ts = min(ts for ts, _ in batch)
+
+        if self._opened_at is None or not os.path.exists(self.path):
+            self._opened_at = time.time()
+
+        with open(self.path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                if self._should_sync(force_sync):
+                    os.fsync(f.fileno())
+
+                # sidecar under the same lock, so it never lags the log
+                idx_path = _index_path(self.path)
+                with open(idx_path, "a", encoding="utf-8") as idx:
+                    if offset > 0 and idx.tell() == 0:
+                        # records written before the index existed (unbuffered
+                        # log_action): one batch starting at byte 0
+                        idx.write(f"{_first_logged_at(self.path, first_ts):.6f} 0\n")
+                    idx.write(f"{first_ts:.6f} {offset}\n")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _should_sync(self, force: bool) -> bool:
+        if self.fsync == "never" and not force:
+            return False
+        now = time.monotonic()
+        if force or self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            self._last_fsync = now
+            return True
+        return False
+
+    def _sync_now(self) -> None:
+        if os.path.exists(self.path):
+            with open(self.path, "ab") as f:
+                os.fsync(f.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _segment_start(self) -> float | None:
+        idx = _index_path(self.path)
+        if os.path.exists(idx):
+            with open(idx, "r", encoding="utf-8") as f:
+                first = f.readline().split()
+            if first:
+                return float(first[0])
+        return None
+
+    def _maybe_rotate(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        if self._opened_at is None:
+            self._opened_at = self._segment_start() or time.time()
+
+        too_big = self.max_bytes is not None and os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.max_age is not None and time.time() - self._opened_at >= self.max_age
+        if too_big or too_old:
+            self.rotate()
+
+    def rotate(self) -> str | None:
+        """Closes the live segment (renamed by its start time). Returns its path."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+
+        stamp = datetime.utcfromtimestamp(self._opened_at or time.time()).strftime("%Y%m%dT%H%M%S")
+        root, ext = os.path.splitext(self.path)
+        target = f"{root}.{stamp}{ext}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{root}.{stamp}-{n}{ext}"
+            n += 1
+
+        os.replace(self.path, target)
+        if os.path.exists(_index_path(self.path)):
+            os.replace(_index_path(self.path), _index_path(target))
+        self._opened_at = None
+
+        if self.compress:
+            with open(target, "rb") as src, gzip.open(target + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+            target += ".gz"
+        return target
+
+
+def list_segments(path: str) -> list:
+    """Rotated segments (oldest first) followed by the live file."""
+    root, ext = os.path.splitext(path)
+    rotated = [
+        p for p in glob.glob(f"{glob.escape(root)}.*{ext}*")
+        if p.endswith(ext) or p.endswith(ext + ".gz")
+    ]
+    rotated.sort(key=lambda p: ((_read_index(p)[0] or [float("inf")])[0], p))
+    if os.path.exists(path):
+        rotated.append(path)
+    return rotated
+
+
+def _read_index(segment: str) -> tuple:
+    times, offsets = [], []
+    idx = _index_path(segment)
+    if os.path.exists(idx):
+        with open(idx, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    times.append(float(parts[0]))
+                    offsets.append(int(parts[1]))
+    return times, offsets
+
+
+def read_actions(path: str, start=None, end=None) -> list:
+    """
+    Actions logged between `start` and `end` (datetime, ISO string or epoch;
+    either may be None), oldest first.
+    """
+    t0 = _to_epoch(start) if start is not None else float("-inf")
+    t1 = _to_epoch(end) if end is not None else float("inf")
+
+    segments = list_segments(path)
+    out = []
+    for i, segment in enumerate(segments):
+        times, offsets = _read_index(segment)
+        if offsets and offsets[0] > 0:
+            # unindexed records in front of the first batch: always scanned
+            times.insert(0, float("-inf"))
+            offsets.insert(0, 0)
+
+        if times:
+            # the next segment's first batch bounds this one from above
+            next_times = _read_index(segments[i + 1])[0] if i + 1 < len(segments) else []
+            if times[0] > t1 or (next_times and next_times[0] < t0):
+                continue
+            lo = max(0, bisect.bisect_right(times, t0) - 1)
+            hi = bisect.bisect_right(times, t1)
+            begin = offsets[lo]
+            stop = offsets[hi] if hi < len(offsets) else None
+        else:
+            begin, stop = 0, None  # no index: scan the segment
+
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rb") as f:
+            f.seek(begin)
+            data = f.read() if stop is None else f.read(stop - begin)
+
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            ts = _to_epoch(record.get("logged_at"))
+            if ts is not None and t0 <= ts <= t1:
+                out.append(record)
+    return out
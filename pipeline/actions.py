@@ -1,19 +1,53 @@
 import os
 import json
+import atexit
+import threading
 from datetime import datetime
 
+from pipeline.actionlog import ActionLogWriter, new_incident_id, read_actions
+from pipeline.store import get_store
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ACTIONS_DIR = os.path.join(BASE_DIR, "data", "actions")
 os.makedirs(ACTIONS_DIR, exist_ok=True)
 
 ACTIONS_LOG = os.path.join(ACTIONS_DIR, "actions_log.jsonl")
 
+# fsync policy of the action log: "always" | "interval" | "never"
+ACTIONS_FSYNC = os.getenv("SIYAJ_ACTIONS_FSYNC", "interval")
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_writer() -> ActionLogWriter:
+    """The shared background writer of ACTIONS_LOG (started on first use)."""
+    global _WRITER
+    if _WRITER is None:
+        with _WRITER_LOCK:
+            if _WRITER is None:
+                _WRITER = ActionLogWriter(ACTIONS_LOG, fsync=ACTIONS_FSYNC)
+                atexit.register(_WRITER.close)
+    return _WRITER
+
 
 def log_action(payload: dict) -> None:
     payload = dict(payload)
     payload["logged_at"] = datetime.utcnow().isoformat()
-    with open(ACTIONS_LOG, "a", encoding="utf-8") as f:
-        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    get_writer().write(payload)
+    # same record in the store's actions table (a later migrate_json skips it)
+    get_store().insert_actions([payload])
+
+
+def flush_actions() -> None:
+    get_writer().flush()
+
+
+def actions_between(start=None, end=None) -> list:
+    """Logged actions in [start, end] (datetime / ISO string / epoch)."""
+    if _WRITER is not None:
+        _WRITER.flush()
+    return read_actions(ACTIONS_LOG, start, end)
 
 
 def simulate_action(action_name: str, context: dict) -> dict:
@@ -28,15 +62,23 @@ def simulate_action(action_name: str, context: dict) -> dict:
 
 
 def create_incident_report(alert: dict, assistant: dict) -> str:
-    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    path = os.path.join(ACTIONS_DIR, f"incident_{ts}.json")
+    incident_id = new_incident_id()
+    path = os.path.join(ACTIONS_DIR, f"incident_{incident_id}.json")
     report = {
+        "incident_id": incident_id,
         "created_at": datetime.utcnow().isoformat(),
         "alert": alert,
         "assistant": assistant,
     }
-    with open(path, "w", encoding="utf-8") as f:
+    # "x": never overwrite another report
+    with open(path, "x", encoding="utf-8") as f:
         json.dump(report, f, ensure_ascii=False, indent=2)
+    get_store().insert_incident(report, path=path)
 
-    log_action({"action": "create_incident_report", "status": "created", "path": path})
+    log_action({
+        "action": "create_incident_report",
+        "status": "created",
+        "incident_id": incident_id,
+        "path": path,
+    })
     return path
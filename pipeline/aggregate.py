@@ -0,0 +1,175 @@
+"""
+Anomaly deduplication before enrichment.
+
+A scan or a DoS burst yields hundreds of near-identical anomalous rows.
+`aggregate_anomalies` groups them by signature:
+
+- destination port
+- KMeans cluster (-1 when unavailable)
+- top-feature set (the top-k evidence features, order ignored)
+- score band (the build_alert severity bands)
+
+and returns one row per group with counts, score range, first/last index
+and the most anomalous member rows. `build_group_alerts` then builds one
+alert per group, so hypothesis / explanation / LLM work scales with the
+number of distinct behaviours instead of the number of anomalous rows.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from pipeline.alerts import PORT_COLUMN, SEVERITY_NAMES, build_alerts
+from pipeline.metrics import inc, stage
+
+
+def aggregate_anomalies(
+    df: pd.DataFrame,
+    detect_result: dict,
+    indices=None,
+    detector=None,
+    k: int = 3,
+    evidence: str | None = None,
+    n_representatives: int = 3,
+    batch=None,
+) -> pd.DataFrame:
+    """
+    Groups anomalous rows (default: every anomaly) by signature.
+
+    k / evidence: as in build_alerts (evidence defaults to attribution when
+    a detector is given). batch: an AlertBatch already built over the rows
+    to group (e.g. the dashboard's cached one); its rows and evidence are
+    used instead of `indices`, `k` and `evidence`.
+
+    Returns a DataFrame sorted from most to least anomalous group:
+    group_id, destination_port, cluster, severity, top_features (tuple),
+    count, score_min, score_max, score_mean, first_index, last_index,
+    representatives (row indices, most anomalous first). `attrs` holds the
+    k and evidence the feature sets were taken with.
+    """
+    if batch is not None:
+        indices = batch.indices
+    elif indices is None:
+        indices = np.flatnonzero(detect_result["is_anomaly"])
+    indices = np.asarray(indices, dtype=np.int64)
+
+    with stage("alerts.aggregate", rows=len(indices)):
+        groups = _aggregate(df, detect_result, indices, detector, k, evidence, n_representatives, batch)
+
+    inc("alert_groups_total", len(groups))
+    return groups
+
+
+def _aggregate(df, detect_result, indices, detector, k, evidence, n_representatives, batch) -> pd.DataFrame:
+    columns = [
+        "group_id", "destination_port", "cluster", "severity", "top_features",
+        "count", "score_min", "score_max", "score_mean",
+        "first_index", "last_index", "representatives",
+    ]
+    if len(indices) == 0:
+        out = pd.DataFrame(columns=columns)
+        out.attrs.update(k=k, evidence=evidence)
+        return out
+
+    if batch is None:
+        batch = build_alerts(df, detect_result, indices, detector=detector, k=k, evidence=evidence)
+    scores = batch.scores
+    ports = batch.ports
+
+    clusters = detect_result.get("cluster")
+    if clusters is None:
+        clusters = np.full(len(indices), -1, dtype=np.int64)
+    else:
+        clusters = np.asarray(clusters, dtype=np.int64)[indices]
+
+    # unordered feature set: feature codes sorted within each row
+    names, codes = np.unique(batch.top_features, return_inverse=True)
+    codes = np.sort(codes.reshape(batch.top_features.shape), axis=1)
+
+    keys = np.column_stack([ports, clusters, batch.severity_code.astype(np.int64), codes])
+    _, group_of = np.unique(keys, axis=0, return_inverse=True)
+    group_of = group_of.ravel()
+
+    # members of each group, most anomalous first
+    order = np.lexsort((indices, scores, group_of))
+    starts = np.r_[0, np.flatnonzero(np.diff(group_of[order])) + 1]
+    counts = np.diff(np.r_[starts, len(order)])
+
+    sorted_scores = scores[order]
+    sorted_indices = indices[order]
+    head = order[starts]
+
+    out = pd.DataFrame({
+        "destination_port": ports[head],
+        "cluster": clusters[head],
+        "severity": SEVERITY_NAMES[batch.severity_code[head]],
+        "top_features": [tuple(names[c]) for c in codes[head]],
+        "count": counts,
+        "score_min": sorted_scores[starts],
+        "score_max": np.maximum.reduceat(sorted_scores, starts),
+        "score_mean": np.add.reduceat(sorted_scores, starts) / counts,
+        "first_index": np.minimum.reduceat(sorted_indices, starts),
+        "last_index": np.maximum.reduceat(sorted_indices, starts),
+        "representatives": [
+            sorted_indices[s:s + min(c, n_representatives)].tolist()
+            for s, c in zip(starts, counts)
+        ],
+    })
+
+    out = out.sort_values(["score_min", "first_index"], kind="stable").reset_index(drop=True)
+    out.insert(0, "group_id", np.arange(len(out)))
+    out = out[columns]
+    out.attrs.update(k=batch.top_features.shape[1], evidence=batch.evidence)
+    return out
+
+
+def build_group_alerts(
+    df: pd.DataFrame,
+    detect_result: dict,
+    groups: pd.DataFrame,
+    detector=None,
+    k: int | None = None,
+    evidence: str | None = None,
+    batch=None,
+) -> list:
+    """
+    One alert per group, built from its most anomalous row, with an extra
+    "aggregation" section describing the whole group.
+
+    batch: the AlertBatch the groups were aggregated from; the head alerts
+    are then taken from it instead of being rebuilt. Otherwise k / evidence
+    default to those the groups were built with (`groups.attrs`), so the
+    alert's evidence matches the group's feature set.
+    """
+    if len(groups) == 0:
+        return []
+
+    heads = np.array([r[0] for r in groups["representatives"]], dtype=np.int64)
+    if batch is not None:
+        head_alerts = [batch.get(int(i)) for i in heads]
+    else:
+        k = k if k is not None else groups.attrs.get("k", 3)
+        evidence = evidence if evidence is not None else groups.attrs.get("evidence")
+        built = build_alerts(df, detect_result, heads, detector=detector, k=k, evidence=evidence)
+        head_alerts = [built[pos] for pos in range(len(heads))]
+
+    alerts = []
+    for head_alert, g in zip(head_alerts, groups.itertuples(index=False)):
+        alert = dict(head_alert)
+        count = int(g.count)
+        if count > 1:
+            alert["summary"] = f"{alert['summary']} ({count} similar flows)"
+        alert["aggregation"] = {
+            "group_id": int(g.group_id),
+            "count": count,
+            "destination_port": int(g.destination_port),
+            "cluster": int(g.cluster),
+            "top_features": list(g.top_features),
+            "score_range": [float(g.score_min), float(g.score_max)],
+            "score_mean": float(g.score_mean),
+            "first_index": int(g.first_index),
+            "last_index": int(g.last_index),
+            "representatives": list(g.representatives),
+        }
+        alerts.append(alert)
+    return alerts
@@ -2,16 +2,27 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 
-from pipeline.hypothesis import infer_attack_hypothesis
+from pipeline.hypothesis import HYPOTHESIS_TYPES, hypothesis_codes, infer_attack_hypothesis
+from pipeline.attribution import attribute, top_k
+from pipeline.forest import CompiledForest
+from pipeline.metrics import inc, stage, timed
 
+EVIDENCE_KINDS = ("zscore", "attribution")
+SORT_KEYS = ("score", "severity", "port", "alert_id")
+PORT_COLUMN = "Destination Port"
 
+
+@timed("alerts.build_alert")
 def build_alert(
     df: pd.DataFrame,
     detect_result: dict,
     index: int,
+    detector=None,
 ) -> dict:
     """
     Builds a SOC-style alert from ML detection results.
+    With a detector, the top features are the row's Isolation Forest path
+    attribution (as in build_alerts); without one, the largest raw values.
     """
 
     score = float(detect_result["if_scores"][index])
@@ -24,25 +35,42 @@ def build_alert(
         else "Low"
     )
 
-    # نحدد الأعمدة الرقمية فقط
-    numeric_df = df.select_dtypes(include=[np.number])
-    row_numeric = numeric_df.iloc[index]
-
-    # أهم الخصائص المساهمة في الشذوذ
-    top_features = (
-        row_numeric.abs()
-        .sort_values(ascending=False)
-        .head(5)
-        .index
-        .tolist()
-    )
+    evidence = {}
+    if detector is not None:
+        values, columns = _attribution(df, np.array([index]), detector)
+        top = top_k(values, 5)[0]
+        top_features = [str(f) for f in columns[top]]
+        evidence = {
+            "method": "attribution",
+            "values": [round(float(v), 4) for v in values[0, top]],
+        }
+    else:
+        # نحدد الأعمدة الرقمية فقط
+        numeric_df = df.select_dtypes(include=[np.number])
+        row_numeric = numeric_df.iloc[index]
+
+        # أهم الخصائص المساهمة في الشذوذ
+        top_features = (
+            row_numeric.abs()
+            .sort_values(ascending=False)
+            .head(5)
+            .index
+            .tolist()
+        )
 
     # 🔍 Attack Hypothesis Layer
     hypothesis = infer_attack_hypothesis(top_features, severity)
 
+    port = None
+    if PORT_COLUMN in df.columns:
+        value = df[PORT_COLUMN].iloc[index]
+        port = int(value) if np.isfinite(value) else None
+
     alert = {
         "timestamp": datetime.utcnow().isoformat(),
         "source": "network_flow",
+        "row_index": int(index),
+        "dst_port": port,
         "summary": "Suspicious network behavior detected"
                    if is_anomaly else "Normal traffic pattern",
         "ml": {
@@ -53,9 +81,310 @@ def build_alert(
             "severity": severity,
         },
         "evidence": {
-            "top_features": top_features
+            "top_features": top_features,
+            **evidence,
         },
         "hypothesis": hypothesis
     }
 
+    inc("alerts_built_total", severity=severity)
     return alert
+
+
+SEVERITY_NAMES = np.array(["Low", "Medium", "High"], dtype=object)
+
+
+def severity_codes(scores: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Vectorized version of the build_alert severity rule
+    (0 = Low, 1 = Medium, 2 = High).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    codes = np.zeros(len(scores), dtype=np.int8)
+    codes[scores < threshold] = 1
+    codes[scores < threshold * 0.8] = 2
+    return codes
+
+
+class AlertBatch:
+    """
+    Column-oriented alerts for many anomalous rows.
+
+    Columns (index, score, severity, top features and their evidence values:
+    z-scores or path attribution) are plain arrays;
+    the build_alert-style dict of one alert is only built when asked for
+    (`batch[i]`), and then memoized.
+    """
+
+    def __init__(
+        self,
+        indices: np.ndarray,
+        scores: np.ndarray,
+        threshold: float,
+        is_anomaly: np.ndarray,
+        severity: np.ndarray,
+        top_features: np.ndarray,
+        top_values: np.ndarray,
+        timestamp: str,
+        evidence: str = "zscore",
+        ports: np.ndarray | None = None,
+    ):
+        self.indices = indices
+        self.scores = scores
+        self.threshold = threshold
+        self.is_anomaly = is_anomaly
+        self.severity_code = severity
+        self.top_features = top_features
+        self.top_values = top_values
+        self.timestamp = timestamp
+        self.evidence = evidence
+        # destination port per alert (-1 = unknown / no port column)
+        self.ports = ports if ports is not None else np.full(len(indices), -1, dtype=np.int64)
+        self._hypothesis_code = None
+        self._cache = {}
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def severity(self) -> np.ndarray:
+        return SEVERITY_NAMES[self.severity_code]
+
+    def __getitem__(self, i: int) -> dict:
+        i = int(i)
+        if i not in self._cache:
+            self._cache[i] = self._build(i)
+        return self._cache[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _build(self, i: int) -> dict:
+        severity = str(SEVERITY_NAMES[self.severity_code[i]])
+        is_anomaly = bool(self.is_anomaly[i])
+        top_features = [str(f) for f in self.top_features[i]]
+        port = int(self.ports[i])
+
+        return {
+            "timestamp": self.timestamp,
+            "source": "network_flow",
+            "row_index": int(self.indices[i]),
+            "dst_port": port if port >= 0 else None,
+            "summary": "Suspicious network behavior detected"
+                       if is_anomaly else "Normal traffic pattern",
+            "ml": {
+                "model": "Isolation Forest",
+                "score": float(self.scores[i]),
+                "threshold": self.threshold,
+                "decision": "anomaly" if is_anomaly else "normal",
+                "severity": severity,
+            },
+            "evidence": {
+                "top_features": top_features,
+                "method": self.evidence,
+                "values": [round(float(v), 4) for v in self.top_values[i]],
+            },
+            "hypothesis": infer_attack_hypothesis(top_features, severity),
+        }
+
+    def get(self, index: int) -> dict:
+        """Alert for a row index of the scored DataFrame."""
+        pos = np.flatnonzero(self.indices == index)
+        if len(pos) == 0:
+            raise KeyError(index)
+        return self[pos[0]]
+
+    @property
+    def hypothesis_code(self) -> np.ndarray:
+        if self._hypothesis_code is None:
+            self._hypothesis_code = hypothesis_codes(self.top_features)
+        return self._hypothesis_code
+
+    @property
+    def hypothesis(self) -> np.ndarray:
+        return HYPOTHESIS_TYPES[self.hypothesis_code]
+
+    def query(
+        self,
+        severity=None,
+        hypothesis=None,
+        ports=None,
+        sort_by: str = "score",
+        descending: bool = False,
+        offset: int = 0,
+        limit: int | None = 50,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Filter + sort + paginate without building any alert dict.
+
+        severity / hypothesis / ports: allowed values (names or port numbers),
+        None = no filter. sort_by: one of SORT_KEYS; ties are broken by score
+        (most anomalous first). Returns (positions of the page rows in the
+        batch, number of rows matching the filters).
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by!r} (expected one of {SORT_KEYS})")
+
+        keep = np.ones(len(self), dtype=bool)
+        if severity is not None:
+            keep &= np.isin(self.severity_code, _codes_of(SEVERITY_NAMES, severity))
+        if hypothesis is not None:
+            keep &= np.isin(self.hypothesis_code, _codes_of(HYPOTHESIS_TYPES, hypothesis))
+        if ports is not None:
+            keep &= np.isin(self.ports, np.asarray(list(ports), dtype=np.int64))
+        positions = np.flatnonzero(keep)
+
+        primary = {
+            "score": self.scores,
+            "severity": self.severity_code,
+            "port": self.ports,
+            "alert_id": self.indices,
+        }[sort_by][positions].astype(np.float64)
+        if descending:
+            primary = -primary
+        order = positions[np.lexsort((self.scores[positions], primary))]
+
+        stop = None if limit is None else offset + limit
+        return order[offset:stop], len(positions)
+
+    def to_frame(self, positions=None) -> pd.DataFrame:
+        """Table of the alerts at `positions` (default: all), in that order."""
+        if positions is None:
+            positions = np.arange(len(self))
+        return pd.DataFrame({
+            "alert_id": self.indices[positions],
+            "score": self.scores[positions],
+            "severity": SEVERITY_NAMES[self.severity_code[positions]],
+            "hypothesis": self.hypothesis[positions],
+            "port": self.ports[positions],
+            "top_features": [", ".join(f) for f in self.top_features[positions]],
+        })
+
+
+def _codes_of(names: np.ndarray, selected) -> np.ndarray:
+    return np.flatnonzero(np.isin(names, list(selected)))
+
+
+def _zscores(df: pd.DataFrame, rows: np.ndarray, detector=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Signed z matrix for the selected rows (callers rank by |z|). With a
+    detector, z comes from its training scaler; otherwise from the batch
+    mean/std of numeric columns.
+    """
+    if detector is not None:
+        columns = np.asarray(detector.feature_columns, dtype=object)
+        X = df.iloc[rows][detector.feature_columns].to_numpy(dtype=np.float64)
+        mean, scale = detector.scaler.mean_, detector.scaler.scale_
+    else:
+        numeric = df.select_dtypes(include=[np.number])
+        columns = np.asarray(numeric.columns, dtype=object)
+        full = numeric.to_numpy(dtype=np.float64)
+        full = np.where(np.isfinite(full), full, np.nan)
+        mean = np.nanmean(full, axis=0)
+        scale = np.nanstd(full, axis=0)
+        X = full[rows]
+
+    scale = np.where(scale > 0, scale, 1.0)
+    Z = (X - mean) / scale
+    # missing / infinite values carry no evidence
+    Z[~np.isfinite(Z)] = 0.0
+    return Z, columns
+
+
+def _attribution(df: pd.DataFrame, rows: np.ndarray, detector) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Path attribution of the selected rows, prepared exactly as they were
+    scored: NaN/inf take the calibration medians, or without a calibration
+    the medians of the whole `df` (not of the selected rows).
+    """
+    forest = detector.if_compiled or CompiledForest.from_sklearn(detector.if_model)
+    fixed = detector.calibration is not None
+    selected = df.iloc[rows]
+    if not fixed:
+        values = selected[detector.feature_columns].to_numpy(dtype=np.float64, copy=True)
+        bad = ~np.isfinite(values)
+        if bad.any():
+            values = np.where(bad, detector._batch_medians(df), values)
+            selected = pd.DataFrame(values, columns=detector.feature_columns, index=selected.index)
+    X_scaled = detector._prepare(selected, fixed=fixed)
+    return attribute(forest, X_scaled.to_numpy()), np.asarray(detector.feature_columns, dtype=object)
+
+
+def build_alerts(
+    df: pd.DataFrame,
+    detect_result: dict,
+    indices=None,
+    detector=None,
+    k: int = 5,
+    evidence: str | None = None,
+) -> AlertBatch:
+    """
+    Builds alerts for many rows at once (default: every anomaly).
+
+    Top-k evidence is taken with one argpartition over the whole selection:
+    - "zscore": scaled values, so large-unit columns such as Destination
+      Port no longer win by magnitude alone
+    - "attribution": Isolation Forest path attribution (pipeline.attribution),
+      i.e. the features that actually isolated the row; needs `detector`
+    Default: "attribution" when a detector is given, else "zscore".
+    """
+    evidence = _evidence_kind(evidence, detector)
+    if evidence not in EVIDENCE_KINDS:
+        raise ValueError(f"Unknown evidence: {evidence!r} (expected one of {EVIDENCE_KINDS})")
+    if evidence == "attribution" and detector is None:
+        raise ValueError("evidence='attribution' needs a detector")
+
+    if indices is None:
+        indices = np.flatnonzero(detect_result["is_anomaly"])
+    indices = np.asarray(indices, dtype=np.int64)
+
+    with stage("alerts.build_alerts", rows=len(indices)):
+        batch = _build_batch(df, detect_result, indices, detector, k, evidence)
+
+    counts = np.bincount(batch.severity_code, minlength=len(SEVERITY_NAMES))
+    for name, count in zip(SEVERITY_NAMES, counts):
+        if count:
+            inc("alerts_built_total", int(count), severity=name)
+    return batch
+
+
+def _evidence_kind(evidence: str | None, detector) -> str:
+    if evidence is None:
+        return "attribution" if detector is not None else "zscore"
+    return evidence
+
+
+def _build_batch(df, detect_result, indices, detector, k, evidence) -> AlertBatch:
+    scores = np.asarray(detect_result["if_scores"], dtype=np.float64)[indices]
+    threshold = float(detect_result["threshold"])
+    is_anomaly = np.asarray(detect_result["is_anomaly"], dtype=bool)[indices]
+
+    if evidence == "attribution":
+        values, columns = _attribution(df, indices, detector)
+        top = top_k(values, k)
+    else:
+        # rank by |z|, report the signed z of the winners
+        values, columns = _zscores(df, indices, detector)
+        top = top_k(np.abs(values), k)
+
+    top_features = columns[top]
+    top_values = np.take_along_axis(values, top, axis=1)
+
+    ports = None
+    if PORT_COLUMN in df.columns:
+        ports = df[PORT_COLUMN].to_numpy(dtype=np.float64)[indices]
+        ports = np.where(np.isfinite(ports), ports, -1).astype(np.int64)
+
+    return AlertBatch(
+        indices=indices,
+        scores=scores,
+        threshold=threshold,
+        is_anomaly=is_anomaly,
+        severity=severity_codes(scores, threshold),
+        top_features=top_features,
+        top_values=top_values,
+        timestamp=datetime.utcnow().isoformat(),
+        evidence=evidence,
+        ports=ports,
+    )
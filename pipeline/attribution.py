@@ -0,0 +1,102 @@
+"""
+Per-feature attribution for Isolation Forest anomalies.
+
+"Largest absolute value" is not what made the forest isolate a point. Here
+every split on a row's path is credited to its feature with weight 1 / h_t(x)
+(h_t = corrected path length in tree t), as in local DIFFI: features that
+keep showing up on short isolation paths get the most credit. Credits are
+then divided by how often the forest splits on each feature at all, so
+rarely-split features are not drowned out by frequently-split ones.
+
+Runs on the flat arrays of pipeline.forest.CompiledForest, vectorized across
+rows and trees (one bincount per tree level).
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from pipeline.forest import BLOCK_ROWS, CompiledForest
+
+
+def split_prior(forest: CompiledForest) -> np.ndarray:
+    """
+    Share of training samples routed through a split on each feature,
+    i.e. how much a feature is used by the forest regardless of the row.
+    """
+    internal = ~forest.is_leaf
+    weights = forest.n_node_samples[internal].astype(np.float64)
+    prior = np.bincount(forest.feature[internal], weights=weights, minlength=forest.n_features)
+    return prior / prior.sum()
+
+
+def _attribute_block(forest: CompiledForest, block: np.ndarray) -> np.ndarray:
+    n_rows, n_feat = block.shape
+    flat = block.ravel()
+    row_offset = (np.arange(n_rows, dtype=np.intp) * n_feat)[:, None]
+    node = np.broadcast_to(forest.roots, (n_rows, forest.n_trees)).copy()
+    route_nan = forest.missing_right is not None and np.isnan(flat).any()
+
+    # walk once to the leaves, remembering which feature split at each level
+    path_features = []
+    for _ in range(forest.max_depth):
+        nxt = np.take(forest.child, node)
+        internal = nxt != node
+        feat = np.take(forest.feature, node)
+        path_features.append(np.where(internal, feat, -1))
+
+        x = np.take(flat, feat + row_offset)
+        went_right = x > np.take(forest.threshold, node)
+        if route_nan:
+            went_right |= np.isnan(x) & np.take(forest.missing_right, node)
+        node = nxt + went_right
+
+    h = np.take(forest.leaf_value, node)
+    weight = np.divide(1.0, h, out=np.zeros_like(h), where=h > 0)
+
+    credit = np.zeros(n_rows * n_feat, dtype=np.float64)
+    for feat in path_features:
+        used = feat >= 0
+        bins = (row_offset + feat)[used]
+        credit += np.bincount(bins, weights=weight[used], minlength=n_rows * n_feat)
+
+    return credit.reshape(n_rows, n_feat)
+
+
+def attribute(forest: CompiledForest, X, normalize: bool = True) -> np.ndarray:
+    """
+    Attribution matrix (n_rows x n_features) for already-scaled rows X.
+    Each row sums to 1.
+    """
+    X = forest._as_matrix(X)
+    out = np.empty(X.shape, dtype=np.float64)
+    for start in range(0, X.shape[0], BLOCK_ROWS):
+        out[start:start + BLOCK_ROWS] = _attribute_block(forest, X[start:start + BLOCK_ROWS])
+
+    if normalize:
+        prior = split_prior(forest)
+        out = np.divide(out, prior, out=np.zeros_like(out), where=prior > 0)
+
+    total = out.sum(axis=1, keepdims=True)
+    return np.divide(out, total, out=np.zeros_like(out), where=total > 0)
+
+
+def top_k(importance: np.ndarray, k: int = 5) -> np.ndarray:
+    """
+    Column indices of the k largest values per row, best first.
+    """
+    k = min(k, importance.shape[1])
+    if importance.shape[0] == 0 or k == 0:
+        return np.empty((importance.shape[0], 0), dtype=np.intp)
+
+    top = np.argpartition(-importance, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(importance, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def top_features(importance: np.ndarray, feature_columns, k: int = 5):
+    """
+    Names and values of the k most credited features per row, best first.
+    """
+    top = top_k(importance, k)
+    columns = np.asarray(feature_columns, dtype=object)
+    return columns[top], np.take_along_axis(importance, top, axis=1)
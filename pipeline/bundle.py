@@ -0,0 +1,300 @@
+"""
+Versioned model bundle.
+
+One directory holds everything the Detector needs at inference time:
+
+    models/bundle/
+      manifest.json          version, feature hash, per-model files/params
+      feature_columns.json
+      calibration.json       (optional, see scripts/make_artifacts.py)
+      scaler_mean.npy / scaler_scale.npy
+      if_*.npy               compiled Isolation Forest arrays
+      kmeans_centers.npy     KMeans centroids only
+      lof_model.joblib       (optional)
+      lof_*.npy              approximate LOF reference set (optional)
+
+Only inference state is kept (e.g. centroids instead of the pickled KMeans
+with its training labels). Models are loaded lazily on first use and the
+arrays are memory-mapped, so several Streamlit / worker processes share the
+same pages.
+"""
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import warnings
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from pipeline.forest import CompiledForest
+from pipeline.lof import ApproxLOF
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLE_DIR = os.path.join(BASE_DIR, "models", "bundle")
+MANIFEST = "manifest.json"
+
+FORMAT_VERSION = 1
+
+_FOREST_ARRAYS = ("feature", "threshold", "child", "leaf_value", "roots", "depth", "n_node_samples", "missing_right")
+_FOREST_PARAMS = ("max_depth", "denominator", "offset", "n_features")
+
+
+def feature_hash(feature_columns) -> str:
+    payload = json.dumps(list(feature_columns), ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def has_bundle(bundle_dir: str = BUNDLE_DIR) -> bool:
+    return os.path.exists(os.path.join(bundle_dir, MANIFEST))
+
+
+class Standardizer:
+    """
+    Inference-only StandardScaler: (X - mean_) / scale_.
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(mean)
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> "Standardizer":
+        n = scaler.n_features_in_
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n)
+        return cls(np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64))
+
+    def transform(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        return (X - self.mean_) / self.scale_
+
+
+class CentroidModel:
+    """
+    Inference-only KMeans: nearest-centroid assignment.
+    """
+
+    def __init__(self, centers: np.ndarray):
+        self.cluster_centers_ = centers
+        self.n_clusters = len(centers)
+        self._center_sq = np.einsum("ij,ij->i", centers, centers)
+
+    @classmethod
+    def from_sklearn(cls, kmeans) -> "CentroidModel":
+        return cls(np.asarray(kmeans.cluster_centers_, dtype=np.float64))
+
+    def transform(self, X) -> np.ndarray:
+        """Euclidean distance to every centroid."""
+        X = np.asarray(X, dtype=np.float64)
+        sq = np.einsum("ij,ij->i", X, X)[:, None] - 2.0 * X @ self.cluster_centers_.T + self._center_sq
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def predict(self, X) -> np.ndarray:
+        return self.transform(X).argmin(axis=1).astype(np.int32)
+
+
+def save_bundle(
+    bundle_dir: str,
+    feature_columns: list,
+    scaler,
+    if_model,
+    kmeans_model=None,
+    lof_model=None,
+    lof_approx: ApproxLOF | None = None,
+    calibration: dict | None = None,
+    version: str | None = None,
+    include_sklearn_if: bool = False,
+    extra: dict | None = None,
+) -> dict:
+    """
+    Writes a bundle from fitted sklearn models (or their inference-only
+    equivalents). Returns the manifest.
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    def _save(name: str, arr) -> str:
+        np.save(os.path.join(bundle_dir, name), np.ascontiguousarray(arr))
+        return name
+
+    models = {}
+
+    scaler = scaler if isinstance(scaler, Standardizer) else Standardizer.from_sklearn(scaler)
+    models["scaler"] = {
+        "kind": "standardizer",
+        "files": {
+            "mean": _save("scaler_mean.npy", scaler.mean_),
+            "scale": _save("scaler_scale.npy", scaler.scale_),
+        },
+    }
+
+    forest = if_model if isinstance(if_model, CompiledForest) else CompiledForest.from_sklearn(if_model)
+    models["isolation_forest"] = {
+        "kind": "compiled_forest",
+        "files": {
+            k: _save(f"if_{k}.npy", getattr(forest, k)) for k in _FOREST_ARRAYS
+            if getattr(forest, k) is not None
+        },
+        "params": {k: getattr(forest, k) for k in _FOREST_PARAMS},
+        "n_trees": forest.n_trees,
+    }
+    if include_sklearn_if and not isinstance(if_model, CompiledForest):
+        joblib.dump(if_model, os.path.join(bundle_dir, "if_model.joblib"))
+        models["isolation_forest"]["sklearn"] = "if_model.joblib"
+
+    if kmeans_model is not None:
+        km = kmeans_model if isinstance(kmeans_model, CentroidModel) else CentroidModel.from_sklearn(kmeans_model)
+        models["kmeans"] = {
+            "kind": "centroids",
+            "files": {"centers": _save("kmeans_centers.npy", km.cluster_centers_)},
+        }
+
+    if lof_model is not None:
+        joblib.dump(lof_model, os.path.join(bundle_dir, "lof_model.joblib"))
+        models["lof"] = {"kind": "joblib", "file": "lof_model.joblib"}
+
+    if lof_approx is not None:
+        models["lof_approx"] = {
+            "kind": "approx_lof",
+            "files": {
+                "reference": _save("lof_reference.npy", lof_approx.reference),
+                "k_distance": _save("lof_k_distance.npy", lof_approx.k_distance),
+                "lrd": _save("lof_lrd.npy", lof_approx.lrd),
+            },
+            "params": {"n_neighbors": lof_approx.n_neighbors, "offset": lof_approx.offset_},
+            "n_reference": int(len(lof_approx.reference)),
+        }
+        if lof_approx.accuracy is not None:
+            models["lof_approx"]["accuracy"] = lof_approx.accuracy
+
+    with open(os.path.join(bundle_dir, "feature_columns.json"), "w", encoding="utf-8") as f:
+        json.dump(list(feature_columns), f, ensure_ascii=False, indent=2)
+
+    if calibration is not None:
+        with open(os.path.join(bundle_dir, "calibration.json"), "w", encoding="utf-8") as f:
+            json.dump(calibration, f, ensure_ascii=False, indent=2)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version or datetime.utcnow().strftime("%Y%m%d%H%M%S"),
+        "created_at": datetime.utcnow().isoformat(),
+        "feature_hash": feature_hash(feature_columns),
+        "n_features": len(feature_columns),
+        "calibration": "calibration.json" if calibration is not None else None,
+        "models": models,
+        **(extra or {}),
+    }
+    # manifest last: a half-written bundle is never picked up
+    with open(os.path.join(bundle_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    return manifest
+
+
+def write_calibration(bundle_dir: str, calibration: dict) -> None:
+    """
+    Replaces the calibration of an existing bundle (e.g. recomputed by
+    scripts/make_artifacts.py for the same models).
+    """
+    with open(os.path.join(bundle_dir, "calibration.json"), "w", encoding="utf-8") as f:
+        json.dump(calibration, f, ensure_ascii=False, indent=2)
+
+    manifest_path = os.path.join(bundle_dir, MANIFEST)
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["calibration"] = "calibration.json"
+    # calibration first, manifest last (same order as save_bundle)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class ModelBundle:
+    """
+    Lazy reader for a bundle directory. Each model is built on first access
+    and cached; .npy arrays are opened with mmap_mode="r".
+    """
+
+    def __init__(self, bundle_dir: str = BUNDLE_DIR, mmap: bool = True):
+        self.bundle_dir = bundle_dir
+        self.mmap_mode = "r" if mmap else None
+
+        with open(os.path.join(bundle_dir, MANIFEST), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported bundle format: {self.manifest.get('format')}")
+
+        with open(os.path.join(bundle_dir, "feature_columns.json"), "r", encoding="utf-8") as f:
+            self.feature_columns = json.load(f)
+        if feature_hash(self.feature_columns) != self.manifest["feature_hash"]:
+            raise ValueError("Bundle feature_columns.json does not match its manifest hash")
+
+        self._loaded = {}
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def feature_hash(self) -> str:
+        return self.manifest["feature_hash"]
+
+    def has(self, name: str) -> bool:
+        return name in self.manifest["models"]
+
+    def _array(self, name: str) -> np.ndarray:
+        arr = np.load(os.path.join(self.bundle_dir, name), mmap_mode=self.mmap_mode)
+        # plain ndarray view over the mapping (avoids np.memmap overhead per op)
+        return arr.view(np.ndarray)
+
+    def _joblib(self, name: str):
+        with warnings.catch_warnings():
+            # compressed pickles can't be memory-mapped; joblib says so and
+            # loads them normally. Anything else (e.g. sklearn's
+            # InconsistentVersionWarning) still gets through.
+            warnings.filterwarnings("ignore", message='mmap_mode ".*" is not compatible with compressed')
+            return joblib.load(os.path.join(self.bundle_dir, name), mmap_mode=self.mmap_mode)
+
+    def get(self, name: str):
+        """
+        Returns the inference model `name` (None if the bundle has none).
+        """
+        if name in self._loaded:
+            return self._loaded[name]
+        if name == "isolation_forest_sklearn":
+            entry = self.manifest["models"].get("isolation_forest", {})
+            model = self._joblib(entry["sklearn"]) if "sklearn" in entry else None
+            self._loaded[name] = model
+            return model
+        if not self.has(name):
+            self._loaded[name] = None
+            return None
+
+        entry = self.manifest["models"][name]
+        kind = entry["kind"]
+        if kind == "standardizer":
+            model = Standardizer(self._array(entry["files"]["mean"]), self._array(entry["files"]["scale"]))
+        elif kind == "compiled_forest":
+            arrays = {k: self._array(v) for k, v in entry["files"].items()}
+            model = CompiledForest(**arrays, **entry["params"])
+        elif kind == "centroids":
+            model = CentroidModel(self._array(entry["files"]["centers"]))
+        elif kind == "approx_lof":
+            arrays = {k: self._array(v) for k, v in entry["files"].items()}
+            model = ApproxLOF(**arrays, **entry["params"])
+        elif kind == "joblib":
+            model = self._joblib(entry["file"])
+        else:
+            raise ValueError(f"Unknown model kind in bundle: {kind!r}")
+
+        self._loaded[name] = model
+        return model
+
+    def calibration(self):
+        name = self.manifest.get("calibration")
+        if not name:
+            return None
+        with open(os.path.join(self.bundle_dir, name), "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,202 @@
+"""
+Binary columnar cache for the cleaned CICIDS CSVs.
+
+Each `data/clean/<name>_cleaned.csv` is converted once into
+`data/cache/<name>_cleaned/`:
+- features.npy : float32 matrix (rows x features) in feature_columns.json order
+- labels.npy   : int16 label codes (only if the CSV has a Label column)
+- meta.json    : column names, label names, row count and source size/mtime
+
+Opening a dataset then memory-maps features.npy, so it is near-instant and
+pages are read from disk on demand. The cache is only used while it is fresh
+(same source size + mtime and same feature columns).
+"""
+from __future__ import annotations
+
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")
+FEATS_PATH = os.path.join(BASE_DIR, "models", "feature_columns.json")
+
+FORMAT_VERSION = 1
+
+
+def load_feature_columns() -> list:
+    with open(FEATS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cache_dir_for(csv_path: str, cache_root: str = CACHE_DIR) -> str:
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_root, name)
+
+
+def _source_stamp(csv_path: str) -> dict:
+    st = os.stat(csv_path)
+    return {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+def read_meta(csv_path: str, cache_root: str = CACHE_DIR):
+    path = os.path.join(cache_dir_for(csv_path, cache_root), "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_fresh(csv_path: str, feature_columns: list | None = None, cache_root: str = CACHE_DIR) -> bool:
+    """
+    True if a cache exists for csv_path and still matches the source file.
+    """
+    meta = read_meta(csv_path, cache_root)
+    if meta is None or meta.get("version") != FORMAT_VERSION:
+        return False
+    if feature_columns is not None and meta["columns"] != list(feature_columns):
+        return False
+    if not os.path.exists(csv_path):
+        # source gone (e.g. only the cache was shipped): trust the cache
+        return True
+    stamp = _source_stamp(csv_path)
+    return all(meta.get(k) == v for k, v in stamp.items())
+
+
+class ColumnarWriter:
+    """
+    Streams feature chunks into a cache directory (same layout as
+    `build_cache`), so a producer that already holds clean chunks (e.g. the
+    preprocessing script) can write the cache without re-reading the CSV.
+
+        writer = ColumnarWriter(out_dir, feature_columns)
+        for chunk in chunks: writer.append(chunk)
+        meta = writer.close(source_csv)   # stamps meta with the CSV's size/mtime
+    """
+
+    def __init__(self, out_dir: str, feature_columns: list | None = None):
+        self.out_dir = out_dir
+        self.feature_columns = list(feature_columns or load_feature_columns())
+        self.n_rows = 0
+        self._label_codes = {}
+        self._labels = []
+        self._has_label = False
+
+        os.makedirs(out_dir, exist_ok=True)
+        # a stale meta.json must not vouch for a half-written cache
+        meta_path = os.path.join(out_dir, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        self._raw_path = os.path.join(out_dir, "features.raw.tmp")
+        self._raw = open(self._raw_path, "wb")
+
+    def append(self, chunk: pd.DataFrame) -> None:
+        missing = [c for c in self.feature_columns if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {missing[:10]} (first 10 shown)")
+
+        X = chunk[self.feature_columns].to_numpy(dtype=np.float32)
+        self._raw.write(np.ascontiguousarray(X).tobytes())
+        self.n_rows += len(X)
+
+        if "Label" in chunk.columns:
+            self._has_label = True
+            names = chunk["Label"].astype(str).str.strip()
+            for name in names.unique():
+                self._label_codes.setdefault(name, len(self._label_codes))
+            self._labels.append(names.map(self._label_codes).to_numpy(dtype=np.int16))
+
+    def close(self, csv_path: str) -> dict:
+        self._raw.close()
+
+        # wrap the raw rows with an .npy header (shape is only known now)
+        features_path = os.path.join(self.out_dir, "features.npy")
+        header = {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+            "fortran_order": False,
+            "shape": (self.n_rows, len(self.feature_columns)),
+        }
+        with open(features_path, "wb") as out, open(self._raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, length=16 * 1024 * 1024)
+        os.remove(self._raw_path)
+
+        labels_path = os.path.join(self.out_dir, "labels.npy")
+        if self._has_label:
+            np.save(labels_path, np.concatenate(self._labels) if self._labels else np.empty(0, np.int16))
+        elif os.path.exists(labels_path):
+            os.remove(labels_path)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "source": os.path.basename(csv_path),
+            **_source_stamp(csv_path),
+            "n_rows": self.n_rows,
+            "dtype": "float32",
+            "columns": self.feature_columns,
+            "label_names": list(self._label_codes) if self._has_label else None,
+        }
+        # meta is written last: a half-written cache is never considered fresh
+        with open(os.path.join(self.out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        return meta
+
+
+def build_cache(
+    csv_path: str,
+    feature_columns: list | None = None,
+    chunksize: int = 200_000,
+    cache_root: str = CACHE_DIR,
+) -> dict:
+    """
+    Converts one cleaned CSV into the binary cache, streaming in chunks.
+    Returns the written meta dict.
+    """
+    writer = ColumnarWriter(cache_dir_for(csv_path, cache_root), feature_columns)
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk.columns = chunk.columns.str.strip()
+        writer.append(chunk)
+    return writer.close(csv_path)
+
+
+def load_cached(csv_path: str, mmap: bool = True, cache_root: str = CACHE_DIR):
+    """
+    Returns (X, labels, meta): X is a read-only memmap (or in-memory array if
+    mmap=False), labels a string array or None.
+    """
+    meta = read_meta(csv_path, cache_root)
+    if meta is None:
+        raise FileNotFoundError(f"No cache for {csv_path} (run scripts/build_cache.py)")
+
+    out_dir = cache_dir_for(csv_path, cache_root)
+    X = np.load(os.path.join(out_dir, "features.npy"), mmap_mode="r" if mmap else None)
+
+    labels = None
+    if meta.get("label_names") is not None:
+        codes = np.load(os.path.join(out_dir, "labels.npy"))
+        labels = np.asarray(meta["label_names"], dtype=object)[codes]
+
+    return X, labels, meta
+
+
+def read_clean(
+    csv_path: str,
+    feature_columns: list | None = None,
+    cache_root: str = CACHE_DIR,
+) -> pd.DataFrame:
+    """
+    Drop-in replacement for `pd.read_csv(csv_path)` on cleaned files: uses the
+    memory-mapped cache when it is present and fresh, the CSV otherwise.
+    """
+    if not is_fresh(csv_path, feature_columns, cache_root):
+        return pd.read_csv(csv_path)
+
+    X, labels, meta = load_cached(csv_path, cache_root=cache_root)
+    df = pd.DataFrame(X, columns=meta["columns"], copy=False)
+    if labels is not None:
+        df["Label"] = labels
+    return df
@@ -1,19 +1,63 @@
 import os
 import json
+import warnings
 import joblib
 import numpy as np
 import pandas as pd
 
+from pipeline.bundle import BUNDLE_DIR, ModelBundle, has_bundle
+from pipeline.ensemble import FUSIONS, batch_cdf, fuse, normalize_weights, reference_cdf, vote
+from pipeline.forest import CompiledForest
+from pipeline.lof import ApproxLOF
+from pipeline.metrics import stage
+from pipeline.parallel import ParallelScorer
+from pipeline.sketch import KLLSketch
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 
 FEATS_PATH = os.path.join(MODELS_DIR, "feature_columns.json")
 SCALER_PATH = os.path.join(MODELS_DIR, "scaler.pkl")
+CALIBRATION_PATH = os.path.join(MODELS_DIR, "calibration.json")
 
 IF_PATH = os.path.join(MODELS_DIR, "if_model.pkl")
 LOF_PATH = os.path.join(MODELS_DIR, "lof_model.pkl")
 KMEANS_PATH = os.path.join(MODELS_DIR, "kmeans_model.pkl")
 
+ENGINES = ("compiled", "sklearn")
+LOF_MODES = ("auto", "approx", "exact", "off")
+
+
+def _load_pickle(path: str, required: bool = False):
+    if not os.path.exists(path):
+        if required:
+            raise FileNotFoundError(f"Model file not found: {path}")
+        return None
+    return joblib.load(path, mmap_mode="r")
+
+
+def _exact_quantile(sorted_head: np.ndarray, n: int, q: float):
+    """
+    np.quantile (linear interpolation) over n values, computed from the
+    smallest values only. Returns None if the head is too short.
+    """
+    pos = q * (n - 1)
+    lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+    if hi >= len(sorted_head):
+        return None
+    a, b = sorted_head[lo], sorted_head[hi]
+    t = pos - lo
+    # same two-sided lerp as numpy, so the result is bit-identical
+    if t >= 0.5:
+        return float(b - (b - a) * (1 - t))
+    return float(a + (b - a) * t)
+
+
+def _finite_medians(values: np.ndarray, bad: np.ndarray) -> np.ndarray:
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN column stays NaN
+        return np.nanmedian(np.where(bad, np.nan, values), axis=0)
+
 
 class Detector:
     """
@@ -21,29 +65,166 @@ class Detector:
     - Isolation Forest: primary anomaly scoring
     - LOF: local validation (optional)
     - KMeans: cluster context (optional)
+
+    Models come from the versioned bundle in models/bundle (pipeline.bundle)
+    when it exists, otherwise from the legacy *.pkl files. Either way each
+    model is loaded lazily on first use; missing optional models are None.
+
+    engine: "compiled" scores Isolation Forest with the flat-array engine
+    (pipeline.forest), "sklearn" falls back to `decision_function`.
+
+    If a calibration is available (scripts/make_artifacts.py), training
+    medians and the reference score distribution are loaded too, which enables
+    fixed-threshold scoring and `score_one`.
+
+    n_jobs > 1 scores Isolation Forest in a pool of worker processes over
+    shared memory (pipeline.parallel); call `close()` to stop the pool.
+
+    lof: "approx" uses the reference-set LOF from the bundle (pipeline.lof),
+    "exact" the sklearn model, "auto" approx when available, "off" disables it.
+
+    `score_ensemble` fuses IF, LOF and KMeans on a common rank scale
+    (pipeline.ensemble) instead of scoring with Isolation Forest alone.
     """
 
-    def __init__(self):
-        self.feature_columns = json.load(open(FEATS_PATH, "r", encoding="utf-8"))
-        self.scaler = joblib.load(SCALER_PATH)
+    def __init__(
+        self,
+        engine: str = "compiled",
+        n_jobs: int = 1,
+        bundle_dir: str = BUNDLE_DIR,
+        lof: str = "auto",
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine!r} (expected one of {ENGINES})")
+        if lof not in LOF_MODES:
+            raise ValueError(f"Unknown lof mode: {lof!r} (expected one of {LOF_MODES})")
+        self.engine = engine
+        self.lof_mode = lof
+        self.n_jobs = n_jobs
+        self._parallel = None
+        self._models = {}
+
+        self.bundle = ModelBundle(bundle_dir) if has_bundle(bundle_dir) else None
+
+        self.calibration = None
+        if self.bundle is not None:
+            self.feature_columns = self.bundle.feature_columns
+            self.calibration = self.bundle.calibration()
+        else:
+            with open(FEATS_PATH, "r", encoding="utf-8") as f:
+                self.feature_columns = json.load(f)
+
+        if self.calibration is None and os.path.exists(CALIBRATION_PATH):
+            with open(CALIBRATION_PATH, "r", encoding="utf-8") as f:
+                self.calibration = json.load(f)
+
+        self._medians = None
+        if self.calibration is not None:
+            medians = self.calibration["medians"]
+            self._medians = np.array(
+                [medians[c] for c in self.feature_columns], dtype=np.float64
+            )
+
+    @property
+    def model_version(self) -> str:
+        return self.bundle.version if self.bundle is not None else "legacy"
+
+    def _lazy(self, name: str, bundle_name: str, legacy_loader):
+        if name not in self._models:
+            model = self.bundle.get(bundle_name) if self.bundle is not None else None
+            self._models[name] = model if model is not None else legacy_loader()
+        return self._models[name]
 
-        self.if_model = joblib.load(IF_PATH)
-        self.lof_model = joblib.load(LOF_PATH)
-        self.kmeans_model = joblib.load(KMEANS_PATH)
+    @property
+    def scaler(self):
+        return self._lazy("scaler", "scaler", lambda: _load_pickle(SCALER_PATH, required=True))
 
-    def _prepare(self, df: pd.DataFrame) -> pd.DataFrame:
-        X = df.drop(columns=["Label"], errors="ignore").copy()
+    @property
+    def if_model(self):
+        """The sklearn IsolationForest (only needed by engine="sklearn")."""
+        return self._lazy("if_model", "isolation_forest_sklearn", lambda: _load_pickle(IF_PATH))
 
-        # ensure all required columns exist
-        missing = [c for c in self.feature_columns if c not in X.columns]
+    @property
+    def if_compiled(self):
+        if self.engine != "compiled":
+            return None
+
+        def _compile():
+            model = self.if_model
+            if model is None:
+                raise FileNotFoundError(f"Isolation Forest not found: {IF_PATH}")
+            return CompiledForest.from_sklearn(model)
+
+        return self._lazy("if_compiled", "isolation_forest", _compile)
+
+    @property
+    def lof_model(self):
+        if self.lof_mode == "off":
+            return None
+        if self.lof_mode in ("auto", "approx"):
+            approx = self._lazy("lof_approx", "lof_approx", lambda: None)
+            if approx is not None or self.lof_mode == "approx":
+                return approx
+        return self._lazy("lof_model", "lof", lambda: _load_pickle(LOF_PATH))
+
+    @property
+    def kmeans_model(self):
+        return self._lazy("kmeans_model", "kmeans", lambda: _load_pickle(KMEANS_PATH))
+
+    def _require_calibration(self) -> dict:
+        if self.calibration is None:
+            raise FileNotFoundError(
+                f"Calibration not found: {CALIBRATION_PATH} (run scripts/make_artifacts.py)"
+            )
+        return self.calibration
+
+    def reference_threshold(self, q: float = 0.01) -> float:
+        """
+        Alert threshold at quantile q of the training score distribution.
+        """
+        ref = self._require_calibration().get("reference")
+        if ref is None:
+            raise ValueError("Calibration has no reference scores (Isolation Forest was missing)")
+        return float(np.interp(q, ref["quantiles"], ref["scores"]))
+
+    def live_threshold(self, q: float = 0.01) -> float:
+        """
+        Threshold for small / live batches, where a batch quantile is
+        meaningless: the calibrated reference threshold when available,
+        otherwise 0.0 (the Isolation Forest's own contamination boundary).
+        """
+        if self.calibration is not None:
+            return self.reference_threshold(q)
+        return 0.0
+
+    def _prepare(self, df: pd.DataFrame, fixed: bool = False) -> pd.DataFrame:
+        """
+        fixed=True fills NaNs with the training medians instead of the
+        medians of the batch being scored.
+        """
+        with stage("detect.prepare", rows=len(df)):
+            return self._prepare_frame(df, fixed)
+
+    def _prepare_frame(self, df: pd.DataFrame, fixed: bool) -> pd.DataFrame:
+        # ensure all required columns exist (Label and other extras are ignored)
+        missing = [c for c in self.feature_columns if c not in df.columns]
         if missing:
             raise ValueError(f"Missing required columns: {missing[:10]} (first 10 shown)")
 
-        X = X[self.feature_columns].copy()
+        # one float64 block: imputing column by column in pandas costs
+        # ~10 ms per call, which dominates small (live / micro) batches
+        values = df[self.feature_columns].to_numpy(dtype=np.float64, copy=True)
 
-        X = X.replace([np.inf, -np.inf], np.nan)
-        X = X.fillna(X.median(numeric_only=True))
+        bad = ~np.isfinite(values)
+        if fixed:
+            self._require_calibration()
+            fill = self._medians
+        elif bad.any():
+            fill = _finite_medians(values, bad)
+        if bad.any():
+            values = np.where(bad, fill, values)
 
+        X = pd.DataFrame(values, columns=self.feature_columns, index=df.index, copy=False)
         X_scaled = pd.DataFrame(
             self.scaler.transform(X),
             columns=self.feature_columns,
@@ -51,38 +232,419 @@ class Detector:
         )
         return X_scaled
 
-    def score(self, df: pd.DataFrame, q: float = 0.01) -> dict:
+    def _batch_medians(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Per-feature medians of the finite values of `df`: what
+        `_prepare(df, fixed=False)` fills NaN/inf with.
+        """
+        values = df[self.feature_columns].to_numpy(dtype=np.float64)
+        return _finite_medians(values, ~np.isfinite(values))
+
+    def _if_scores(self, X_scaled: pd.DataFrame) -> np.ndarray:
+        with stage("detect.isolation_forest", rows=len(X_scaled)):
+            return self._if_decision(X_scaled)
+
+    def _parallel_source(self) -> str:
+        """
+        What the scoring workers load: the bundle, unless engine="sklearn"
+        needs the sklearn model and the bundle has none (then the legacy
+        if_model.pkl, like the serial path).
+        """
+        if self.bundle is not None:
+            entry = self.bundle.manifest["models"].get("isolation_forest", {})
+            if self.engine == "compiled" or "sklearn" in entry:
+                return self.bundle.bundle_dir
+        if not os.path.exists(IF_PATH):
+            raise FileNotFoundError(f"Isolation Forest not found: {IF_PATH}")
+        return IF_PATH
+
+    def _if_decision(self, X_scaled: pd.DataFrame) -> np.ndarray:
+        if self.n_jobs > 1:
+            if self._parallel is None:
+                self._parallel = ParallelScorer(self._parallel_source(), self.n_jobs, self.engine)
+            return self._parallel.decision_function(X_scaled.to_numpy())
+        if self.if_compiled is not None:
+            return self.if_compiled.decision_function(X_scaled.to_numpy())
+        return self.if_model.decision_function(X_scaled)
+
+    def score(
+        self,
+        df: pd.DataFrame,
+        q: float = 0.01,
+        fixed_threshold: bool = False,
+        lof_on: str = "all",
+    ) -> dict:
         """
         Returns anomaly info + triage decision.
         q: quantile threshold for alerting (SOC-style). Example 0.01 => top 1% most anomalous.
+        fixed_threshold: take medians and the q threshold from the training
+        calibration instead of the batch (needed for small/live batches).
+        lof_on: "candidates" runs LOF only on the IF anomalies (NaN elsewhere).
         """
-        X_scaled = self._prepare(df)
+        with stage("detect.score", rows=len(df)):
+            return self._score(df, q, fixed_threshold, lof_on)
+
+    def _score(self, df: pd.DataFrame, q: float, fixed_threshold: bool, lof_on: str) -> dict:
+        X_scaled = self._prepare(df, fixed=fixed_threshold)
 
         # IF scores (higher=more normal, lower=more anomalous)
-        if_scores = self.if_model.decision_function(X_scaled)
+        if_scores = self._if_scores(X_scaled)
 
-        threshold = float(np.quantile(if_scores, q))
+        if fixed_threshold:
+            threshold = self.reference_threshold(q)
+        else:
+            threshold = float(np.quantile(if_scores, q))
         is_anomaly = if_scores <= threshold
 
-        result = {
+        return {
             "if_scores": if_scores,
             "threshold": threshold,
             "is_anomaly": is_anomaly,
+            "lof_scores": self._lof_scores(X_scaled, is_anomaly if lof_on == "candidates" else None),
+            "cluster": self._clusters(X_scaled),
         }
 
+    def _lof_scores(self, X_scaled: pd.DataFrame, rows=None):
+        """
+        LOF decision function (None when LOF is unavailable). rows: boolean
+        mask of the rows to score, NaN elsewhere (None = every row).
+        """
         # LOF (if trained with novelty=True, it supports decision_function)
         # If your LOF was not trained with novelty=True, this may fail -> we'll handle it later if needed
         try:
-            lof_scores = self.lof_model.decision_function(X_scaled)
-            result["lof_scores"] = lof_scores
+            if self.lof_model is None:
+                raise LookupError("LOF model not available")
+            if rows is not None:
+                lof_scores = np.full(len(X_scaled), np.nan)
+                if rows.any():
+                    with stage("detect.lof", rows=int(rows.sum())):
+                        lof_scores[rows] = self.lof_model.decision_function(X_scaled[rows])
+                return lof_scores
+            with stage("detect.lof", rows=len(X_scaled)):
+                return self.lof_model.decision_function(X_scaled)
         except Exception:
-            result["lof_scores"] = None
+            return None
 
-        # KMeans cluster id (context)
+    def _clusters(self, X_scaled: pd.DataFrame):
+        """KMeans cluster id (context), None when KMeans is unavailable."""
         try:
-            clusters = self.kmeans_model.predict(X_scaled)
-            result["cluster"] = clusters
+            with stage("detect.kmeans", rows=len(X_scaled)):
+                return self.kmeans_model.predict(X_scaled)
         except Exception:
-            result["cluster"] = None
+            return None
+
+    # --------------------------------------------------------------
+    # scoring and thresholding as two steps
+    # --------------------------------------------------------------
+    def raw_scores(self, df: pd.DataFrame, fixed: bool = False, lof: bool = True) -> dict:
+        """
+        Everything in `score` that does not depend on q: IF scores (plus a
+        sorted copy), LOF scores for every row and KMeans clusters. Cache the
+        result and call `apply_threshold` for each q, which only costs a
+        lookup in the sorted scores and one comparison per row.
+
+        fixed: impute with the training medians (as fixed_threshold=True).
+        """
+        with stage("detect.raw_scores", rows=len(df)):
+            X_scaled = self._prepare(df, fixed=fixed)
+            if_scores = self._if_scores(X_scaled)
+            return {
+                "if_scores": if_scores,
+                "sorted_scores": np.sort(if_scores),
+                "lof_scores": self._lof_scores(X_scaled) if lof else None,
+                "cluster": self._clusters(X_scaled),
+                "fixed": fixed,
+                "model_version": self.model_version,
+            }
+
+    def apply_threshold(self, raw: dict, q: float = 0.01, fixed_threshold: bool = None) -> dict:
+        """
+        The `score` result for quantile q from `raw_scores` output, without
+        re-scoring. The threshold is the training reference threshold when
+        fixed_threshold (default: how the raw scores were imputed), otherwise
+        np.quantile(if_scores, q) read from the sorted scores.
+        """
+        if fixed_threshold is None:
+            fixed_threshold = raw["fixed"]
+
+        sorted_scores = raw["sorted_scores"]
+        if len(sorted_scores) == 0:
+            raise ValueError("No scores to threshold")
+        if fixed_threshold:
+            threshold = self.reference_threshold(q)
+        else:
+            threshold = _exact_quantile(sorted_scores, len(sorted_scores), q)
 
+        return {
+            "if_scores": raw["if_scores"],
+            "threshold": threshold,
+            "is_anomaly": raw["if_scores"] <= threshold,
+            "lof_scores": raw["lof_scores"],
+            "cluster": raw["cluster"],
+        }
+
+    # --------------------------------------------------------------
+    # ensemble (pipeline.ensemble)
+    # --------------------------------------------------------------
+    def ensemble_reference(self, name: str):
+        """
+        Reference score distribution of one ensemble model from the
+        calibration, or None. "lof" resolves to the LOF actually in use
+        (approximate or exact).
+        """
+        if self.calibration is None:
+            return None
+        if name == "isolation_forest":
+            return self.calibration.get("reference")
+        if name == "lof" and isinstance(self.lof_model, ApproxLOF):
+            name = "lof_approx"
+        return self.calibration.get("references", {}).get(name)
+
+    def ensemble_threshold(self, weights: dict, q: float = 0.01) -> float:
+        """
+        Fixed threshold of the fused (fusion="mean") score at quantile q of
+        its training distribution. The mean of per-model CDFs is not uniform,
+        so q itself is not that threshold; scripts/train_models.py stores the
+        fused reference for equal weights over each model combination.
+        """
+        resolved = {
+            ("lof_approx" if name == "lof" and isinstance(self.lof_model, ApproxLOF) else name): w
+            for name, w in weights.items()
+        }
+        for entry in self._require_calibration().get("ensemble", []):
+            stored = entry["weights"]
+            if set(stored) == set(resolved) and all(abs(stored[n] - resolved[n]) < 1e-9 for n in stored):
+                ref = entry["reference"]
+                return float(np.interp(q, ref["quantiles"], ref["scores"]))
+        raise ValueError(
+            f"Calibration has no fused reference for weights {resolved} "
+            "(retrain with scripts/train_models.py, use equal weights, fusion='vote' "
+            "or fixed_threshold=False)"
+        )
+
+    def score_ensemble(
+        self,
+        df: pd.DataFrame,
+        q: float = 0.01,
+        weights: dict = None,
+        fusion: str = "mean",
+        fixed_threshold: bool = False,
+    ) -> dict:
+        """
+        Isolation Forest + LOF + KMeans (distance to the nearest centroid)
+        fused on a common scale (pipeline.ensemble). Same keys as `score`
+        ("threshold" stays the IF threshold, so alert severity is unchanged)
+        plus:
+        - ensemble_scores: fused score (lower = more anomalous)
+        - ensemble_threshold, and is_anomaly taken from the fusion
+        - contributions: per model, weight * normalized score (sums to
+          ensemble_scores); normalization: "reference" or "batch" per model
+        - weights (normalized over the available models); votes (fusion="vote")
+
+        weights: {"isolation_forest": .., "lof": .., "kmeans": ..}, None =
+        equal weights. fusion="mean" flags the q most anomalous fused scores
+        (fixed_threshold: quantile q of the fused training scores, see
+        `ensemble_threshold`); "vote" flags rows that models carrying more
+        than half of the weight put in their own q quantile.
+        """
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion: {fusion!r} (expected one of {FUSIONS})")
+        with stage("detect.ensemble", rows=len(df)):
+            return self._score_ensemble(df, q, weights, fusion, fixed_threshold)
+
+    def _score_ensemble(self, df, q, weights, fusion, fixed_threshold) -> dict:
+        X_scaled = self._prepare(df, fixed=fixed_threshold)
+
+        raw = {"isolation_forest": self._if_scores(X_scaled)}
+        lof_scores = self._lof_scores(X_scaled)
+        if lof_scores is not None:
+            raw["lof"] = np.asarray(lof_scores, dtype=np.float64)
+
+        # one transform gives both the cluster id and the centroid distance
+        clusters = None
+        try:
+            with stage("detect.kmeans", rows=len(X_scaled)):
+                distances = np.asarray(self.kmeans_model.transform(X_scaled), dtype=np.float64)
+            clusters = distances.argmin(axis=1)
+            raw["kmeans"] = -distances.min(axis=1)
+        except Exception:
+            pass
+
+        weights = normalize_weights(weights, raw)
+        normalized, normalization = {}, {}
+        for name in weights:
+            ref = self.ensemble_reference(name)
+            if ref is not None:
+                normalized[name] = reference_cdf(raw[name], ref)
+                normalization[name] = "reference"
+            else:
+                normalized[name] = batch_cdf(raw[name])
+                normalization[name] = "batch"
+
+        fused, contributions = fuse(normalized, weights)
+        if_scores = raw["isolation_forest"]
+        result = {
+            "if_scores": if_scores,
+            "threshold": self.reference_threshold(q) if fixed_threshold else float(np.quantile(if_scores, q)),
+            "lof_scores": lof_scores,
+            "cluster": clusters,
+            "ensemble_scores": fused,
+            "contributions": contributions,
+            "normalization": normalization,
+            "weights": weights,
+        }
+
+        if fusion == "vote":
+            votes = vote(normalized, weights, q)
+            result["votes"] = votes
+            result["ensemble_threshold"] = 0.5
+            result["is_anomaly"] = votes > 0.5
+        else:
+            threshold = self.ensemble_threshold(weights, q) if fixed_threshold else float(np.quantile(fused, q))
+            result["ensemble_threshold"] = threshold
+            result["is_anomaly"] = fused <= threshold
         return result
+
+    def close(self) -> None:
+        """Stops the scoring worker pool, if one was started."""
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+
+    def score_one(self, flow, q: float = 0.01) -> dict:
+        """
+        Scores a single flow (dict / Series keyed by feature name) against the
+        training calibration. Skips pandas entirely, so latency is dominated
+        by the forest traversal of one row.
+        """
+        with stage("detect.score_one", rows=1, memory=False):
+            return self._score_one(flow, q)
+
+    def _score_one(self, flow, q: float) -> dict:
+        self._require_calibration()
+
+        try:
+            x = np.array([flow[c] for c in self.feature_columns], dtype=np.float64)
+        except KeyError as e:
+            raise ValueError(f"Missing required column: {e.args[0]}") from None
+
+        bad = ~np.isfinite(x)
+        x[bad] = self._medians[bad]
+        x = (x - self.scaler.mean_) / self.scaler.scale_
+
+        if self.if_compiled is not None:
+            score = float(self.if_compiled.decision_function(x[None, :])[0])
+        else:
+            row = pd.DataFrame(x[None, :], columns=self.feature_columns)
+            score = float(self.if_model.decision_function(row)[0])
+
+        threshold = self.reference_threshold(q)
+        return {
+            "if_score": score,
+            "threshold": threshold,
+            "is_anomaly": score <= threshold,
+        }
+
+    def _iter_chunks(self, source, chunksize: int):
+        if isinstance(source, (str, os.PathLike)):
+            return pd.read_csv(source, chunksize=chunksize)
+        if isinstance(source, pd.DataFrame):
+            return (source.iloc[i:i + chunksize] for i in range(0, len(source), chunksize))
+        return iter(source)
+
+    def score_stream(
+        self,
+        source,
+        q: float = 0.01,
+        chunksize: int = 100_000,
+        max_candidates: int = 50_000,
+        sketch_k: int = 2048,
+    ) -> dict:
+        """
+        Scores a CSV path (or an iterable of DataFrame chunks) in bounded memory.
+
+        Pass 1 scores every chunk, feeds the scores to a KLL sketch and keeps
+        the `max_candidates` most anomalous rows. The threshold is exact when
+        the bottom q of the stream fits in that buffer, otherwise it comes from
+        the sketch. `anomalies` is a lazy iterator of DataFrame chunks (index =
+        global row position, extra `if_score` column): served from the buffer
+        when it holds every flagged row, else from a second pass over `source`.
+
+        NaN/inf are filled with the calibration medians, so the scores do not
+        depend on `chunksize`. Without a calibration each chunk uses its own
+        medians (as `score()` does for the whole batch).
+        """
+        if not isinstance(source, (str, os.PathLike, pd.DataFrame)):
+            source = iter(source)
+        fixed = self.calibration is not None
+
+        sketch = KLLSketch(k=sketch_k)
+        candidates = None
+        n_rows = 0
+
+        for chunk in self._iter_chunks(source, chunksize):
+            if len(chunk) == 0:
+                continue
+            chunk = chunk.reset_index(drop=True)
+            chunk.index += n_rows
+            n_rows += len(chunk)
+
+            scores = self._if_scores(self._prepare(chunk, fixed=fixed))
+            sketch.update(scores)
+
+            keep = np.arange(len(scores))
+            if len(scores) > max_candidates:
+                keep = np.argpartition(scores, max_candidates - 1)[:max_candidates]
+            part = chunk.iloc[keep].assign(if_score=scores[keep])
+
+            candidates = part if candidates is None else pd.concat([candidates, part])
+            if len(candidates) > max_candidates:
+                candidates = candidates.nsmallest(max_candidates, "if_score")
+
+        if n_rows == 0:
+            raise ValueError("No rows to score")
+
+        buffered = np.sort(candidates["if_score"].to_numpy())
+        threshold = _exact_quantile(buffered, n_rows, q)
+        exact = threshold is not None
+        if not exact:
+            threshold = sketch.quantile(q)
+
+        # the buffer holds the lowest scores, so it is complete for this
+        # threshold if it holds everything or reaches past the threshold
+        complete = len(candidates) == n_rows or buffered[-1] > threshold
+
+        if complete:
+            flagged = candidates[candidates["if_score"] <= threshold].sort_index()
+            anomalies = (
+                flagged.iloc[i:i + chunksize] for i in range(0, len(flagged), chunksize)
+            )
+        elif isinstance(source, (str, os.PathLike, pd.DataFrame)):
+            anomalies = self._second_pass(source, threshold, chunksize, fixed)
+        else:
+            raise ValueError(
+                "Flagged rows do not fit in the candidate buffer and the source "
+                "cannot be re-read; pass a path or raise max_candidates."
+            )
+
+        return {
+            "threshold": float(threshold),
+            "threshold_exact": exact,
+            "n_rows": n_rows,
+            "sketch": sketch,
+            "anomalies": anomalies,
+        }
+
+    def _second_pass(self, source, threshold: float, chunksize: int, fixed: bool):
+        offset = 0
+        for chunk in self._iter_chunks(source, chunksize):
+            if len(chunk) == 0:
+                continue
+            chunk = chunk.reset_index(drop=True)
+            chunk.index += offset
+            offset += len(chunk)
+
+            scores = self._if_scores(self._prepare(chunk, fixed=fixed))
+            mask = scores <= threshold
+            if mask.any():
+                yield chunk[mask].assign(if_score=scores[mask])
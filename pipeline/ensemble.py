@@ -0,0 +1,92 @@
+"""
+Rank-normalized fusion of the anomaly models.
+
+Isolation Forest (decision_function), LOF (decision_function) and KMeans
+(minus the distance to the nearest centroid) score on unrelated scales, all
+with lower = more anomalous. Each score is mapped to a common scale, the share
+of training rows scoring at or below it:
+
+- `reference_cdf`: from the model's reference score distribution (the
+  quantile grid stored in the calibration by scripts/train_models.py);
+  scores beyond the training range continue linearly below 0 / above 1, so
+  rows more extreme than all training traffic keep their order
+- `batch_cdf`: empirical CDF of the batch itself (plain rank
+  normalization), when no reference is available
+
+Normalized scores are then fused with per-model weights:
+
+- `fuse`: weighted mean (one fused score, lower = more anomalous) and the
+  per-model contributions that sum to it
+- `vote`: each model flags the rows at or below quantile q of its own scale;
+  the result is the share of weight flagging each row
+
+Everything is vectorized over rows; the cost on top of the models' inference
+is one interpolation (or one sort) per model.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+ENSEMBLE_MODELS = ("isolation_forest", "lof", "kmeans")
+FUSIONS = ("mean", "vote")
+
+
+def reference_cdf(scores, reference: dict) -> np.ndarray:
+    """Share of reference (training) rows scoring <= each score."""
+    scores = np.asarray(scores, dtype=np.float64)
+    ref_scores = np.asarray(reference["scores"], dtype=np.float64)
+    ref_q = np.asarray(reference["quantiles"], dtype=np.float64)
+
+    p = np.interp(scores, ref_scores, ref_q)
+    span = ref_scores[-1] - ref_scores[0]
+    if span > 0:
+        below = scores < ref_scores[0]
+        above = scores > ref_scores[-1]
+        p[below] = ref_q[0] - (ref_scores[0] - scores[below]) / span
+        p[above] = ref_q[-1] + (scores[above] - ref_scores[-1]) / span
+    return p
+
+
+def batch_cdf(scores) -> np.ndarray:
+    """Share of the batch scoring <= each score (ties share one value)."""
+    scores = np.asarray(scores, dtype=np.float64)
+    return np.searchsorted(np.sort(scores), scores, side="right") / len(scores)
+
+
+def normalize_weights(weights: dict | None, available) -> dict:
+    """
+    Weights of the available models, summing to 1 (None = equal weights).
+    Models without a weight, or not available, are left out.
+    """
+    available = list(available)
+    if weights is None:
+        weights = {name: 1.0 for name in available}
+    unknown = set(weights) - set(ENSEMBLE_MODELS)
+    if unknown:
+        raise ValueError(f"Unknown ensemble models: {sorted(unknown)} (expected {ENSEMBLE_MODELS})")
+    if any(w < 0 for w in weights.values()):
+        raise ValueError("Ensemble weights must be non-negative")
+
+    used = {name: float(weights[name]) for name in available if weights.get(name, 0) > 0}
+    total = sum(used.values())
+    if total <= 0:
+        raise ValueError(f"No weighted model available for the ensemble (available: {available})")
+    return {name: w / total for name, w in used.items()}
+
+
+def fuse(normalized: dict, weights: dict) -> tuple[np.ndarray, dict]:
+    """
+    Weighted mean of the normalized scores. Returns (fused, contributions),
+    contributions[name] = weight * normalized score, summing to fused.
+    """
+    contributions = {name: w * normalized[name] for name, w in weights.items()}
+    fused = np.sum(list(contributions.values()), axis=0)
+    return fused, contributions
+
+
+def vote(normalized: dict, weights: dict, q: float) -> np.ndarray:
+    """Share of the weight whose model puts each row at or below quantile q."""
+    share = np.zeros(len(next(iter(normalized.values()))), dtype=np.float64)
+    for name, w in weights.items():
+        share += w * (normalized[name] <= q)
+    return share
@@ -0,0 +1,182 @@
+"""
+Threshold-sweep evaluation of anomaly scores.
+
+`ScoreCurve` sorts one model's scores once (lower = more anomalous, the
+Detector convention) and keeps cumulative true-positive counts, so the
+confusion matrix at any threshold is a `searchsorted` plus a lookup:
+
+- `sweep(qs)`           metrics at alert quantiles q (same threshold rule as
+                        Detector.score: np.quantile with linear interpolation)
+- `sweep_thresholds(t)` metrics at absolute score thresholds
+- `curve()`             the full curve (one point per distinct score)
+- `label_recall(qs)`    recall of every attack label at the same q values
+- `roc_auc()`, `average_precision()`
+
+Building the curve is O(n log n); each extra operating point is O(log n),
+so sweeping hundreds of thresholds costs about the same as evaluating one.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+BENIGN = "BENIGN"
+
+# q grid used by the evaluation report (0.001% .. 50% of the traffic flagged)
+DEFAULT_QS = np.unique(np.concatenate([np.geomspace(1e-5, 0.5, 200), [0.001, 0.005, 0.01, 0.02, 0.05, 0.1]]))
+
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def attack_mask(labels) -> np.ndarray:
+    """True for every row whose label is not BENIGN."""
+    labels = pd.Series(labels).astype(str).str.strip()
+    return (labels != BENIGN).to_numpy()
+
+
+class ScoreCurve:
+    """
+    Precision / recall / F1 / FPR of one score array against ground truth at
+    every possible threshold. `labels` (optional, per-row label names) enables
+    per-label recall.
+    """
+
+    def __init__(self, scores, y_true, labels=None):
+        scores = np.asarray(scores, dtype=np.float64)
+        y_true = np.asarray(y_true, dtype=bool)
+        if len(scores) != len(y_true):
+            raise ValueError(f"scores ({len(scores)}) and y_true ({len(y_true)}) differ in length")
+        if len(scores) == 0:
+            raise ValueError("No scores to evaluate")
+
+        order = np.argsort(scores, kind="stable")
+        self.scores = scores[order]
+        self.n = len(scores)
+        self.n_pos = int(y_true.sum())
+        self.n_neg = self.n - self.n_pos
+        # tp_cum[k] = attacks among the k most anomalous rows
+        self.tp_cum = np.r_[0, np.cumsum(y_true[order], dtype=np.int64)]
+
+        self.label_names = None
+        self._label_codes = None
+        if labels is not None:
+            names, codes = np.unique(pd.Series(labels).astype(str).str.strip().to_numpy(), return_inverse=True)
+            self.label_names = names
+            self._label_codes = codes.ravel()[order]
+
+    # --------------------------------------------------------------
+    # thresholds
+    # --------------------------------------------------------------
+    def quantile_thresholds(self, qs) -> np.ndarray:
+        """np.quantile(scores, qs) from the sorted array (no re-sort)."""
+        qs = np.clip(np.asarray(qs, dtype=np.float64), 0.0, 1.0)
+        pos = qs * (self.n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, self.n - 1)
+        return self.scores[lo] + (self.scores[hi] - self.scores[lo]) * (pos - lo)
+
+    def flagged(self, thresholds) -> np.ndarray:
+        """Number of rows with score <= threshold, for each threshold."""
+        return np.searchsorted(self.scores, np.asarray(thresholds, dtype=np.float64), side="right")
+
+    # --------------------------------------------------------------
+    # metrics
+    # --------------------------------------------------------------
+    def _metrics(self, k: np.ndarray) -> dict:
+        k = np.asarray(k, dtype=np.int64)
+        tp = self.tp_cum[k]
+        fp = k - tp
+        fn = self.n_pos - tp
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(k > 0, tp / np.maximum(k, 1), 1.0)
+            recall = tp / self.n_pos if self.n_pos else np.zeros(len(k))
+            fpr = fp / self.n_neg if self.n_neg else np.zeros(len(k))
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        return {
+            "alerts": k,
+            "tp": tp,
+            "fp": fp,
+            "fn": fn,
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+            "fpr": fpr,
+            "alerts_per_million": k / self.n * 1e6,
+        }
+
+    def sweep(self, qs=DEFAULT_QS) -> pd.DataFrame:
+        """One row per q: threshold, alerts, tp, fp, fn, precision, recall, f1, fpr, alerts_per_million."""
+        qs = np.asarray(qs, dtype=np.float64)
+        thresholds = self.quantile_thresholds(qs)
+        out = pd.DataFrame({"q": qs, "threshold": thresholds})
+        for name, values in self._metrics(self.flagged(thresholds)).items():
+            out[name] = values
+        return out
+
+    def sweep_thresholds(self, thresholds) -> pd.DataFrame:
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        k = self.flagged(thresholds)
+        out = pd.DataFrame({"q": k / self.n, "threshold": thresholds})
+        for name, values in self._metrics(k).items():
+            out[name] = values
+        return out
+
+    def curve(self, max_points: int | None = None) -> pd.DataFrame:
+        """
+        The full curve: one point per distinct score (flagging every row at or
+        below it). max_points keeps an evenly spaced subset (plots / JSON).
+        """
+        ends = np.r_[np.flatnonzero(np.diff(self.scores)), self.n - 1]
+        if max_points is not None and len(ends) > max_points:
+            ends = ends[np.unique(np.linspace(0, len(ends) - 1, max_points).round().astype(np.int64))]
+        return self.sweep_thresholds(self.scores[ends])
+
+    def roc_auc(self) -> float | None:
+        if not self.n_pos or not self.n_neg:
+            return None
+        c = self.curve()
+        fpr = np.r_[0.0, c["fpr"].to_numpy()]
+        tpr = np.r_[0.0, c["recall"].to_numpy()]
+        return float(_trapezoid(tpr, fpr))
+
+    def average_precision(self) -> float | None:
+        """Step-wise area under the precision/recall curve (sklearn definition)."""
+        if not self.n_pos:
+            return None
+        c = self.curve()
+        recall = np.r_[0.0, c["recall"].to_numpy()]
+        return float(np.sum(np.diff(recall) * c["precision"].to_numpy()))
+
+    def best_f1(self) -> dict:
+        c = self.curve()
+        row = c.iloc[int(c["f1"].to_numpy().argmax())]
+        return {k: float(v) for k, v in row.items()}
+
+    def label_recall(self, qs=(0.001, 0.01, 0.05)) -> pd.DataFrame:
+        """
+        Rows = labels (with their row count), columns = recall at each q
+        (share of that label's rows flagged).
+        """
+        if self._label_codes is None:
+            raise ValueError("ScoreCurve was built without labels")
+        k = self.flagged(self.quantile_thresholds(qs))
+        out = {}
+        for code, name in enumerate(self.label_names):
+            hits = np.r_[0, np.cumsum(self._label_codes == code, dtype=np.int64)]
+            total = hits[-1]
+            out[name] = [total] + (hits[k] / max(total, 1)).tolist()
+        columns = ["rows"] + [f"q={q:g}" for q in qs]
+        frame = pd.DataFrame.from_dict(out, orient="index", columns=columns)
+        frame["rows"] = frame["rows"].astype(np.int64)
+        return frame.sort_values("rows", ascending=False)
+
+    def summary(self, qs=(0.001, 0.01, 0.05)) -> dict:
+        ops = self.sweep(qs)
+        return {
+            "n_rows": self.n,
+            "n_attacks": self.n_pos,
+            "roc_auc": self.roc_auc(),
+            "average_precision": self.average_precision(),
+            "best_f1": self.best_f1(),
+            "operating_points": ops.to_dict(orient="records"),
+        }
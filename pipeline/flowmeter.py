@@ -0,0 +1,551 @@
+"""
+Incremental flow meter: CICIDS-style flow features from packets.
+
+- `PcapReader` parses classic libpcap files (Ethernet / raw IP / Linux SLL,
+  IPv4 and IPv6, TCP and UDP) straight out of a memory map with
+  `struct.unpack_from`; packet bytes are never copied.
+- `FlowMeter` keeps a flow table keyed by the bidirectional 5-tuple. Each
+  flow is a `__slots__` record whose statistics (packet lengths, IATs,
+  active / idle periods) are Welford accumulators updated per packet, so a
+  flow costs the same memory whether it has 2 packets or 2 million.
+- Flows are emitted on TCP FIN (both directions) / RST, on the active
+  timeout (flow older than `active_timeout`) and on the idle timeout; the
+  table is bounded by `max_flows` (least recently seen flows are evicted,
+  i.e. emitted early).
+- Emitted flows become rows in feature_columns.json order
+  (`FlowMeter.features`, `flow_frames`), ready for `Detector.score`.
+
+Conventions follow CICFlowMeter (which produced the CICIDS2017 CSVs): times
+in microseconds, packet length = transport payload, header length = TCP/UDP
+header, sample standard deviations, Infinity/NaN rates for zero-length
+flows. Bulk features are always 0 (they are almost always 0 in CICIDS2017
+too).
+"""
+from __future__ import annotations
+
+import os
+import json
+import mmap
+import math
+import socket
+import struct
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATS_PATH = os.path.join(BASE_DIR, "models", "feature_columns.json")
+
+# pcap link types
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (101, 228, 229)
+LINKTYPE_LINUX_SLL = 113
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+# TCP flag bits, in the order of the *Flag Count features
+FIN, SYN, RST, PSH, ACK, URG, ECE, CWR = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80
+FLAG_BITS = (FIN, SYN, RST, PSH, ACK, URG, CWR, ECE)
+
+META_COLUMNS = ["Flow ID", "Source IP", "Source Port", "Destination IP", "Protocol", "Timestamp"]
+
+
+class Packet:
+    __slots__ = ("ts", "src", "dst", "sport", "dport", "proto", "length", "header", "flags", "window")
+
+    def __init__(self, ts, src, dst, sport, dport, proto, length, header, flags, window):
+        self.ts = ts            # seconds (float)
+        self.src = src          # raw address bytes
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.proto = proto
+        self.length = length    # transport payload bytes
+        self.header = header    # transport header bytes
+        self.flags = flags
+        self.window = window
+
+
+class PcapReader:
+    """
+    Iterates the TCP/UDP packets of a classic pcap file (not pcapng).
+    `n_skipped` counts records that were not IPv4/IPv6 TCP/UDP.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._map)
+
+        magic = self._buf[:4].tobytes()
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            self._endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            self._endian = ">"
+        else:
+            self.close()
+            raise ValueError(f"Not a classic pcap file: {path}")
+        self._ts_div = 1e9 if magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e6
+        self.linktype = struct.unpack_from(self._endian + "I", self._buf, 20)[0]
+        self.n_skipped = 0
+
+    def close(self) -> None:
+        if self._buf is not None:
+            self._buf.release()
+            self._map.close()
+            self._file.close()
+            self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        buf = self._buf
+        rec = struct.Struct(self._endian + "IIII")
+        end = len(buf)
+        pos = 24
+        ts_div = self._ts_div
+        parse = self._parse
+
+        while pos + 16 <= end:
+            sec, frac, caplen, _ = rec.unpack_from(buf, pos)
+            pos += 16
+            if pos + caplen > end:
+                break  # truncated capture
+            pkt = parse(buf, pos, pos + caplen, sec + frac / ts_div)
+            pos += caplen
+            if pkt is None:
+                self.n_skipped += 1
+            else:
+                yield pkt
+
+    def _parse(self, buf, start: int, stop: int, ts: float):
+        lt = self.linktype
+        if lt == LINKTYPE_ETHERNET:
+            if stop - start < 14:
+                return None
+            off = start + 12
+            ethertype = struct.unpack_from("!H", buf, off)[0]
+            off += 2
+            while ethertype in (0x8100, 0x88A8) and off + 4 <= stop:  # VLAN tags
+                ethertype = struct.unpack_from("!H", buf, off + 2)[0]
+                off += 4
+        elif lt == LINKTYPE_LINUX_SLL:
+            if stop - start < 16:
+                return None
+            ethertype = struct.unpack_from("!H", buf, start + 14)[0]
+            off = start + 16
+        elif lt in LINKTYPE_RAW:
+            if stop - start < 1:
+                return None
+            ethertype = 0x0800 if buf[start] >> 4 == 4 else 0x86DD
+            off = start
+        else:
+            return None
+
+        if ethertype == 0x0800:
+            if stop - off < 20:
+                return None
+            ihl = (buf[off] & 0x0F) * 4
+            total_len, frag = struct.unpack_from("!H2xH", buf, off + 2)
+            if frag & 0x1FFF:
+                return None  # non-first fragment: no transport header
+            proto = buf[off + 9]
+            src = buf[off + 12:off + 16].tobytes()
+            dst = buf[off + 16:off + 20].tobytes()
+            l4 = off + ihl
+            l4_len = total_len - ihl
+        elif ethertype == 0x86DD:
+            if stop - off < 40:
+                return None
+            payload_len = struct.unpack_from("!H", buf, off + 4)[0]
+            proto = buf[off + 6]
+            src = buf[off + 8:off + 24].tobytes()
+            dst = buf[off + 24:off + 40].tobytes()
+            l4 = off + 40
+            l4_len = payload_len
+        else:
+            return None
+
+        if proto == PROTO_TCP:
+            if stop - l4 < 20:
+                return None
+            sport, dport, offset_flags, flags, window = struct.unpack_from("!HH8xBBH", buf, l4)
+            header = (offset_flags >> 4) * 4
+            return Packet(ts, src, dst, sport, dport, proto, max(l4_len - header, 0), header, flags, window)
+        if proto == PROTO_UDP:
+            if stop - l4 < 8:
+                return None
+            sport, dport, udp_len = struct.unpack_from("!HHH", buf, l4)
+            return Packet(ts, src, dst, sport, dport, proto, max(udp_len - 8, 0), 8, 0, -1)
+        return None
+
+
+def read_pcap(path: str):
+    """Yields the TCP/UDP packets of a pcap file."""
+    with PcapReader(path) as reader:
+        yield from reader
+
+
+class Welford:
+    """Running count / sum / mean / variance / min / max."""
+
+    __slots__ = ("n", "total", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if self.n == 1:
+            self.min = self.max = x
+        elif x < self.min:
+            self.min = x
+        elif x > self.max:
+            self.max = x
+
+    @property
+    def var(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+
+class Flow:
+    __slots__ = (
+        "src", "dst", "sport", "dport", "proto", "first", "last",
+        "fwd_len", "bwd_len", "all_len", "flow_iat", "fwd_iat", "bwd_iat",
+        "fwd_last", "bwd_last", "fwd_hdr", "bwd_hdr", "dir_flags", "flags",
+        "init_win_fwd", "init_win_bwd", "act_data_fwd", "min_seg_fwd",
+        "active", "idle", "active_start", "active_end",
+        "subflows", "fin_fwd", "fin_bwd",
+    )
+
+    def __init__(self, pkt: Packet):
+        self.src, self.dst = pkt.src, pkt.dst
+        self.sport, self.dport = pkt.sport, pkt.dport
+        self.proto = pkt.proto
+        self.first = self.last = pkt.ts
+        self.fwd_len, self.bwd_len, self.all_len = Welford(), Welford(), Welford()
+        self.flow_iat, self.fwd_iat, self.bwd_iat = Welford(), Welford(), Welford()
+        self.fwd_last = self.bwd_last = None
+        self.fwd_hdr = self.bwd_hdr = 0
+        # fwd PSH, bwd PSH, fwd URG, bwd URG
+        self.dir_flags = array("l", [0, 0, 0, 0])
+        # FIN SYN RST PSH ACK URG CWR ECE counts
+        self.flags = array("l", [0] * 8)
+        self.init_win_fwd = self.init_win_bwd = -1
+        self.act_data_fwd = 0
+        self.min_seg_fwd = 0
+        self.active, self.idle = Welford(), Welford()
+        self.active_start = self.active_end = pkt.ts
+        self.subflows = 1
+        self.fin_fwd = self.fin_bwd = False
+
+
+def _flow_key(pkt: Packet) -> tuple:
+    a, b = (pkt.src, pkt.sport), (pkt.dst, pkt.dport)
+    return (pkt.proto,) + (a + b if a <= b else b + a)
+
+
+def _rate(count: float, seconds: float) -> float:
+    # CICFlowMeter divides by zero for zero-length flows (Infinity / NaN)
+    if seconds > 0:
+        return count / seconds
+    return math.inf if count else math.nan
+
+
+class FlowMeter:
+    """
+    Streaming flow aggregation. Feed packets with `update` (returns the flows
+    it finished) or run a whole iterator with `process`; `flush` finishes
+    whatever is left.
+    """
+
+    def __init__(
+        self,
+        feature_columns: list | None = None,
+        active_timeout: float = 120.0,
+        idle_timeout: float = 60.0,
+        activity_timeout: float = 5.0,
+        subflow_gap: float = 1.0,
+        max_flows: int = 200_000,
+    ):
+        if feature_columns is None:
+            with open(FEATS_PATH, "r", encoding="utf-8") as f:
+                feature_columns = json.load(f)
+        self.feature_columns = list(feature_columns)
+        self.active_timeout = active_timeout
+        self.idle_timeout = idle_timeout
+        self.activity_timeout = activity_timeout
+        self.subflow_gap = subflow_gap
+        self.max_flows = max_flows
+
+        # insertion order == last-seen order (move_to_end on every packet)
+        self.flows = OrderedDict()
+        self.stats = {"packets": 0, "flows": 0, "evicted": 0, "timed_out": 0}
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def update(self, pkt: Packet) -> list:
+        self.stats["packets"] += 1
+        done = self._expire(pkt.ts)
+
+        key = _flow_key(pkt)
+        flow = self.flows.get(key)
+        if flow is not None and pkt.ts - flow.first > self.active_timeout:
+            done.append(self._finish(key))
+            self.stats["timed_out"] += 1
+            flow = None
+
+        if flow is None:
+            if len(self.flows) >= self.max_flows:
+                # bounded table: the least recently seen flow goes first
+                oldest = next(iter(self.flows))
+                done.append(self._finish(oldest))
+                self.stats["evicted"] += 1
+            flow = self.flows[key] = Flow(pkt)
+            self._add(flow, pkt, forward=True, first=True)
+        else:
+            self.flows.move_to_end(key)
+            forward = pkt.src == flow.src and pkt.sport == flow.sport
+            self._add(flow, pkt, forward, first=False)
+
+        if pkt.flags & RST or (flow.fin_fwd and flow.fin_bwd):
+            done.append(self._finish(key))
+        return done
+
+    def process(self, packets):
+        """Yields finished flows for a whole packet iterator (then flushes)."""
+        for pkt in packets:
+            yield from self.update(pkt)
+        yield from self.flush()
+
+    def flush(self) -> list:
+        return [self._finish(key) for key in list(self.flows)]
+
+    def _expire(self, now: float) -> list:
+        done = []
+        while self.flows:
+            key, flow = next(iter(self.flows.items()))
+            if now - flow.last <= self.idle_timeout:
+                break
+            done.append(self._finish(key))
+            self.stats["timed_out"] += 1
+        return done
+
+    def _finish(self, key) -> Flow:
+        flow = self.flows.pop(key)
+        if flow.active_end - flow.active_start > 0:
+            flow.active.add((flow.active_end - flow.active_start) * 1e6)
+        self.stats["flows"] += 1
+        return flow
+
+    def _add(self, flow: Flow, pkt: Packet, forward: bool, first: bool) -> None:
+        ts = pkt.ts
+        length = pkt.length
+
+        if not first:
+            gap = ts - flow.last
+            flow.flow_iat.add(gap * 1e6)
+            if gap > self.subflow_gap:
+                flow.subflows += 1
+            # active / idle periods
+            if ts - flow.active_end > self.activity_timeout:
+                if flow.active_end - flow.active_start > 0:
+                    flow.active.add((flow.active_end - flow.active_start) * 1e6)
+                flow.idle.add((ts - flow.active_end) * 1e6)
+                flow.active_start = ts
+            flow.active_end = ts
+        flow.last = ts
+        flow.all_len.add(length)
+
+        if forward:
+            flow.fwd_len.add(length)
+            if flow.fwd_last is not None:
+                flow.fwd_iat.add((ts - flow.fwd_last) * 1e6)
+            flow.fwd_last = ts
+            flow.fwd_hdr += pkt.header
+            if flow.fwd_len.n == 1:
+                flow.init_win_fwd = pkt.window
+                flow.min_seg_fwd = pkt.header
+            elif pkt.header < flow.min_seg_fwd:
+                flow.min_seg_fwd = pkt.header
+            if length >= 1:
+                flow.act_data_fwd += 1
+        else:
+            flow.bwd_len.add(length)
+            if flow.bwd_last is not None:
+                flow.bwd_iat.add((ts - flow.bwd_last) * 1e6)
+            flow.bwd_last = ts
+            flow.bwd_hdr += pkt.header
+            if flow.bwd_len.n == 1:
+                flow.init_win_bwd = pkt.window
+
+        flags = pkt.flags
+        if flags:
+            if flags & PSH:
+                flow.dir_flags[0 if forward else 1] += 1
+            if flags & URG:
+                flow.dir_flags[2 if forward else 3] += 1
+            counts = flow.flags
+            for i, bit in enumerate(FLAG_BITS):
+                if flags & bit:
+                    counts[i] += 1
+            if flags & FIN:
+                if forward:
+                    flow.fin_fwd = True
+                else:
+                    flow.fin_bwd = True
+
+    # --------------------------------------------------------------
+    # output
+    # --------------------------------------------------------------
+    def feature_dict(self, flow: Flow) -> dict:
+        duration = (flow.last - flow.first) * 1e6
+        seconds = duration / 1e6
+        fwd, bwd, pkts = flow.fwd_len, flow.bwd_len, flow.all_len
+        fl = flow.flags
+        n_pkts = pkts.n
+
+        return {
+            "Destination Port": flow.dport,
+            "Flow Duration": duration,
+            "Total Fwd Packets": fwd.n,
+            "Total Backward Packets": bwd.n,
+            "Total Length of Fwd Packets": fwd.total,
+            "Total Length of Bwd Packets": bwd.total,
+            "Fwd Packet Length Max": fwd.max,
+            "Fwd Packet Length Min": fwd.min,
+            "Fwd Packet Length Mean": fwd.mean,
+            "Fwd Packet Length Std": fwd.std,
+            "Bwd Packet Length Max": bwd.max,
+            "Bwd Packet Length Min": bwd.min,
+            "Bwd Packet Length Mean": bwd.mean,
+            "Bwd Packet Length Std": bwd.std,
+            "Flow Bytes/s": _rate(pkts.total, seconds),
+            "Flow Packets/s": _rate(n_pkts, seconds),
+            "Flow IAT Mean": flow.flow_iat.mean,
+            "Flow IAT Std": flow.flow_iat.std,
+            "Flow IAT Max": flow.flow_iat.max,
+            "Flow IAT Min": flow.flow_iat.min,
+            "Fwd IAT Total": flow.fwd_iat.total,
+            "Fwd IAT Mean": flow.fwd_iat.mean,
+            "Fwd IAT Std": flow.fwd_iat.std,
+            "Fwd IAT Max": flow.fwd_iat.max,
+            "Fwd IAT Min": flow.fwd_iat.min,
+            "Bwd IAT Total": flow.bwd_iat.total,
+            "Bwd IAT Mean": flow.bwd_iat.mean,
+            "Bwd IAT Std": flow.bwd_iat.std,
+            "Bwd IAT Max": flow.bwd_iat.max,
+            "Bwd IAT Min": flow.bwd_iat.min,
+            "Fwd PSH Flags": flow.dir_flags[0],
+            "Bwd PSH Flags": flow.dir_flags[1],
+            "Fwd URG Flags": flow.dir_flags[2],
+            "Bwd URG Flags": flow.dir_flags[3],
+            "Fwd Header Length": flow.fwd_hdr,
+            "Bwd Header Length": flow.bwd_hdr,
+            "Fwd Packets/s": _rate(fwd.n, seconds),
+            "Bwd Packets/s": _rate(bwd.n, seconds),
+            "Min Packet Length": pkts.min,
+            "Max Packet Length": pkts.max,
+            "Packet Length Mean": pkts.mean,
+            "Packet Length Std": pkts.std,
+            "Packet Length Variance": pkts.var,
+            "FIN Flag Count": fl[0],
+            "SYN Flag Count": fl[1],
+            "RST Flag Count": fl[2],
+            "PSH Flag Count": fl[3],
+            "ACK Flag Count": fl[4],
+            "URG Flag Count": fl[5],
+            "CWE Flag Count": fl[6],
+            "ECE Flag Count": fl[7],
+            "Down/Up Ratio": bwd.n // fwd.n if fwd.n else 0,
+            "Average Packet Size": pkts.total / n_pkts if n_pkts else 0.0,
+            "Avg Fwd Segment Size": fwd.mean,
+            "Avg Bwd Segment Size": bwd.mean,
+            "Fwd Header Length.1": flow.fwd_hdr,
+            "Fwd Avg Bytes/Bulk": 0,
+            "Fwd Avg Packets/Bulk": 0,
+            "Fwd Avg Bulk Rate": 0,
+            "Bwd Avg Bytes/Bulk": 0,
+            "Bwd Avg Packets/Bulk": 0,
+            "Bwd Avg Bulk Rate": 0,
+            "Subflow Fwd Packets": fwd.n / flow.subflows,
+            "Subflow Fwd Bytes": fwd.total / flow.subflows,
+            "Subflow Bwd Packets": bwd.n / flow.subflows,
+            "Subflow Bwd Bytes": bwd.total / flow.subflows,
+            "Init_Win_bytes_forward": flow.init_win_fwd,
+            "Init_Win_bytes_backward": flow.init_win_bwd,
+            "act_data_pkt_fwd": flow.act_data_fwd,
+            "min_seg_size_forward": flow.min_seg_fwd,
+            "Active Mean": flow.active.mean,
+            "Active Std": flow.active.std,
+            "Active Max": flow.active.max,
+            "Active Min": flow.active.min,
+            "Idle Mean": flow.idle.mean,
+            "Idle Std": flow.idle.std,
+            "Idle Max": flow.idle.max,
+            "Idle Min": flow.idle.min,
+        }
+
+    def features(self, flow: Flow) -> np.ndarray:
+        """One row in feature_columns order (unknown columns are NaN)."""
+        d = self.feature_dict(flow)
+        return np.array([d.get(c, np.nan) for c in self.feature_columns], dtype=np.float64)
+
+    @staticmethod
+    def meta(flow: Flow) -> list:
+        family = socket.AF_INET if len(flow.src) == 4 else socket.AF_INET6
+        src = socket.inet_ntop(family, flow.src)
+        dst = socket.inet_ntop(family, flow.dst)
+        return [
+            f"{src}-{dst}-{flow.sport}-{flow.dport}-{flow.proto}",
+            src,
+            flow.sport,
+            dst,
+            flow.proto,
+            pd.Timestamp(flow.first, unit="s"),
+        ]
+
+
+def flow_frames(packets, meter: FlowMeter | None = None, batch_size: int = 10_000):
+    """
+    Yields DataFrames of finished flows (META_COLUMNS + feature columns),
+    `batch_size` flows at a time. Detector.score ignores the extra columns.
+    """
+    meter = meter if meter is not None else FlowMeter()
+    rows, metas = [], []
+    for flow in meter.process(packets):
+        rows.append(meter.features(flow))
+        metas.append(meter.meta(flow))
+        if len(rows) >= batch_size:
+            yield _frame(meter, rows, metas)
+            rows, metas = [], []
+    if rows:
+        yield _frame(meter, rows, metas)
+
+
+def _frame(meter: FlowMeter, rows: list, metas: list) -> pd.DataFrame:
+    features = pd.DataFrame(np.vstack(rows), columns=meter.feature_columns)
+    meta = pd.DataFrame(metas, columns=META_COLUMNS)
+    return pd.concat([meta, features], axis=1)
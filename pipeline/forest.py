@@ -0,0 +1,232 @@
+"""
+Compiled Isolation Forest scorer.
+
+The pickled sklearn forest walks every tree separately on each call. Here the
+fitted trees are flattened once into NumPy arrays (feature, threshold, children
+and leaf depth for all trees), and a whole batch is scored by advancing every
+(row, tree) pair one level at a time. Scores match
+``IsolationForest.decision_function`` to float tolerance, NaN inputs included
+(each split sends NaN to the child sklearn recorded in
+``tree_.missing_go_to_left``).
+"""
+from __future__ import annotations
+
+import numpy as np
+
+# Rows scored per traversal block (bounds the (rows x trees) index matrix)
+BLOCK_ROWS = 2048
+
+
+def average_path_length(n_samples) -> np.ndarray:
+    """
+    Average path length of an unsuccessful BST search over n samples,
+    i.e. the depth correction c(n) used by Isolation Forest.
+    """
+    n = np.asarray(n_samples, dtype=np.float64)
+    out = np.zeros_like(n)
+
+    mask_2 = n == 2
+    mask_n = n > 2
+
+    out[mask_2] = 1.0
+    out[mask_n] = (
+        2.0 * (np.log(n[mask_n] - 1.0) + np.euler_gamma)
+        - 2.0 * (n[mask_n] - 1.0) / n[mask_n]
+    )
+    return out
+
+
+def _float32_floor(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 <= threshold, so `x32 > t32` gives the same answer as
+    sklearn's `x32 <= t64` test without upcasting every comparison.
+    """
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+class CompiledForest:
+    """
+    Flat, array-backed copy of a fitted IsolationForest.
+
+    Nodes of each tree are renumbered breadth-first so that the right child
+    always sits right after the left one (`child + went_right`). Leaves point
+    to themselves with an infinite threshold, so a (row, tree) pair that
+    reaches a leaf early stays there until the deepest tree is done.
+
+    `missing_right` marks the splits that send NaN to the right child; when it
+    is None (forests flattened before it was recorded) NaN always goes left.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        child: np.ndarray,
+        leaf_value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        denominator: float,
+        offset: float,
+        n_features: int,
+        depth: np.ndarray | None = None,
+        n_node_samples: np.ndarray | None = None,
+        missing_right: np.ndarray | None = None,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.child = child
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.denominator = float(denominator)
+        self.offset = float(offset)
+        self.n_features = int(n_features)
+        self.depth = depth
+        self.n_node_samples = n_node_samples
+        self.missing_right = missing_right
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def is_leaf(self) -> np.ndarray:
+        return self.child == np.arange(len(self.child))
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        """
+        Builds the flat arrays from a fitted sklearn IsolationForest.
+        """
+        parts = {k: [] for k in ("feature", "threshold", "child", "leaf_value", "depth", "samples", "missing_right")}
+        roots = []
+        max_depth = 0
+        base = 0
+
+        for tree, tree_features in zip(model.estimators_, model.estimators_features_):
+            t = tree.tree_
+            left, right = t.children_left, t.children_right
+
+            # breadth-first renumbering: order[new_id] = old_id
+            order = [0]
+            depth = [0]
+            child = []
+            i = 0
+            while i < len(order):
+                old = order[i]
+                if left[old] == -1:
+                    child.append(i)
+                else:
+                    child.append(len(order))
+                    order += [left[old], right[old]]
+                    depth += [depth[i] + 1, depth[i] + 1]
+                i += 1
+
+            order = np.asarray(order, dtype=np.int64)
+            depth = np.asarray(depth, dtype=np.int64)
+            is_leaf = left[order] == -1
+            samples = t.n_node_samples[order]
+
+            parts["feature"].append(
+                np.where(is_leaf, 0, np.asarray(tree_features)[np.maximum(t.feature[order], 0)])
+            )
+            parts["threshold"].append(np.where(is_leaf, np.inf, t.threshold[order]))
+            parts["child"].append(np.asarray(child, dtype=np.int64) + base)
+            parts["leaf_value"].append(
+                np.where(is_leaf, depth + average_path_length(samples), 0.0)
+            )
+            parts["depth"].append(depth)
+            parts["samples"].append(samples)
+            parts["missing_right"].append(~is_leaf & (t.missing_go_to_left[order] == 0))
+            roots.append(base)
+
+            max_depth = max(max_depth, int(depth.max()))
+            base += len(order)
+
+        denominator = len(model.estimators_) * float(
+            average_path_length([model.max_samples_])[0]
+        )
+
+        return cls(
+            feature=np.concatenate(parts["feature"]).astype(np.intp),
+            threshold=_float32_floor(np.concatenate(parts["threshold"]).astype(np.float64)),
+            child=np.concatenate(parts["child"]).astype(np.intp),
+            leaf_value=np.concatenate(parts["leaf_value"]).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            denominator=denominator,
+            offset=model.offset_,
+            n_features=model.n_features_in_,
+            depth=np.concatenate(parts["depth"]).astype(np.int32),
+            n_node_samples=np.concatenate(parts["samples"]).astype(np.int32),
+            missing_right=np.concatenate(parts["missing_right"]).astype(np.bool_),
+        )
+
+    def _as_matrix(self, X) -> np.ndarray:
+        # trees were grown on float32 inputs, compare the same way sklearn does
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected a 2D array with {self.n_features} features, got shape {X.shape}"
+            )
+        return X
+
+    def _leaves_block(self, block: np.ndarray) -> np.ndarray:
+        n_rows = block.shape[0]
+        flat = block.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * self.n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        # NaN compares False, i.e. goes left, unless the split says otherwise
+        route_nan = self.missing_right is not None and np.isnan(flat).any()
+
+        for _ in range(self.max_depth):
+            idx = np.take(self.feature, node)
+            idx += row_offset
+            x = np.take(flat, idx)
+            went_right = x > np.take(self.threshold, node)
+            if route_nan:
+                went_right |= np.isnan(x) & np.take(self.missing_right, node)
+            node = np.take(self.child, node)
+            node += went_right
+
+        return node
+
+    def leaves(self, X) -> np.ndarray:
+        """
+        Returns the global leaf index reached by each row in each tree,
+        shape (n_rows, n_trees).
+        """
+        X = self._as_matrix(X)
+        nodes = np.empty((X.shape[0], self.n_trees), dtype=np.intp)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            nodes[start:start + BLOCK_ROWS] = self._leaves_block(X[start:start + BLOCK_ROWS])
+        return nodes
+
+    def path_lengths(self, X) -> np.ndarray:
+        """
+        Sum over trees of the (corrected) path length of each row.
+        """
+        X = self._as_matrix(X)
+        depths = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            leaves = self._leaves_block(X[start:start + BLOCK_ROWS])
+            depths[start:start + BLOCK_ROWS] = np.take(self.leaf_value, leaves).sum(axis=1)
+        return depths
+
+    def score_samples(self, X) -> np.ndarray:
+        """
+        Same convention as sklearn: the lower, the more abnormal.
+        """
+        depths = self.path_lengths(X)
+        if self.denominator == 0:
+            return -np.ones_like(depths)
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X) -> np.ndarray:
+        """
+        Same convention as sklearn: negative scores are outliers.
+        """
+        return self.score_samples(X) - self.offset
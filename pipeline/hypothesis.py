@@ -9,6 +9,30 @@ Important notes:
 - It provides an interpretable hypothesis for analysts.
 - Uncertainty is explicitly handled via the 'Unknown' category.
 """
+import numpy as np
+
+# --- Reconnaissance / Scanning ---
+RECON_INDICATORS = {
+    "Destination Port",
+    "Flow IAT Mean",
+    "Flow IAT Std",
+    "Flow IAT Max"
+}
+
+# --- DoS-like behavior ---
+DOS_INDICATORS = {
+    "Flow Bytes/s",
+    "Flow Packets/s",
+    "Fwd Packets/s",
+    "Bwd Packets/s"
+}
+
+# hypothesis types in rule order (index = code of hypothesis_codes)
+HYPOTHESIS_TYPES = np.array(
+    ["Reconnaissance / Scanning", "DoS-like Behavior", "Unknown / Unclassified"],
+    dtype=object,
+)
+
 
 def infer_attack_hypothesis(top_features, severity):
     """
@@ -34,14 +58,7 @@ def infer_attack_hypothesis(top_features, severity):
     features = set(top_features)
 
     # --- Reconnaissance / Scanning ---
-    recon_indicators = {
-        "Destination Port",
-        "Flow IAT Mean",
-        "Flow IAT Std",
-        "Flow IAT Max"
-    }
-
-    if features & recon_indicators:
+    if features & RECON_INDICATORS:
         return {
             "type": "Reconnaissance / Scanning",
             "confidence": "Medium",
@@ -52,14 +69,7 @@ def infer_attack_hypothesis(top_features, severity):
         }
 
     # --- DoS-like behavior ---
-    dos_indicators = {
-        "Flow Bytes/s",
-        "Flow Packets/s",
-        "Fwd Packets/s",
-        "Bwd Packets/s"
-    }
-
-    if features & dos_indicators:
+    if features & DOS_INDICATORS:
         return {
             "type": "DoS-like Behavior",
             "confidence": "High" if severity in ["High", "Medium"] else "Low",
@@ -77,4 +87,24 @@ def infer_attack_hypothesis(top_features, severity):
             "The observed behavior does not clearly match known attack patterns "
             "and requires further investigation."
         )
-    }
\ No newline at end of file
+    }
+
+
+def hypothesis_codes(top_features) -> np.ndarray:
+    """
+    Vectorized hypothesis type for many alerts at once.
+
+    top_features: (n_alerts, k) array of feature names (AlertBatch.top_features).
+    Returns codes into HYPOTHESIS_TYPES; the type does not depend on
+    severity (only the confidence does), so this matches
+    infer_attack_hypothesis(...)["type"] row by row.
+    """
+    top = np.asarray(top_features, dtype=object)
+    if top.ndim == 1:
+        top = top[:, None]
+    codes = np.full(len(top), 2, dtype=np.int8)
+    if top.size == 0:
+        return codes
+    codes[np.isin(top, list(DOS_INDICATORS)).any(axis=1)] = 1
+    codes[np.isin(top, list(RECON_INDICATORS)).any(axis=1)] = 0
+    return codes
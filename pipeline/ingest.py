@@ -2,6 +2,41 @@ import re
 import pandas as pd
 import numpy as np
 
+# نمط واحد مجمّع لكل الحقول (بدل re.search منفصل لكل ميزة)
+FIELD_TAGS = {
+    'PORT': 'Destination Port',
+    'DUR': 'Flow Duration',
+    'FWD': 'Total Fwd Packets',
+    'BACK': 'Total Backward Packets',
+}
+COMBINED_PATTERN = re.compile(r"(PORT|DUR|FWD|BACK):(\d+)")
+
+# أسطر لكل دفعة في extract_stream
+STREAM_CHUNK_LINES = 65_536
+
+
+class LogBatch:
+    """
+    Features of many log lines: a float32 matrix (rows x expected_features)
+    plus the position of each row's source line. Lines without any known
+    field are counted in `n_malformed` and have no row.
+    """
+
+    def __init__(self, X, line_numbers, n_lines, n_malformed, columns):
+        self.X = X
+        self.line_numbers = line_numbers
+        self.n_lines = n_lines
+        self.n_malformed = n_malformed
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.X)
+
+    def to_frame(self):
+        # one DataFrame per batch (not per line), sharing the matrix memory
+        return pd.DataFrame(self.X, columns=self.columns, index=self.line_numbers, copy=False)
+
+
 class LogProcessor:
     def __init__(self, expected_features):
         self.expected_features = expected_features
@@ -12,6 +47,11 @@ class LogProcessor:
             'Total Fwd Packets': r"FWD:(\d+)",
             'Total Backward Packets': r"BACK:(\d+)"
         }
+        # عمود كل وسم داخل المصفوفة (الوسوم غير الموجودة في expected_features تُتجاهل)
+        position = {feat: i for i, feat in enumerate(expected_features)}
+        self._tag_column = {
+            tag: position[feat] for tag, feat in FIELD_TAGS.items() if feat in position
+        }
 
     def extract_features(self, raw_text):
         # إنشاء سطر مليء بالأصفار لكل الـ 78 ميزة
@@ -23,5 +63,64 @@ class LogProcessor:
             match = re.search(pattern, raw_text)
             if match and feature in self.expected_features:
                 df[feature] = int(match.group(1))
-        
-        return df
\ No newline at end of file
+
+        return df
+
+    def extract_many(self, lines, first_line=0):
+        """
+        Parses many log lines in one pass into a LogBatch (float32 matrix in
+        expected_features order). Same rules as extract_features: the first
+        occurrence of each field wins and missing fields are 0.
+        """
+        if not isinstance(lines, list):
+            lines = list(lines)
+
+        X = np.zeros((len(lines), len(self.expected_features)), dtype=np.float32)
+        keep = np.zeros(len(lines), dtype=bool)
+        findall = COMBINED_PATTERN.findall
+        tag_column = self._tag_column
+
+        for i, line in enumerate(lines):
+            fields = findall(line)
+            if not fields:
+                continue
+            row = X[i]
+            seen = set()
+            for tag, value in fields:
+                col = tag_column.get(tag)
+                if col is not None and tag not in seen:
+                    seen.add(tag)
+                    row[col] = float(value)
+            keep[i] = bool(seen)
+
+        rows = np.flatnonzero(keep)
+        X = X[rows] if len(rows) < len(lines) else X
+        return LogBatch(
+            X=X,
+            line_numbers=rows + first_line,
+            n_lines=len(lines),
+            n_malformed=len(lines) - len(rows),
+            columns=list(self.expected_features),
+        )
+
+    def extract_stream(self, source, chunk_lines=STREAM_CHUNK_LINES):
+        """
+        Reads a log file (path or open text file) lazily and yields one
+        LogBatch per `chunk_lines` lines, ready for Detector
+        (`detector.score(batch.to_frame(), fixed_threshold=True)`).
+        """
+        f = open(source, "r", encoding="utf-8", errors="replace") if isinstance(source, str) else source
+        try:
+            offset = 0
+            chunk = []
+            for line in f:
+                chunk.append(line)
+                if len(chunk) >= chunk_lines:
+                    yield self.extract_many(chunk, first_line=offset)
+                    offset += len(chunk)
+                    chunk = []
+            if chunk:
+                yield self.extract_many(chunk, first_line=offset)
+        finally:
+            if f is not source:
+                f.close()
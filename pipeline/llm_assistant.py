@@ -1,6 +1,8 @@
 from __future__ import annotations
 from typing import Dict, List, Tuple
 
+from pipeline.metrics import timed
+
 
 def _infer_attack_and_confidence(top_features: List[str], score: float | None, threshold: float | None) -> Tuple[str, str, List[str]]:
     """
@@ -117,6 +119,7 @@ def _playbook(pred_type: str, severity: str) -> Dict[str, List[str]]:
     return {"triage_steps": triage, "recommended_actions": actions}
 
 
+@timed("assistant.explain_alert", memory=False)
 def explain_alert(alert: Dict) -> Dict:
     """
     Assistant layer:
@@ -0,0 +1,267 @@
+"""
+Persistent LLM response cache + one shared OpenAI client.
+
+Responses are stored in SQLite, keyed by a normalized alert signature
+(hypothesis, severity, sorted top features, model name, prompt template
+version, ids of the related texts put in the prompt) rather than by the
+exact prompt, so a repeated or equivalent alert is answered from disk with no
+API call. Entries expire after `ttl` seconds and the least recently used ones
+are evicted above `max_entries`. Concurrent misses on the same key are
+coalesced: one request goes out, the other callers wait for its answer.
+
+The client honours the usual OPENAI_API_KEY / OPENAI_BASE_URL environment
+variables, so a local stand-in server can be used by pointing the base URL
+at it.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from pipeline.metrics import inc, stage
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.path.join(BASE_DIR, "data", "cache", "llm_responses.sqlite")
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5_000
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+# (cache, key) -> Event set when the request for that key is done
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+class NoClient(RuntimeError):
+    """No cached answer and no LLM client (openai package or OPENAI_API_KEY missing)."""
+
+
+def get_client():
+    """
+    The process-wide OpenAI client (created once). None when the openai
+    package or OPENAI_API_KEY is missing.
+    """
+    global _CLIENT
+    if _CLIENT is not None:
+        return _CLIENT
+    if not os.getenv("OPENAI_API_KEY", "").strip():
+        return None
+    try:
+        from openai import OpenAI
+    except ImportError:
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = OpenAI()
+    return _CLIENT
+
+
+def alert_signature(
+    alert: dict,
+    hypothesis: str | None,
+    model: str,
+    template: str,
+    related_texts: list | None = None,
+) -> dict:
+    """
+    Normalized, order-independent description of an alert for caching.
+    Scores are left out on purpose: two alerts with the same hypothesis,
+    severity and evidence get the same answer. related_texts: the texts
+    put in the prompt; their ids are part of the signature, since the
+    answer depends on them.
+    """
+    ml = alert.get("ml", {}) or {}
+    top_features = (alert.get("evidence", {}) or {}).get("top_features", []) or []
+    signature = {
+        "hypothesis": str(hypothesis or "Unknown").strip().lower(),
+        "severity": str(ml.get("severity", "Low")).strip().lower(),
+        "top_features": sorted(str(f).strip() for f in top_features),
+        "model": model,
+        "template": template,
+    }
+    if related_texts:
+        signature["related"] = sorted(
+            str(t.get("id") or t.get("title") or t.get("file") or "") for t in related_texts
+        )
+    return signature
+
+
+def signature_key(signature: dict) -> str:
+    raw = json.dumps(signature, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU with TTL. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?",
+                (now, key),
+            )
+        return row[0]
+
+    def put(self, key: str, response: str, signature: dict | None = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, signature, response, created_at, accessed_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, json.dumps(signature or {}, ensure_ascii=False), response, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            n, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM responses"
+            ).fetchone()
+        return {"entries": n, "hits": hits, "path": self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        return self.stats()["entries"]
+
+
+_CACHE = None
+
+
+def get_cache() -> ResponseCache:
+    """The process-wide response cache (opened once)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CLIENT_LOCK:
+            if _CACHE is None:
+                _CACHE = ResponseCache()
+    return _CACHE
+
+
+def cached_completion(
+    messages: list,
+    model: str,
+    signature: dict,
+    temperature: float = 0.3,
+    client=None,
+    cache: ResponseCache | None = None,
+) -> dict:
+    """
+    Chat completion through the cache. Returns {"text", "cached", "key"}.
+    Raises NoClient if there is no cached answer and no client.
+    """
+    cache = cache if cache is not None else get_cache()
+    key = signature_key(signature)
+    inflight_key = (id(cache), key)
+
+    while True:
+        text = cache.get(key)
+        if text is not None:
+            inc("llm_cache_total", result="hit")
+            return {"text": text, "cached": True, "key": key}
+
+        with _INFLIGHT_LOCK:
+            pending = _INFLIGHT.get(inflight_key)
+            if pending is None:
+                pending = _INFLIGHT[inflight_key] = threading.Event()
+                break
+        # same key already being requested: wait for it, then read the cache
+        # (if that request failed, the next loop sends one of our own)
+        inc("llm_cache_total", result="coalesced")
+        pending.wait()
+
+    try:
+        inc("llm_cache_total", result="miss")
+        client = client if client is not None else get_client()
+        if client is None:
+            raise NoClient("No LLM client (missing openai package or OPENAI_API_KEY)")
+
+        with stage("llm.request", memory=False):
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            inc("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt")
+            inc("llm_tokens_total", usage.completion_tokens or 0, kind="completion")
+
+        text = (resp.choices[0].message.content or "").strip()
+        cache.put(key, text, signature)
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(inflight_key, None)
+        pending.set()
+    return {"text": text, "cached": False, "key": key}
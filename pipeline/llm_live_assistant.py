@@ -3,10 +3,19 @@ import json
 from typing import Any, Dict, List
 
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from pipeline.llm_cache import NoClient, alert_signature, cached_completion, get_cache
+from pipeline.metrics import inc
+from pipeline.retrieval import get_index
 
 load_dotenv()
 
+MODEL = "gpt-4o-mini"
+# bump when the system prompt or _build_prompt changes (invalidates cached answers)
+PROMPT_VERSION = "soc_assistant/v2"
+# related texts put in the prompt (and in the cache signature)
+MAX_RELATED_TEXTS = 3
+
 def _build_prompt(alert: Dict[str, Any], assist_hint: Dict[str, Any], related_texts: List[Dict[str, Any]]) -> str:
     top_feats = alert.get("evidence", {}).get("top_features", [])
     ml = alert.get("ml", {})
@@ -16,10 +25,12 @@ def _build_prompt(alert: Dict[str, Any], assist_hint: Dict[str, Any], related_te
 
     # small curated snippets (keep short)
     snippets = []
-    for t in (related_texts or [])[:3]:
+    for t in (related_texts or [])[:MAX_RELATED_TEXTS]:
         snippets.append({
             "file": t.get("file"),
             "category": t.get("category"),
+            "id": t.get("id"),
+            "title": t.get("title"),
             "match_score": t.get("match_score"),
             "snippet": (t.get("snippet") or "")[:500],
         })
@@ -50,24 +61,30 @@ def _build_prompt(alert: Dict[str, Any], assist_hint: Dict[str, Any], related_te
     return json.dumps(payload, ensure_ascii=False)
 
 
+def _no_api_key(assist_hint: Dict[str, Any]) -> Dict[str, Any]:
+    inc("llm_requests_total", status="no_api_key")
+    return {
+        "status": "no_api_key",
+        "explanation_ar": "لا يوجد OPENAI_API_KEY في البيئة. سيتم استخدام المساعد المحلي فقط.",
+        "attack_overview_ar": "",
+        "triage_steps": [],
+        "recommended_actions": [],
+        "confidence": "Low",
+        "attack_type": assist_hint.get("predicted_attack_type", "Unknown"),
+    }
+
+
 def generate_soc_assistant(alert: Dict[str, Any], assist_hint: Dict[str, Any], related_texts: List[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Calls an LLM to produce SOC-style explanation + triage + response guidance.
     Returns a dict (JSON).
+
+    related_texts defaults to the related ATT&CK techniques / ECC controls
+    from the retrieval index (pipeline.retrieval), when it can be built.
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        return {
-            "status": "no_api_key",
-            "explanation_ar": "لا يوجد OPENAI_API_KEY في البيئة. سيتم استخدام المساعد المحلي فقط.",
-            "attack_overview_ar": "",
-            "triage_steps": [],
-            "recommended_actions": [],
-            "confidence": "Low",
-            "attack_type": assist_hint.get("predicted_attack_type", "Unknown"),
-        }
-
-    client = OpenAI()
+        return _no_api_key(assist_hint)
 
     system = (
         "You are a cybersecurity SOC analyst assistant. "
@@ -77,25 +94,52 @@ def generate_soc_assistant(alert: Dict[str, Any], assist_hint: Dict[str, Any], r
         "Return ONLY JSON with the specified schema."
     )
 
-    user = _build_prompt(alert, assist_hint, related_texts or [])
+    index = None
+    if related_texts is None:
+        index = get_index()
+        related_texts = index.related_texts(alert, assist_hint.get("predicted_attack_type")) if index else []
 
-    # Using Chat Completions (stable + simple)
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=0.3,
+    user = _build_prompt(alert, assist_hint, related_texts)
+
+    # equivalent alerts (same hypothesis / severity / evidence / related texts) share one answer
+    signature = alert_signature(
+        alert, assist_hint.get("predicted_attack_type"), MODEL, PROMPT_VERSION, related_texts[:MAX_RELATED_TEXTS]
     )
+    if index is not None:
+        # same ids, different snippets once the documents are re-indexed
+        signature["index"] = index.version
+    cache = get_cache()
+
+    # Using Chat Completions (stable + simple)
+    try:
+        out = cached_completion(
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            model=MODEL,
+            signature=signature,
+            temperature=0.3,
+            cache=cache,
+        )
+    except NoClient:
+        # key set but the openai package is missing
+        return _no_api_key(assist_hint)
+    except Exception:
+        inc("llm_requests_total", status="error")
+        raise
 
-    text = resp.choices[0].message.content.strip()
+    text = out["text"]
 
     # try parse JSON
     try:
         data = json.loads(text)
+        inc("llm_requests_total", status="cached" if out["cached"] else "ok")
         return data
     except Exception:
+        inc("llm_requests_total", status="parse_error")
+        # do not keep a reply that could not be used
+        cache.discard(out["key"])
         # fallback if model returned extra text
         return {
             "status": "parse_error",
@@ -0,0 +1,166 @@
+"""
+Approximate Local Outlier Factor with a compact reference set.
+
+Exact LOF (`LocalOutlierFactor(novelty=True).decision_function`) searches the
+k nearest neighbours among every training row. Here the reference set is a
+random subsample of the training data; its k-distances and local
+reachability densities (lrd) are computed once, inside that subsample, and
+stored. Scoring a row is then a blocked distance computation against the
+reference set plus an argpartition, with no tree or sklearn call.
+
+Accuracy against exact LOF is controlled by `n_reference` and can be measured
+with `accuracy_report`.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+# query rows per distance block (block x n_reference float64 matrix)
+BLOCK_ROWS = 256
+
+
+def _sq_norms(X: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", X, X)
+
+
+def knn(X: np.ndarray, reference: np.ndarray, k: int, ref_sq=None, exclude_self: bool = False):
+    """
+    k nearest reference rows for every row of X (blocked, vectorized).
+    Returns (distances, indices), both (n_rows x k), nearest first.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    ref_sq = _sq_norms(reference) if ref_sq is None else ref_sq
+
+    dist = np.empty((len(X), k), dtype=np.float64)
+    idx = np.empty((len(X), k), dtype=np.int64)
+
+    for start in range(0, len(X), BLOCK_ROWS):
+        block = X[start:start + BLOCK_ROWS]
+        d2 = _sq_norms(block)[:, None] - 2.0 * block @ reference.T + ref_sq
+        np.maximum(d2, 0.0, out=d2)
+        if exclude_self:
+            # X is the reference set itself: a row is not its own neighbour
+            d2[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+
+        part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        part_d2 = np.take_along_axis(d2, part, axis=1)
+        order = np.argsort(part_d2, axis=1, kind="stable")
+
+        idx[start:start + len(block)] = np.take_along_axis(part, order, axis=1)
+        dist[start:start + len(block)] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+
+    return dist, idx
+
+
+def _lrd(dist: np.ndarray, idx: np.ndarray, k_distance: np.ndarray) -> np.ndarray:
+    reach = np.maximum(dist, k_distance[idx])
+    return 1.0 / (reach.mean(axis=1) + 1e-10)
+
+
+class ApproxLOF:
+    """
+    LOF over a stored reference subsample. Same score convention as sklearn:
+    `decision_function` < 0 means outlier.
+    """
+
+    def __init__(
+        self,
+        reference: np.ndarray,
+        k_distance: np.ndarray,
+        lrd: np.ndarray,
+        n_neighbors: int,
+        offset: float = -1.5,
+    ):
+        self.reference = reference
+        self.k_distance = k_distance
+        self.lrd = lrd
+        self.n_neighbors = int(n_neighbors)
+        self.offset_ = float(offset)
+        # optional accuracy_report against exact LOF, kept in the bundle manifest
+        self.accuracy = None
+        self._ref_sq = _sq_norms(np.asarray(reference, dtype=np.float64))
+
+    @classmethod
+    def fit(
+        cls,
+        X,
+        n_neighbors: int = 20,
+        n_reference: int = 5_000,
+        offset: float = -1.5,
+        seed: int = 42,
+    ) -> "ApproxLOF":
+        """
+        Picks the reference subsample of X and precomputes its k-distances
+        and lrd values (exact within the subsample).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) > n_reference:
+            rng = np.random.default_rng(seed)
+            X = X[np.sort(rng.choice(len(X), n_reference, replace=False))]
+
+        k = min(n_neighbors, len(X) - 1)
+        dist, idx = knn(X, X, k, exclude_self=True)
+        k_distance = dist[:, -1]
+        lrd = _lrd(dist, idx, k_distance)
+        return cls(X, k_distance, lrd, k, offset)
+
+    @classmethod
+    def from_sklearn(cls, lof_model, n_reference: int = 5_000, seed: int = 42, rows=None) -> "ApproxLOF":
+        """
+        Approximates a fitted LocalOutlierFactor(novelty=True) from its
+        training rows, keeping its n_neighbors and offset_. rows: indices of
+        the training rows to draw the reference set from (default: all).
+        """
+        fit_X = lof_model._fit_X if rows is None else lof_model._fit_X[rows]
+        return cls.fit(
+            fit_X,
+            n_neighbors=lof_model.n_neighbors_,
+            n_reference=n_reference,
+            offset=lof_model.offset_,
+            seed=seed,
+        )
+
+    def score_samples(self, X) -> np.ndarray:
+        """
+        Opposite of the LOF of each row (the lower, the more abnormal).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        dist, idx = knn(X, self.reference, self.n_neighbors, ref_sq=self._ref_sq)
+        lrd_x = _lrd(dist, idx, self.k_distance)
+        return -(self.lrd[idx].mean(axis=1) / lrd_x)
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X) -> np.ndarray:
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def accuracy_report(exact_scores, approx_scores, q: float = 0.01) -> dict:
+    """
+    How close approximate LOF scores are to exact ones:
+    - spearman: rank correlation over all rows
+    - top_q_recall: share of the exact top-q outliers also in the approx top-q
+    - mean_abs_error: on the decision_function scale
+    """
+    exact = np.asarray(exact_scores, dtype=np.float64)
+    approx = np.asarray(approx_scores, dtype=np.float64)
+
+    def _ranks(a):
+        r = np.empty(len(a))
+        r[np.argsort(a, kind="stable")] = np.arange(len(a))
+        return r
+
+    spearman = float(np.corrcoef(_ranks(exact), _ranks(approx))[0, 1])
+
+    n_top = max(1, int(round(q * len(exact))))
+    top_exact = set(np.argpartition(exact, n_top - 1)[:n_top].tolist())
+    top_approx = set(np.argpartition(approx, n_top - 1)[:n_top].tolist())
+
+    return {
+        "n_rows": int(len(exact)),
+        "q": q,
+        "spearman": spearman,
+        "top_q_recall": len(top_exact & top_approx) / n_top,
+        "mean_abs_error": float(np.mean(np.abs(exact - approx))),
+    }
@@ -0,0 +1,339 @@
+"""
+Lightweight in-process instrumentation.
+
+Stages are timed with `stage(name, rows=...)` (a context manager) or the
+`timed(name)` decorator. Each stage keeps a wall-time histogram, call and row
+counters and the largest growth of the process RSS high-water mark
+(ru_maxrss) seen while it ran; free-form counters (alerts per severity, LLM
+requests per status) go through `inc`.
+
+The high-water mark is process-wide and only ever rises: a stage that
+allocates less than an earlier peak shows 0, and memory allocated by other
+threads during the stage is counted too. It says which stages pushed the
+process peak up, not how much memory a stage used.
+
+Cost per stage is two perf_counter calls, two getrusage calls and a locked
+dict update (a few microseconds), so instrumentation stays well under 1% of
+a detection run. Set SIYAJ_METRICS=0 to turn it off entirely.
+
+Export: `to_prometheus()` / `write_prometheus(path)` (text exposition format)
+or `serve(port)` for a /metrics endpoint. `begin_run()` + `run_summary()`
+give the per-run table shown in the Streamlit sidebar.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import bisect
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROM_PATH = os.path.join(BASE_DIR, "data", "metrics", "siyaj.prom")
+
+PREFIX = "siyaj"
+
+# wall-time histogram buckets (seconds)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes (0 if unknown)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _StageStats:
+    __slots__ = ("calls", "seconds", "rows", "buckets", "hwm_growth")
+
+    def __init__(self, n_buckets: int):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.buckets = [0] * (n_buckets + 1)  # last one is +Inf
+        self.hwm_growth = 0
+
+    def copy(self) -> "_StageStats":
+        other = _StageStats(len(self.buckets) - 1)
+        other.calls, other.seconds, other.rows = self.calls, self.seconds, self.rows
+        other.buckets = list(self.buckets)
+        other.hwm_growth = self.hwm_growth
+        return other
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "rows", "memory", "_t0", "_rss0")
+
+    def __init__(self, registry, name, rows, memory):
+        self.registry = registry
+        self.name = name
+        self.rows = rows  # may be set inside the block when only known later
+        self.memory = memory
+
+    def __enter__(self):
+        self._rss0 = _peak_rss() if self.memory else 0
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._t0
+        if exc_type is not None:
+            # failed runs are counted, not mixed into the timings
+            self.registry.inc("stage_errors_total", stage=self.name)
+            return False
+        mem = _peak_rss() - self._rss0 if self.memory else 0
+        self.registry.observe(self.name, seconds, self.rows, mem)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ("rows",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Registry:
+    """
+    Holds every stage and counter of the process. Thread-safe.
+    """
+
+    def __init__(self, enabled: bool = True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._counters = {}
+        self._run = None
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, rows: int | None = None, memory: bool = True):
+        """
+        with registry.stage("detect.prepare", rows=len(df)): ...
+        memory=False skips the RSS probes (for sub-millisecond stages).
+        """
+        if not self.enabled:
+            return _NullTimer()
+        return _Timer(self, name, rows, memory)
+
+    def observe(self, name: str, seconds: float, rows: int | None = None, mem: int = 0) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            s = self._stages.get(name)
+            if s is None:
+                s = self._stages[name] = _StageStats(len(self.buckets))
+            s.calls += 1
+            s.seconds += seconds
+            s.rows += int(rows or 0)
+            s.buckets[i] += 1
+            if mem > s.hwm_growth:
+                s.hwm_growth = mem
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._run = None
+
+    # --------------------------------------------------------------
+    # per-run summary
+    # --------------------------------------------------------------
+    def begin_run(self) -> None:
+        """Marks the start of a run; `run_summary` reports what happened since."""
+        with self._lock:
+            self._run = (
+                time.time(),
+                {k: s.copy() for k, s in self._stages.items()},
+                dict(self._counters),
+            )
+
+    def run_summary(self) -> dict:
+        """
+        {"started_at", "stages": [{stage, calls, total_s, mean_ms, rows,
+        rows_per_s, rss_hwm_growth_mb}], "counters": {name{labels}: value}}.
+        rss_hwm_growth_mb: largest rise of the process RSS high-water mark
+        during one call of the stage, since process start.
+        """
+        with self._lock:
+            started, stages0, counters0 = self._run or (None, {}, {})
+            stages = {k: s.copy() for k, s in self._stages.items()}
+            counters = dict(self._counters)
+
+        rows = []
+        for name, s in sorted(stages.items()):
+            base = stages0.get(name)
+            calls = s.calls - (base.calls if base else 0)
+            if calls <= 0:
+                continue
+            seconds = s.seconds - (base.seconds if base else 0.0)
+            n_rows = s.rows - (base.rows if base else 0)
+            rows.append({
+                "stage": name,
+                "calls": calls,
+                "total_s": round(seconds, 4),
+                "mean_ms": round(seconds / calls * 1e3, 3),
+                "rows": n_rows,
+                "rows_per_s": round(n_rows / seconds) if n_rows and seconds > 0 else None,
+                "rss_hwm_growth_mb": round(s.hwm_growth / 2 ** 20, 1),
+            })
+
+        deltas = {}
+        for key, value in counters.items():
+            delta = value - counters0.get(key, 0)
+            if delta:
+                deltas[_series(*key)] = delta
+
+        return {"started_at": started, "stages": rows, "counters": deltas}
+
+    # --------------------------------------------------------------
+    # Prometheus text exposition
+    # --------------------------------------------------------------
+    def to_prometheus(self) -> str:
+        with self._lock:
+            stages = {k: s.copy() for k, s in self._stages.items()}
+            counters = dict(self._counters)
+
+        out = []
+        if stages:
+            h = f"{PREFIX}_stage_seconds"
+            out.append(f"# HELP {h} Wall time per pipeline stage.")
+            out.append(f"# TYPE {h} histogram")
+            for name, s in sorted(stages.items()):
+                cum = 0
+                for le, count in zip(self.buckets + (float("inf"),), s.buckets):
+                    cum += count
+                    le_s = "+Inf" if le == float("inf") else repr(le)
+                    out.append(f'{h}_bucket{{stage="{_esc(name)}",le="{le_s}"}} {cum}')
+                out.append(f'{h}_sum{{stage="{_esc(name)}"}} {s.seconds!r}')
+                out.append(f'{h}_count{{stage="{_esc(name)}"}} {s.calls}')
+
+            r = f"{PREFIX}_stage_rows_total"
+            out.append(f"# HELP {r} Rows processed per pipeline stage.")
+            out.append(f"# TYPE {r} counter")
+            for name, s in sorted(stages.items()):
+                out.append(f'{r}{{stage="{_esc(name)}"}} {s.rows}')
+
+            m = f"{PREFIX}_stage_process_rss_hwm_growth_bytes"
+            out.append(
+                f"# HELP {m} Largest rise of the process-wide RSS high-water mark (ru_maxrss)"
+                " during one call of a stage; not the stage's own memory use."
+            )
+            out.append(f"# TYPE {m} gauge")
+            for name, s in sorted(stages.items()):
+                out.append(f'{m}{{stage="{_esc(name)}"}} {s.hwm_growth}')
+
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            metric = f"{PREFIX}_{name}"
+            out.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(by_name[name]):
+                out.append(f"{_series(metric, labels)} {value}")
+
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: str = PROM_PATH) -> str:
+        """Writes the exposition atomically (for node_exporter's textfile collector)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+        return path
+
+
+def _esc(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{_esc(v)}"' for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+METRICS = Registry(enabled=os.getenv("SIYAJ_METRICS", "1") != "0")
+
+
+def stage(name: str, rows: int | None = None, memory: bool = True):
+    return METRICS.stage(name, rows, memory)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    METRICS.inc(name, value, **labels)
+
+
+def timed(name: str, memory: bool = True):
+    """Decorator form of `stage` (no row count)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.stage(name, memory=memory):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin_run() -> None:
+    METRICS.begin_run()
+
+
+def run_summary() -> dict:
+    return METRICS.run_summary()
+
+
+def to_prometheus() -> str:
+    return METRICS.to_prometheus()
+
+
+def write_prometheus(path: str = PROM_PATH) -> str:
+    return METRICS.write_prometheus(path)
+
+
+def serve(port: int = 9108, host: str = "127.0.0.1", registry: Registry = METRICS):
+    """
+    Serves GET /metrics from a daemon thread. Returns the server
+    (call `.shutdown()` to stop it).
+    """
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
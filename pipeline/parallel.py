@@ -0,0 +1,128 @@
+"""
+Multi-process, data-parallel Isolation Forest scoring.
+
+The prepared float32 matrix is copied once into `multiprocessing.shared_memory`;
+workers (which load and compile the forest once, at pool start) score row
+shards straight out of it and write their scores into a shared output array.
+Only shard bounds and block names are pickled, never the data itself.
+Each row is scored by the same code as the serial path, so results are
+identical.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import warnings
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+
+import joblib
+import numpy as np
+
+from pipeline.bundle import ModelBundle
+from pipeline.forest import CompiledForest
+
+# shards per worker (smaller shards balance uneven workers better)
+SHARDS_PER_WORKER = 4
+
+# per-process model, set by _init_worker
+_WORKER = {}
+
+
+def _init_worker(source: str, engine: str) -> None:
+    # source: a bundle directory (arrays are memory-mapped, so every worker
+    # shares the same pages) or a legacy if_model.pkl path
+    if os.path.isdir(source):
+        bundle = ModelBundle(source)
+        _WORKER["model"] = bundle.get("isolation_forest_sklearn")
+        _WORKER["compiled"] = bundle.get("isolation_forest") if engine == "compiled" else None
+        return
+
+    model = joblib.load(source)
+    _WORKER["model"] = model
+    _WORKER["compiled"] = CompiledForest.from_sklearn(model) if engine == "compiled" else None
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # the parent owns (and unlinks) every block. Before 3.13 attaching also
+    # registers the block, which is harmless only because the workers share
+    # the parent's resource tracker (see ParallelScorer.__init__); a tracker of
+    # their own would report it as leaked and unlink it a second time.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _score_shard(in_name: str, out_name: str, shape: tuple, start: int, stop: int) -> int:
+    shm_in = _attach(in_name)
+    shm_out = _attach(out_name)
+    try:
+        X = np.ndarray(shape, dtype=np.float32, buffer=shm_in.buf)
+        out = np.ndarray((shape[0],), dtype=np.float64, buffer=shm_out.buf)
+
+        compiled = _WORKER["compiled"]
+        if compiled is not None:
+            out[start:stop] = compiled.decision_function(X[start:stop])
+        else:
+            with warnings.catch_warnings():
+                # fitted with feature names, scored on a bare array
+                warnings.filterwarnings("ignore", message="X does not have valid feature names")
+                out[start:stop] = _WORKER["model"].decision_function(X[start:stop])
+        del X, out
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return stop - start
+
+
+class ParallelScorer:
+    """
+    Pool of scoring workers. Create once and reuse; call `close()` when done.
+    """
+
+    def __init__(self, source: str, n_workers: int | None = None, engine: str = "compiled"):
+        self.n_workers = int(n_workers or os.cpu_count() or 1)
+        # started before the pool, so forked workers inherit it instead of
+        # each starting its own (spawn/forkserver workers always inherit it)
+        resource_tracker.ensure_running()
+        self._pool = mp.get_context().Pool(
+            self.n_workers, initializer=_init_worker, initargs=(source, engine)
+        )
+
+    def decision_function(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+        if n_rows == 0:
+            return np.empty(0, dtype=np.float64)
+
+        shm_in = shared_memory.SharedMemory(create=True, size=X.nbytes)
+        shm_out = shared_memory.SharedMemory(create=True, size=n_rows * 8)
+        try:
+            np.ndarray(X.shape, dtype=np.float32, buffer=shm_in.buf)[:] = X
+
+            n_shards = min(n_rows, self.n_workers * SHARDS_PER_WORKER)
+            bounds = np.linspace(0, n_rows, n_shards + 1).astype(int)
+            tasks = [
+                (shm_in.name, shm_out.name, X.shape, int(a), int(b))
+                for a, b in zip(bounds[:-1], bounds[1:]) if b > a
+            ]
+            self._pool.starmap(_score_shard, tasks)
+
+            return np.ndarray((n_rows,), dtype=np.float64, buffer=shm_out.buf).copy()
+        finally:
+            shm_in.close()
+            shm_in.unlink()
+            shm_out.close()
+            shm_out.unlink()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,537 @@
+"""
+Offline retrieval index over the reference documents in docs/.
+
+- docs/enterprise-attack.csv: one document per MITRE ATT&CK technique
+  (name, tactics, description, data sources, detection)
+- docs/ECC-Controls-Arabic.pdf: NCA Essential Cybersecurity Controls, split
+  into chunks at the control numbers (needs the optional `pypdf` package;
+  skipped without it). PDF text extraction of Arabic is lossy, so ECC chunks
+  are best effort.
+
+`build_index` extracts and tokenizes the text once (Arabic + English, with
+light normalization) and writes a BM25 inverted index: the vocabulary plus
+CSR-style postings (`indptr`, `doc`, `weight`) where each posting already
+holds its BM25 term weight. A query is a few array slices and one bincount
+over the documents, well under a millisecond.
+
+The index also stores a feature-name -> technique table (curated rules in
+FEATURE_TECHNIQUES, resolved to document ids at build time), so an alert's
+top features point to techniques even when their names share no words.
+
+`related_texts(alert, hypothesis)` returns the records expected by
+`llm_live_assistant.generate_soc_assistant` (file, category, match_score,
+snippet, ...).
+"""
+from __future__ import annotations
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from pipeline.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCS_DIR = os.path.join(BASE_DIR, "docs")
+INDEX_DIR = os.path.join(BASE_DIR, "data", "cache", "retrieval")
+
+ATTACK_CSV = os.path.join(DOCS_DIR, "enterprise-attack.csv")
+ECC_PDF = os.path.join(DOCS_DIR, "ECC-Controls-Arabic.pdf")
+
+FORMAT_VERSION = 1
+META = "meta.json"
+
+ATTACK = "MITRE ATT&CK"
+ECC = "NCA ECC"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SNIPPET_CHARS = 400
+# ECC chunks longer than this (tokens) are split further
+MAX_CHUNK_TOKENS = 120
+
+# --------------------------------------------------------------
+# tokenization
+# --------------------------------------------------------------
+_TASHKEEL = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_TOKEN = re.compile(r"[a-z0-9]+|[\u0621-\u064a]+")
+_ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_CITATION = re.compile(r"\(Citation:[^)]*\)")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can for from has have in into is it its may of on or
+such that the their them these this to use used uses using via was were which
+will with within without adversaries adversary also other
+من في على الي عن مع التي الذي ذلك هذه هذا او و ما او ان ثم كل بعد قبل عند
+حسب يجب يتم لها له بها به الجهه جهه
+""".split())
+
+
+def normalize_text(text: str) -> str:
+    """NFKC (folds Arabic presentation forms), lower case, ASCII digits, no diacritics."""
+    text = unicodedata.normalize("NFKC", str(text)).translate(_DIGITS).lower()
+    return _TASHKEEL.sub("", text).translate(_ARABIC_FOLD)
+
+
+def _stem(token: str) -> str:
+    if "\u0621" <= token[0] <= "\u064a":
+        for prefix in _ARABIC_PREFIXES:
+            if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+                return token[len(prefix):]
+        return token
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Arabic + English terms (light stemming, stopwords and 1-letter tokens removed)."""
+    tokens = []
+    for tok in _TOKEN.findall(normalize_text(text)):
+        if len(tok) < 2 or tok in STOPWORDS:
+            continue
+        tok = _stem(tok)
+        if tok not in STOPWORDS:
+            tokens.append(tok)
+    return tokens
+
+
+# --------------------------------------------------------------
+# query expansion + feature -> technique table
+# --------------------------------------------------------------
+# keyword in the hypothesis label -> extra query terms (English for ATT&CK,
+# Arabic for the ECC controls)
+QUERY_EXPANSIONS = {
+    "scan": "network service discovery active scanning port scan فحص الثغرات اختبار الاختراق",
+    "recon": "reconnaissance network service discovery active scanning فحص الثغرات",
+    "port": "non-standard port network service discovery امن الشبكات",
+    "dos": "network denial of service endpoint denial of service flood تعطيل الشبكات",
+    "flood": "network flood direct network flood service exhaustion تعطيل الشبكات",
+    "timing": "inter-arrival timing slow service exhaustion scheduled transfer",
+    "iat": "inter-arrival timing slow service exhaustion",
+    "anomal": "network traffic anomaly monitoring سجلات الاحداث ومراقبه الامن السيبراني",
+    "unknown": "network traffic monitoring سجلات الاحداث ومراقبه الامن السيبراني ادارة حوادث",
+}
+
+# (regex on the CICIDS feature name, ATT&CK technique ids)
+FEATURE_TECHNIQUES = (
+    (r"Destination Port", ("T1046", "T1595", "T1571")),
+    (r"SYN Flag", ("T1498.001", "T1046")),
+    (r"(FIN|RST|PSH|ACK|URG|CWE|ECE) Flag", ("T1046", "T1595.001")),
+    (r"(Bytes|Packets)/s|Bulk Rate", ("T1498", "T1498.001", "T1499")),
+    (r"IAT", ("T1499.002", "T1046")),
+    (r"Flow Duration", ("T1499.002", "T1071")),
+    (r"Fwd .*(Length|Bytes|Packets|Segment)|Total Fwd|Subflow Fwd|act_data_pkt_fwd", ("T1048", "T1041", "T1030")),
+    (r"Bwd .*(Length|Bytes|Packets|Segment)|Total Backward|Subflow Bwd", ("T1105", "T1071", "T1499")),
+    (r"Down/Up Ratio", ("T1048", "T1041")),
+    (r"Init_Win_bytes|min_seg_size|Header Length", ("T1595", "T1046")),
+    (r"Packet Length|Packet Size", ("T1499", "T1048")),
+    (r"Active|Idle", ("T1071", "T1029")),
+)
+
+# weight of the feature table relative to the (max-normalized) BM25 score
+FEATURE_WEIGHT = 0.5
+
+
+def expand_query(text: str) -> str:
+    lowered = str(text).lower()
+    extra = [terms for key, terms in QUERY_EXPANSIONS.items() if key in lowered]
+    return " ".join([str(text)] + extra)
+
+
+def feature_technique_ids(feature: str) -> list:
+    ids = []
+    for pattern, techniques in FEATURE_TECHNIQUES:
+        if re.search(pattern, feature):
+            ids.extend(t for t in techniques if t not in ids)
+    return ids
+
+
+# --------------------------------------------------------------
+# document extraction
+# --------------------------------------------------------------
+def attack_documents(csv_path: str = ATTACK_CSV) -> list:
+    frame = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    docs = []
+    for row in frame.to_dict(orient="records"):
+        description = _CITATION.sub("", row.get("description", "")).strip()
+        detection = _CITATION.sub("", row.get("detection", "")).strip()
+        text = " ".join([
+            row.get("name", ""), row.get("id", ""), row.get("kill chain phases", ""),
+            description, row.get("data sources", ""), detection,
+        ])
+        docs.append({
+            "id": row.get("id", ""),
+            "title": row.get("name", ""),
+            "category": ATTACK,
+            "file": os.path.basename(csv_path),
+            "url": row.get("url", ""),
+            "tactics": row.get("kill chain phases", ""),
+            "snippet": description[:SNIPPET_CHARS],
+            "text": text,
+        })
+    return docs
+
+
+# control numbers as extracted (spaces around the dashes), e.g. "2 - 5 - 3 - 8"
+_CONTROL_ID = re.compile(r"(?<![\d-])(\d{1,2}(?:\s*-\s*\d{1,2}){1,3})(?![\d-])")
+
+
+def _control_id(raw: str) -> str:
+    # right-to-left extraction reverses multi-digit numbers ("01" for 10)
+    parts = [p.strip() for p in raw.split("-")]
+    return "-".join(p[::-1] if p.startswith("0") else p for p in parts)
+
+
+def _pdf_reader():
+    """PdfReader class of pypdf (or PyPDF2), None when neither is installed."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError:
+            return None
+    return PdfReader
+
+
+def _pdf_pages(pdf_path: str):
+    """Page texts, or None when no PDF reader is installed."""
+    reader = _pdf_reader()
+    if reader is None:
+        return None
+    return [page.extract_text() or "" for page in reader(pdf_path).pages]
+
+
+def ecc_documents(pdf_path: str = ECC_PDF):
+    """ECC chunks (split at control numbers), or None without a PDF reader."""
+    pages = _pdf_pages(pdf_path)
+    if pages is None:
+        return None
+
+    docs = []
+    for page_no, page in enumerate(pages, start=1):
+        text = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", page).translate(_DIGITS)).strip()
+        # each control number starts a chunk (its text follows it)
+        cuts = [m.start() for m in _CONTROL_ID.finditer(text)]
+        bounds = [0] + cuts + [len(text)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            chunk = text[start:end].strip()
+            words = chunk.split()
+            if len(words) < 4:
+                continue
+            m = _CONTROL_ID.match(chunk)
+            control = _control_id(m.group(1)) if m else None
+            for i in range(0, len(words), MAX_CHUNK_TOKENS):
+                part = " ".join(words[i:i + MAX_CHUNK_TOKENS])
+                docs.append({
+                    "id": f"ECC {control}" if control else f"ECC p{page_no}",
+                    "title": f"ECC-1:2018 {control} (p. {page_no})" if control else f"ECC-1:2018 (p. {page_no})",
+                    "category": ECC,
+                    "file": os.path.basename(pdf_path),
+                    "url": "",
+                    "page": page_no,
+                    "snippet": part[:SNIPPET_CHARS],
+                    "text": part,
+                })
+    return docs
+
+
+# --------------------------------------------------------------
+# build / load
+# --------------------------------------------------------------
+def _stamp(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def build_index(out_dir: str = INDEX_DIR, attack_csv: str = ATTACK_CSV, ecc_pdf: str = ECC_PDF,
+                feature_columns=None) -> dict:
+    """
+    Extracts, tokenizes and indexes the documents; writes the index to
+    out_dir and returns its meta (with "skipped": sources not indexed).
+    """
+    with stage("retrieval.build"):
+        docs, skipped = [], []
+        if os.path.exists(attack_csv):
+            docs.extend(attack_documents(attack_csv))
+        else:
+            skipped.append(f"{os.path.basename(attack_csv)} (not found)")
+        if os.path.exists(ecc_pdf):
+            try:
+                ecc = ecc_documents(ecc_pdf)
+            except Exception as e:  # malformed PDF: index ATT&CK alone
+                ecc = []
+                skipped.append(f"{os.path.basename(ecc_pdf)} ({type(e).__name__}: {e})")
+            if ecc is None:
+                skipped.append(f"{os.path.basename(ecc_pdf)} (pypdf not installed)")
+            else:
+                docs.extend(ecc)
+        else:
+            skipped.append(f"{os.path.basename(ecc_pdf)} (not found)")
+        if not docs:
+            raise FileNotFoundError(f"No documents to index in {DOCS_DIR}")
+
+        # term frequencies per document -> CSR postings (term-major)
+        counts = [Counter(tokenize(d.pop("text"))) for d in docs]
+        doc_len = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+        vocab = sorted(set().union(*counts))
+        term_id = {t: i for i, t in enumerate(vocab)}
+
+        n_postings = sum(len(c) for c in counts)
+        terms = np.empty(n_postings, dtype=np.int64)
+        post_doc = np.empty(n_postings, dtype=np.int32)
+        tf = np.empty(n_postings, dtype=np.float64)
+        pos = 0
+        for d, c in enumerate(counts):
+            n = len(c)
+            terms[pos:pos + n] = [term_id[t] for t in c]
+            post_doc[pos:pos + n] = d
+            tf[pos:pos + n] = list(c.values())
+            pos += n
+
+        order = np.lexsort((post_doc, terms))
+        terms, post_doc, tf = terms[order], post_doc[order], tf[order]
+        df = np.bincount(terms, minlength=len(vocab))
+        indptr = np.r_[0, np.cumsum(df)].astype(np.int64)
+
+        n_docs = len(docs)
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = K1 * (1 - B + B * doc_len[post_doc] / max(avgdl, 1e-9))
+        weight = (idf[terms] * tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+        # feature name -> technique documents
+        by_id = {d["id"]: i for i, d in enumerate(docs) if d["category"] == ATTACK}
+        if feature_columns is None:
+            feature_columns = _default_feature_columns()
+        features = {}
+        for feature in feature_columns:
+            ids = [by_id[t] for t in feature_technique_ids(feature) if t in by_id]
+            if ids:
+                features[feature] = ids
+
+        os.makedirs(out_dir, exist_ok=True)
+        meta_path = os.path.join(out_dir, META)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        np.save(os.path.join(out_dir, "indptr.npy"), indptr)
+        np.save(os.path.join(out_dir, "doc.npy"), post_doc)
+        np.save(os.path.join(out_dir, "weight.npy"), weight)
+        with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+        with open(os.path.join(out_dir, "docs.json"), "w", encoding="utf-8") as f:
+            json.dump(docs, f, ensure_ascii=False)
+
+        meta = {
+            "format": FORMAT_VERSION,
+            "sources": {os.path.basename(p): _stamp(p) for p in (attack_csv, ecc_pdf)},
+            # an index built without a PDF reader is rebuilt once one is installed
+            "pdf_reader": _pdf_reader() is not None,
+            "n_docs": n_docs,
+            "n_terms": len(vocab),
+            "n_postings": int(n_postings),
+            "avgdl": avgdl,
+            "k1": K1,
+            "b": B,
+            "categories": dict(Counter(d["category"] for d in docs)),
+            "features": features,
+            "skipped": skipped,
+        }
+        # meta last: a half-written index is never loaded
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def _default_feature_columns() -> list:
+    path = os.path.join(BASE_DIR, "models", "feature_columns.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_fresh(index_dir: str = INDEX_DIR, attack_csv: str = ATTACK_CSV, ecc_pdf: str = ECC_PDF) -> bool:
+    """True if the index exists and was built from the current documents."""
+    meta_path = os.path.join(index_dir, META)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    sources = {os.path.basename(p): _stamp(p) for p in (attack_csv, ecc_pdf)}
+    return (
+        meta.get("format") == FORMAT_VERSION
+        and meta.get("sources") == sources
+        and meta.get("pdf_reader") == (_pdf_reader() is not None)
+    )
+
+
+class RetrievalIndex:
+    """
+    Read side of the index. The postings are small (one entry per distinct
+    term of each document), so they are loaded into memory; tokenized
+    queries are memoized, since hypothesis labels repeat.
+    """
+
+    QUERY_CACHE_SIZE = 1024
+
+    def __init__(self, index_dir: str = INDEX_DIR):
+        meta_path = os.path.join(index_dir, META)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Retrieval index not found: {index_dir} (run scripts/build_retrieval_index.py)")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self.term_id = {t: i for i, t in enumerate(json.load(f))}
+        with open(os.path.join(index_dir, "docs.json"), "r", encoding="utf-8") as f:
+            self.docs = json.load(f)
+
+        self.indptr = np.load(os.path.join(index_dir, "indptr.npy"))
+        self.doc = np.load(os.path.join(index_dir, "doc.npy"))
+        self.weight = np.load(os.path.join(index_dir, "weight.npy"))
+        self.n_docs = len(self.docs)
+        self._queries = {}
+
+        categories = np.array([d["category"] for d in self.docs], dtype=object)
+        self._category_mask = {c: categories == c for c in set(categories)}
+        self.features = {f: np.asarray(ids, dtype=np.int64) for f, ids in self.meta["features"].items()}
+
+    @property
+    def version(self) -> str:
+        """Short stamp of the documents and reader the index was built from."""
+        stamp = {k: self.meta.get(k) for k in ("format", "sources", "pdf_reader")}
+        raw = json.dumps(stamp, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+    def _query_postings(self, query: str) -> tuple:
+        """(doc ids, weights) of all postings of the query terms, memoized."""
+        hit = self._queries.get(query)
+        if hit is not None:
+            return hit
+        counts = Counter(t for t in tokenize(query) if t in self.term_id)
+        docs, weights = [np.empty(0, dtype=np.int32)], [np.empty(0, dtype=np.float32)]
+        for term, qtf in counts.items():
+            i = self.term_id[term]
+            lo, hi = self.indptr[i], self.indptr[i + 1]
+            docs.append(self.doc[lo:hi])
+            weights.append(self.weight[lo:hi] * qtf)
+        hit = (np.concatenate(docs), np.concatenate(weights))
+        if len(self._queries) >= self.QUERY_CACHE_SIZE:
+            self._queries.pop(next(iter(self._queries)))
+        self._queries[query] = hit
+        return hit
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for a free-text query."""
+        docs, weights = self._query_postings(query)
+        return np.bincount(docs, weights=weights, minlength=self.n_docs)
+
+    def relevance(self, query: str, features=None) -> np.ndarray:
+        """
+        BM25 of the expanded query scaled to a maximum of 1, plus
+        FEATURE_WEIGHT x the share of `features` mapped to each technique.
+        """
+        scores = self.scores(expand_query(query))
+        peak = scores.max() if len(scores) else 0.0
+        if peak > 0:
+            scores /= peak
+        if features:
+            scores += FEATURE_WEIGHT * self.feature_scores(features)
+        return scores
+
+    def feature_scores(self, features) -> np.ndarray:
+        """Share of the given features whose mapped techniques include each document."""
+        out = np.zeros(self.n_docs, dtype=np.float64)
+        features = list(features or [])
+        for f in features:
+            ids = self.features.get(f)
+            if ids is not None:
+                out[ids] += 1.0
+        return out / max(len(features), 1)
+
+    def top_k(self, scores: np.ndarray, k: int = 5, category: str | None = None) -> list:
+        """[(doc index, score)] of the k best documents with score > 0."""
+        if category is not None:
+            mask = self._category_mask.get(category)
+            if mask is None:
+                return []
+            scores = np.where(mask, scores, 0.0)
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def search(self, query: str, k: int = 5, category: str | None = None, features=None) -> list:
+        """
+        Best documents for a query (+ optional top features), as
+        related_texts records (file, category, id, title, url, match_score, snippet).
+        """
+        return [self._record(i, s) for i, s in self.top_k(self.relevance(query, features), k, category)]
+
+    def _record(self, i: int, score: float) -> dict:
+        record = dict(self.docs[i])
+        record["match_score"] = round(score, 4)
+        return record
+
+    def related_texts(self, alert: dict, hypothesis: str | None = None, k_attack: int = 2, k_ecc: int = 1) -> list:
+        """
+        Related ATT&CK techniques then ECC controls for an alert: the query
+        is the hypothesis label, the top features select mapped techniques.
+        """
+        features = alert.get("evidence", {}).get("top_features", []) or []
+        if hypothesis is None:
+            hyp = alert.get("hypothesis") or {}
+            hypothesis = hyp.get("type") or hyp.get("label") or ""
+        with stage("retrieval.related_texts", rows=1, memory=False):
+            # the feature table only points to techniques, so ECC uses BM25 alone
+            text_scores = self.relevance(hypothesis)
+            attack_scores = text_scores + FEATURE_WEIGHT * self.feature_scores(features) if features else text_scores
+            hits = self.top_k(attack_scores, k_attack, ATTACK) + self.top_k(text_scores, k_ecc, ECC)
+            return [self._record(i, s) for i, s in hits]
+
+
+_INDEX = None
+_INDEX_ERROR = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index(build: bool = True):
+    """
+    The process-wide index (loaded once), rebuilt first when missing or
+    older than the documents. None when it cannot be built; the failure is
+    remembered, so later calls do not retry the build (restart the process,
+    or run scripts/build_retrieval_index.py, to try again).
+    """
+    global _INDEX, _INDEX_ERROR
+    if _INDEX is not None or _INDEX_ERROR is not None:
+        return _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None and _INDEX_ERROR is None:
+            try:
+                if build and not is_fresh():
+                    build_index()
+                _INDEX = RetrievalIndex()
+            except (OSError, ValueError) as e:
+                _INDEX_ERROR = e
+                logger.warning("Retrieval index unavailable: %s", e)
+    return _INDEX
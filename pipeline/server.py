@@ -0,0 +1,491 @@
+"""
+Asyncio scoring service with micro-batching.
+
+Flows arrive one by one (or a few per request) but Detector is only cheap
+per row when it scores many rows at once. `MicroBatcher` queues incoming
+flows and closes a batch when it holds `max_batch` rows or its oldest flow
+has waited `max_wait` seconds, then scores the whole batch with one
+Detector call in a worker thread, so the event loop keeps accepting flows
+while the forest runs.
+
+`ScoringServer` exposes the batcher over two protocols:
+
+- HTTP/1.1: POST /score with NDJSON (one flow per line) or a JSON object /
+  array; the response is NDJSON, one result per flow in request order.
+  GET /health, GET /stats (latency percentiles, batch sizes, queue depth)
+  and GET /metrics (Prometheus text, pipeline.metrics).
+- TCP line protocol: one JSON flow per line in, one JSON result per line
+  out, in order. Clients may pipeline many lines without waiting.
+
+Backpressure: the batch queue holds at most `max_queue` flows. With
+overflow="reject" a request that does not fit is refused (HTTP 503 /
+{"error": "overloaded"}); with overflow="block" it waits for room, which
+slows the reader and, through TCP flow control, the client. Each line
+connection also caps its in-flight flows at `max_inflight`.
+
+A result is {"id", "score", "threshold", "decision", "severity", "cluster"}
+("id" is echoed from the flow when present) or {"id", "error"}.
+"""
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pipeline.alerts import SEVERITY_NAMES, severity_codes
+from pipeline.metrics import METRICS, inc, stage
+
+OVERFLOW_POLICIES = ("reject", "block")
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class Overloaded(RuntimeError):
+    """The batch queue is full (overflow="reject")."""
+
+
+class MicroBatcher:
+    """
+    Collects flows into batches of at most `max_batch` rows / `max_wait`
+    seconds and scores each batch with one Detector call off the event loop.
+
+    threshold: fixed alert threshold; default `detector.live_threshold(q)`.
+    Must be started (`await start()`) from the event loop that submits.
+
+    A flow's result never depends on the batch it lands in: missing / non-
+    finite values are filled with the calibration medians, and without a
+    calibration such flows get an error instead of the batch's medians.
+    """
+
+    def __init__(
+        self,
+        detector,
+        max_batch: int = 512,
+        max_wait: float = 0.005,
+        max_queue: int = 8192,
+        overflow: str = "reject",
+        q: float = 0.01,
+        threshold: float | None = None,
+        latency_window: int = 100_000,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r} (expected one of {OVERFLOW_POLICIES})")
+        if max_batch < 1 or max_queue < 1:
+            raise ValueError("max_batch and max_queue must be >= 1")
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.q = q
+        self.threshold = float(threshold) if threshold is not None else detector.live_threshold(q)
+
+        # medians for missing values come from the calibration when there is one
+        self._fixed = detector.calibration is not None
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="siyaj-score")
+
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._started_at = None
+        self._n_flows = 0
+        self._n_batches = 0
+        self._n_rejected = 0
+        self._max_depth = 0
+
+    # --------------------------------------------------------------
+    # lifecycle
+    # --------------------------------------------------------------
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._started_at = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="siyaj-batcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    # --------------------------------------------------------------
+    # submitting
+    # --------------------------------------------------------------
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def enqueue(self, flows: list) -> list:
+        """
+        Queues the flows and returns one future per flow (resolving to its
+        result dict). Raises Overloaded if they do not fit (overflow="reject").
+        """
+        if self._queue is None:
+            raise RuntimeError("MicroBatcher is not started")
+        loop = asyncio.get_running_loop()
+
+        if self.overflow == "reject" and self._queue.qsize() + len(flows) > self.max_queue:
+            self._n_rejected += len(flows)
+            inc("server_rejected_total", len(flows))
+            raise Overloaded(f"queue full ({self._queue.qsize()}/{self.max_queue} flows)")
+
+        futures = []
+        now = time.perf_counter()
+        for flow in flows:
+            fut = loop.create_future()
+            if self.overflow == "reject":
+                self._queue.put_nowait((flow, fut, now))
+            else:
+                await self._queue.put((flow, fut, now))
+            futures.append(fut)
+
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return futures
+
+    async def submit(self, flows: list) -> list:
+        """Scores the flows and returns their results, in order."""
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*await self.enqueue(flows))
+        METRICS.observe("server.request", time.perf_counter() - t0, rows=len(flows))
+        return results
+
+    # --------------------------------------------------------------
+    # batching loop
+    # --------------------------------------------------------------
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        loop = asyncio.get_running_loop()
+
+        while len(batch) < self.max_batch:
+            # take whatever is already queued without yielding
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.perf_counter()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            getter = loop.create_task(self._queue.get())
+            done, _ = await asyncio.wait((getter,), timeout=remaining)
+            if not done:
+                getter.cancel()
+                # the get may have completed while being cancelled
+                try:
+                    batch.append(await getter)
+                except asyncio.CancelledError:
+                    pass
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            flows = [item[0] for item in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._score_batch, flows)
+            except Exception as e:
+                results = [{"id": _flow_id(f), "error": f"scoring failed: {e}"} for f in flows]
+
+            now = time.perf_counter()
+            for (_, fut, t_in), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+                self._latencies.append(now - t_in)
+            self._n_flows += len(batch)
+            self._n_batches += 1
+
+    def _score_batch(self, flows: list) -> list:
+        with stage("server.batch", rows=len(flows)):
+            return self._score_flows(flows)
+
+    def _score_flows(self, flows: list) -> list:
+        columns = self.detector.feature_columns
+        X = np.empty((len(flows), len(columns)), dtype=np.float64)
+        errors = {}
+        for i, flow in enumerate(flows):
+            try:
+                X[i] = [flow[c] for c in columns]
+            except KeyError as e:
+                errors[i] = f"Missing required column: {e.args[0]}"
+            except (TypeError, ValueError):
+                errors[i] = "Feature values must be numeric"
+            else:
+                if not self._fixed and not np.isfinite(X[i]).all():
+                    errors[i] = "Non-finite feature values need a calibration (run scripts/make_artifacts.py)"
+
+        ok = np.array([i not in errors for i in range(len(flows))], dtype=bool)
+        results = [None] * len(flows)
+        for i, msg in errors.items():
+            results[i] = {"id": _flow_id(flows[i]), "error": msg}
+        if not ok.any():
+            return results
+
+        frame = pd.DataFrame(X[ok], columns=columns)
+        detected = self.detector.raw_scores(frame, fixed=self._fixed, lof=False)
+
+        scores = detected["if_scores"]
+        is_anomaly = scores <= self.threshold
+        severity = SEVERITY_NAMES[severity_codes(scores, self.threshold)]
+        clusters = detected.get("cluster")
+
+        for pos, i in enumerate(np.flatnonzero(ok)):
+            results[i] = {
+                "id": _flow_id(flows[i]),
+                "score": float(scores[pos]),
+                "threshold": self.threshold,
+                "decision": "anomaly" if is_anomaly[pos] else "normal",
+                "severity": str(severity[pos]),
+                "cluster": int(clusters[pos]) if clusters is not None else None,
+            }
+
+        inc("server_flows_total", int(ok.sum()))
+        inc("server_anomalies_total", int(is_anomaly.sum()))
+        return results
+
+    # --------------------------------------------------------------
+    # stats
+    # --------------------------------------------------------------
+    def stats(self) -> dict:
+        """Throughput, batch size, queue depth and p50 / p99 latency (ms)."""
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        lat = np.fromiter(self._latencies, dtype=np.float64)
+        p50, p99 = (np.percentile(lat, [50, 99]) * 1e3).tolist() if len(lat) else (None, None)
+        return {
+            "flows": self._n_flows,
+            "batches": self._n_batches,
+            "mean_batch": self._n_flows / self._n_batches if self._n_batches else 0.0,
+            "flows_per_s": self._n_flows / elapsed if elapsed > 0 else 0.0,
+            "rejected": self._n_rejected,
+            "queue_depth": self.depth,
+            "max_queue_depth": self._max_depth,
+            "latency_p50_ms": p50,
+            "latency_p99_ms": p99,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1e3,
+            "threshold": self.threshold,
+        }
+
+    def reset_stats(self) -> None:
+        self._latencies.clear()
+        self._started_at = time.perf_counter()
+        self._n_flows = self._n_batches = self._n_rejected = self._max_depth = 0
+
+
+def _flow_id(flow):
+    return flow.get("id") if isinstance(flow, dict) else None
+
+
+def _parse_flows(body: bytes) -> list:
+    """NDJSON, a JSON array or a single JSON object -> list of dicts."""
+    text = body.decode("utf-8").strip()
+    if not text:
+        return []
+    if text[0] == "[":
+        flows = json.loads(text)
+    else:
+        flows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not all(isinstance(f, dict) for f in flows):
+        raise ValueError("each flow must be a JSON object")
+    return flows
+
+
+def _ndjson(results: list) -> bytes:
+    return "".join(json.dumps(r) + "\n" for r in results).encode("utf-8")
+
+
+class ScoringServer:
+    """
+    HTTP (`http_port`) and TCP line (`tcp_port`) front ends over one
+    MicroBatcher. Either port may be None to disable that protocol, or 0
+    to pick a free port (see `ports` after `start()`).
+    """
+
+    def __init__(
+        self,
+        batcher: MicroBatcher,
+        host: str = "127.0.0.1",
+        http_port: int | None = 8080,
+        tcp_port: int | None = 9009,
+        max_inflight: int = 4096,
+        max_body: int = 32 * 2 ** 20,
+    ):
+        self.batcher = batcher
+        self.host = host
+        self.http_port = http_port
+        self.tcp_port = tcp_port
+        self.max_inflight = max_inflight
+        self.max_body = max_body
+        self._servers = {}
+
+    @property
+    def ports(self) -> dict:
+        return {name: s.sockets[0].getsockname()[1] for name, s in self._servers.items()}
+
+    async def start(self) -> None:
+        await self.batcher.start()
+        if self.http_port is not None:
+            self._servers["http"] = await asyncio.start_server(self._handle_http, self.host, self.http_port)
+        if self.tcp_port is not None:
+            self._servers["tcp"] = await asyncio.start_server(
+                self._handle_lines, self.host, self.tcp_port, limit=2 ** 20
+            )
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in self._servers.values()))
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        for s in self._servers.values():
+            s.close()
+            await s.wait_closed()
+        self._servers = {}
+        await self.batcher.stop()
+
+    # --------------------------------------------------------------
+    # HTTP
+    # --------------------------------------------------------------
+    async def _handle_http(self, reader, writer) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                raw_length = headers.get("content-length") or "0"
+                # int() alone would accept "-5", " +5" or "1_0"
+                if not (raw_length.isascii() and raw_length.isdigit()):
+                    await self._respond(writer, 400, {"error": "invalid Content-Length"}, keep_alive=False)
+                    break
+                length = int(raw_length)
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload, extra = await self._route(method, target.split("?")[0], body)
+                await self._respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes):
+        if path == "/score":
+            if method != "POST":
+                return 405, {"error": "use POST"}, {}
+            try:
+                flows = _parse_flows(body)
+            except (ValueError, UnicodeDecodeError) as e:
+                return 400, {"error": f"invalid JSON: {e}"}, {}
+            try:
+                results = await self.batcher.submit(flows)
+            except Overloaded as e:
+                return 503, {"error": "overloaded", "detail": str(e)}, {"Retry-After": "1"}
+            return 200, _ndjson(results), {"Content-Type": "application/x-ndjson"}
+
+        if method != "GET":
+            return 405, {"error": "use GET"}, {}
+        if path == "/health":
+            return 200, {"status": "ok", "model_version": self.batcher.detector.model_version}, {}
+        if path == "/stats":
+            return 200, self.batcher.stats(), {}
+        if path == "/metrics":
+            text = METRICS.to_prometheus().encode("utf-8")
+            return 200, text, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        return 404, {"error": f"unknown path {path}"}, {}
+
+    async def _respond(self, writer, status: int, payload, keep_alive: bool, extra: dict | None = None) -> None:
+        headers = {"Content-Type": "application/json"}
+        headers.update(extra or {})
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        head += [f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    # --------------------------------------------------------------
+    # TCP line protocol
+    # --------------------------------------------------------------
+    async def _handle_lines(self, reader, writer) -> None:
+        # futures (or ready results) in arrival order; bounded -> per-connection backpressure
+        pending = asyncio.Queue(maxsize=self.max_inflight)
+        responder = asyncio.get_running_loop().create_task(self._respond_lines(pending, writer))
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    flow = json.loads(line)
+                    if not isinstance(flow, dict):
+                        raise ValueError("flow must be a JSON object")
+                except ValueError as e:
+                    await pending.put({"id": None, "error": f"invalid JSON: {e}"})
+                    continue
+                try:
+                    fut = (await self.batcher.enqueue([flow]))[0]
+                except Overloaded:
+                    fut = {"id": _flow_id(flow), "error": "overloaded"}
+                await pending.put(fut)
+        except (ConnectionError, ValueError):
+            # ValueError: a line longer than the stream limit
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def _respond_lines(self, pending, writer) -> None:
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                result = await item if isinstance(item, asyncio.Future) else item
+                writer.write((json.dumps(result) + "\n").encode("utf-8"))
+                if pending.empty():
+                    await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            # client went away: drain the rest so the reader never blocks
+            while (await pending.get()) is not None:
+                pass
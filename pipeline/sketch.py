@@ -0,0 +1,111 @@
+"""
+Streaming quantile sketch (KLL-style).
+
+Keeps a bounded number of items per level; when a level overflows it is
+sorted and every other item is promoted to the next level with double weight.
+Memory stays O(k log(n / k)) regardless of how many scores are streamed, and
+two sketches can be merged level by level (e.g. one per worker / per file).
+"""
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch over float scores.
+
+    k controls accuracy: rank error is roughly 1.7 / k of the stream length.
+    """
+
+    def __init__(self, k: int = 2048, seed: int | None = 42):
+        if k < 8:
+            raise ValueError("k must be >= 8")
+        self.k = int(k)
+        self.n = 0
+        self.levels: list[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def size(self) -> int:
+        """Number of items actually retained."""
+        return int(sum(len(level) for level in self.levels))
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(8, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+
+            items = np.sort(items)
+            # odd leftover stays at this level so total weight is preserved
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            pairs = items[: len(items) - len(keep)]
+            promoted = pairs[self._rng.integers(2)::2]
+
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # capacities depend on the number of levels, restart from the bottom
+            level = 0
+
+    def update(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _weighted(self) -> tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s) of everything seen so far.
+        """
+        if self.n == 0:
+            raise ValueError("Cannot take a quantile of an empty sketch")
+        items, cum = self._weighted()
+        q = np.asarray(q, dtype=np.float64)
+        pos = np.searchsorted(cum, q * cum[-1], side="left")
+        out = items[np.clip(pos, 0, len(items) - 1)]
+        return float(out) if out.ndim == 0 else out
+
+    def rank(self, value: float) -> float:
+        """
+        Approximate fraction of items <= value.
+        """
+        if self.n == 0:
+            return 0.0
+        items, cum = self._weighted()
+        pos = np.searchsorted(items, value, side="right")
+        return float(cum[pos - 1] / cum[-1]) if pos > 0 else 0.0
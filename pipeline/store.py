@@ -0,0 +1,411 @@
+"""
+Embedded incident / alert / action store (SQLite, WAL mode).
+
+Incidents used to be loose incident_*.json files; alerts were not kept at
+all. Here everything lives in one database with indexes on time, severity,
+hypothesis type, destination port and model version, so "incidents on port
+80 last week" is an index range scan instead of a glob + parse of every file.
+
+- bulk inserts: `insert_alerts` takes alert dicts or an AlertBatch (whose
+  arrays are inserted directly, without building per-alert dicts) and writes
+  them with executemany in one transaction
+- paginated queries: keyset pagination on (created_at, id), so page N costs
+  the same as page 1 even with millions of rows
+- `migrate_json` imports existing incident_*.json files and the action log
+
+Live writes: `log_action` inserts every action, `create_incident_report` every
+incident, and the dashboard inserts each alert batch it builds (once per
+data file / sample size / model version / q). The /score server does not
+persist its per-flow decisions.
+"""
+from __future__ import annotations
+
+import os
+import glob
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from pipeline.actionlog import read_actions
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORE_PATH = os.path.join(BASE_DIR, "data", "siyaj.sqlite")
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    row_index INTEGER,
+    score REAL,
+    threshold REAL,
+    severity TEXT,
+    hypothesis TEXT,
+    dst_port INTEGER,
+    cluster INTEGER,
+    model_version TEXT,
+    top_features TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_time ON alerts (created_at, id);
+CREATE INDEX IF NOT EXISTS alerts_severity ON alerts (severity, created_at, id);
+CREATE INDEX IF NOT EXISTS alerts_hypothesis ON alerts (hypothesis, created_at, id);
+CREATE INDEX IF NOT EXISTS alerts_port ON alerts (dst_port, created_at, id);
+CREATE INDEX IF NOT EXISTS alerts_model ON alerts (model_version, created_at, id);
+
+CREATE TABLE IF NOT EXISTS incidents (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    severity TEXT,
+    hypothesis TEXT,
+    dst_port INTEGER,
+    model_version TEXT,
+    score REAL,
+    path TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS incidents_time ON incidents (created_at, id);
+CREATE INDEX IF NOT EXISTS incidents_severity ON incidents (severity, created_at, id);
+CREATE INDEX IF NOT EXISTS incidents_hypothesis ON incidents (hypothesis, created_at, id);
+CREATE INDEX IF NOT EXISTS incidents_port ON incidents (dst_port, created_at, id);
+CREATE INDEX IF NOT EXISTS incidents_model ON incidents (model_version, created_at, id);
+
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    logged_at REAL NOT NULL,
+    action TEXT,
+    status TEXT,
+    incident_id TEXT,
+    payload TEXT,
+    UNIQUE (logged_at, action, payload)
+);
+CREATE INDEX IF NOT EXISTS actions_time ON actions (logged_at, id);
+CREATE INDEX IF NOT EXISTS actions_incident ON actions (incident_id);
+"""
+
+# filterable columns per table (query keyword -> column)
+_FILTERS = {
+    "alerts": ("severity", "hypothesis", "dst_port", "model_version", "cluster"),
+    "incidents": ("severity", "hypothesis", "dst_port", "model_version"),
+    "actions": ("action", "status", "incident_id"),
+}
+_TIME_COLUMN = {"alerts": "created_at", "incidents": "created_at", "actions": "logged_at"}
+
+
+def _epoch(value) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _hypothesis_of(alert: dict, assistant: dict | None = None) -> str | None:
+    hyp = alert.get("hypothesis")
+    if isinstance(hyp, dict) and hyp.get("type"):
+        return hyp["type"]
+    assistant = assistant or {}
+    if assistant.get("predicted_attack_type"):
+        return assistant["predicted_attack_type"]
+    hypo = assistant.get("hypothesis")
+    if isinstance(hypo, dict):
+        return hypo.get("label") or hypo.get("type")
+    return None
+
+
+def _port_of(alert: dict):
+    if alert.get("dst_port") is not None:
+        return int(alert["dst_port"])
+    agg = alert.get("aggregation") or {}
+    if agg.get("destination_port") is not None:
+        return int(agg["destination_port"])
+    return None
+
+
+class IncidentStore:
+    """
+    One SQLite database (WAL: readers never block the writer). Thread-safe.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _executemany(self, sql: str, rows, chunk: int = 50_000) -> int:
+        n = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for start in range(0, len(rows), chunk):
+                    cur = self._conn.executemany(sql, rows[start:start + chunk])
+                    n += max(cur.rowcount, 0)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return n
+
+    # --------------------------------------------------------------
+    # inserts
+    # --------------------------------------------------------------
+    def insert_alerts(self, alerts, model_version: str | None = None, df=None, detect_result=None) -> int:
+        """
+        alerts: list of alert dicts, or an AlertBatch. With an AlertBatch,
+        `detect_result` adds KMeans clusters (ports come from the batch, or
+        from `df` when given).
+        """
+        if hasattr(alerts, "severity_code"):
+            rows = self._batch_rows(alerts, model_version, df, detect_result)
+        else:
+            rows = [self._alert_row(a, model_version) for a in alerts]
+        return self._executemany(
+            "INSERT INTO alerts (created_at, row_index, score, threshold, severity, hypothesis,"
+            " dst_port, cluster, model_version, top_features, payload)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    @staticmethod
+    def _alert_row(alert: dict, model_version: str | None) -> tuple:
+        ml = alert.get("ml", {}) or {}
+        top = (alert.get("evidence", {}) or {}).get("top_features", []) or []
+        created = _epoch(alert.get("timestamp")) or datetime.now(timezone.utc).timestamp()
+        row_index = alert.get("row_index")
+        return (
+            created,
+            int(row_index) if row_index is not None else None,
+            ml.get("score"),
+            ml.get("threshold"),
+            ml.get("severity"),
+            _hypothesis_of(alert),
+            _port_of(alert),
+            alert.get("cluster"),
+            model_version or alert.get("model_version"),
+            json.dumps(list(top), ensure_ascii=False),
+            json.dumps(alert, ensure_ascii=False, default=str),
+        )
+
+    @staticmethod
+    def _batch_rows(batch, model_version, df, detect_result) -> list:
+        from pipeline.hypothesis import infer_attack_hypothesis
+
+        n = len(batch)
+        created = _epoch(batch.timestamp)
+        severity = batch.severity.tolist()
+
+        if df is not None and "Destination Port" in df.columns:
+            p = df["Destination Port"].to_numpy()[batch.indices]
+            ports = [int(v) if np.isfinite(v) else None for v in p]
+        else:
+            ports = [int(v) if v >= 0 else None for v in batch.ports]
+
+        clusters = [None] * n
+        if detect_result is not None and detect_result.get("cluster") is not None:
+            clusters = np.asarray(detect_result["cluster"])[batch.indices].astype(int).tolist()
+
+        # hypothesis depends only on (feature set, severity): compute once per combination
+        hyp_cache = {}
+        rows = []
+        for i in range(n):
+            feats = [str(f) for f in batch.top_features[i]]
+            key = (tuple(sorted(feats)), severity[i])
+            if key not in hyp_cache:
+                hyp_cache[key] = infer_attack_hypothesis(feats, severity[i]).get("type")
+            rows.append((
+                created,
+                int(batch.indices[i]),
+                float(batch.scores[i]),
+                float(batch.threshold),
+                severity[i],
+                hyp_cache[key],
+                ports[i],
+                clusters[i],
+                model_version,
+                json.dumps(feats, ensure_ascii=False),
+                None,
+            ))
+        return rows
+
+    def insert_incident(self, report: dict, path: str | None = None, incident_id: str | None = None,
+                        model_version: str | None = None) -> str:
+        alert = report.get("alert", {}) or {}
+        ml = alert.get("ml", {}) or {}
+        incident_id = incident_id or report.get("incident_id")
+        if incident_id is None:
+            stem = os.path.splitext(os.path.basename(path or ""))[0]
+            incident_id = f"legacy-{stem}" if stem else None
+        if incident_id is None:
+            raise ValueError("Incident has no incident_id and no path to derive one from")
+
+        row = (
+            incident_id,
+            _epoch(report.get("created_at")) or datetime.now(timezone.utc).timestamp(),
+            ml.get("severity"),
+            _hypothesis_of(alert, report.get("assistant")),
+            _port_of(alert),
+            model_version or report.get("model_version") or alert.get("model_version"),
+            ml.get("score"),
+            path,
+            json.dumps(report, ensure_ascii=False, default=str),
+        )
+        self._executemany(
+            "INSERT OR REPLACE INTO incidents (id, created_at, severity, hypothesis, dst_port,"
+            " model_version, score, path, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [row],
+        )
+        return incident_id
+
+    def insert_actions(self, records) -> int:
+        rows = []
+        for r in records:
+            payload = json.dumps(r, ensure_ascii=False, sort_keys=True, default=str)
+            rows.append((
+                _epoch(r.get("logged_at")) or datetime.now(timezone.utc).timestamp(),
+                r.get("action"),
+                r.get("status"),
+                r.get("incident_id"),
+                payload,
+            ))
+        # UNIQUE(logged_at, action, payload): re-importing the same log is a no-op
+        return self._executemany(
+            "INSERT OR IGNORE INTO actions (logged_at, action, status, incident_id, payload)"
+            " VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    # --------------------------------------------------------------
+    # queries
+    # --------------------------------------------------------------
+    def _where(self, table: str, filters: dict, start, end) -> tuple:
+        allowed = _FILTERS[table]
+        unknown = set(filters) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown filter(s) for {table}: {sorted(unknown)} (allowed: {allowed})")
+
+        clauses, params = [], []
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append(f"{col} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+
+        tcol = _TIME_COLUMN[table]
+        if start is not None:
+            clauses.append(f"{tcol} >= ?")
+            params.append(_epoch(start))
+        if end is not None:
+            clauses.append(f"{tcol} <= ?")
+            params.append(_epoch(end))
+        return clauses, params
+
+    def _page(self, table: str, limit: int, cursor, start, end, filters: dict) -> tuple:
+        clauses, params = self._where(table, filters, start, end)
+        tcol = _TIME_COLUMN[table]
+        if cursor is not None:
+            # keyset: strictly older than the last row of the previous page
+            clauses.append(f"({tcol}, id) < (?, ?)")
+            params.extend(cursor)
+
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {tcol} DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+
+        with self._lock:
+            rows = [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+        for r in rows:
+            for key in ("payload", "top_features"):
+                if r.get(key):
+                    r[key] = json.loads(r[key])
+
+        next_cursor = (rows[-1][tcol], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def query_alerts(self, limit: int = 100, cursor=None, start=None, end=None, **filters) -> tuple:
+        """
+        Newest first. Returns (rows, next_cursor); pass next_cursor back for
+        the following page (None = last page). Filters: severity, hypothesis,
+        dst_port, model_version, cluster (a value or a list of values).
+        """
+        return self._page("alerts", limit, cursor, start, end, filters)
+
+    def query_incidents(self, limit: int = 100, cursor=None, start=None, end=None, **filters) -> tuple:
+        return self._page("incidents", limit, cursor, start, end, filters)
+
+    def query_actions(self, limit: int = 100, cursor=None, start=None, end=None, **filters) -> tuple:
+        return self._page("actions", limit, cursor, start, end, filters)
+
+    def count(self, table: str = "alerts", start=None, end=None, **filters) -> int:
+        if table not in _FILTERS:
+            raise ValueError(f"Unknown table: {table!r}")
+        clauses, params = self._where(table, filters, start, end)
+        sql = f"SELECT COUNT(*) FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            return int(self._conn.execute(sql, params).fetchone()[0])
+
+    # --------------------------------------------------------------
+    # migration
+    # --------------------------------------------------------------
+    def migrate_json(self, actions_dir: str, actions_log: str | None = None) -> dict:
+        """
+        Imports incident_*.json files and the (rotated) action log from
+        `actions_dir`. Safe to run more than once.
+        """
+        incidents = 0
+        skipped = []
+        for path in sorted(glob.glob(os.path.join(actions_dir, "incident_*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+                self.insert_incident(report, path=path)
+                incidents += 1
+            except (OSError, ValueError) as e:
+                skipped.append(f"{os.path.basename(path)}: {e}")
+
+        actions_log = actions_log or os.path.join(actions_dir, "actions_log.jsonl")
+        actions = self.insert_actions(read_actions(actions_log))
+
+        return {"incidents": incidents, "actions": actions, "skipped": skipped}
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> IncidentStore:
+    """The process-wide store at STORE_PATH (opened once)."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = IncidentStore()
+    return _STORE
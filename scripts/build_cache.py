@@ -0,0 +1,54 @@
+"""
+build_cache.py
+
+يحوّل ملفات data/clean/*_cleaned.csv مرة وحدة إلى تخزين ثنائي عمودي
+(float32 .npy + labels + meta) داخل data/cache/، عشان نفتحها لاحقًا
+بـmemory-map بدل ما نقرأ CSV كامل كل مرة (pipeline/columnar.py).
+
+التشغيل:
+    python scripts/build_cache.py            # يحوّل الملفات القديمة/الجديدة فقط
+    python scripts/build_cache.py --force    # يعيد التحويل للكل
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.columnar import build_cache, is_fresh, load_feature_columns
+
+CLEAN_DIR = os.path.join(BASE_DIR, "data", "clean")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the columnar cache for cleaned CSVs")
+    parser.add_argument("files", nargs="*", help="CSV files (default: data/clean/*_cleaned.csv)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is fresh")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(CLEAN_DIR, "*_cleaned.csv")))
+    if not files:
+        print(f"❌ No cleaned CSV files found in {CLEAN_DIR}")
+        return
+
+    feature_columns = load_feature_columns()
+
+    for path in files:
+        if not args.force and is_fresh(path, feature_columns):
+            print(f"⏭️ Fresh cache, skipped: {path}")
+            continue
+
+        t0 = time.perf_counter()
+        meta = build_cache(path, feature_columns, chunksize=args.chunksize)
+        dt = time.perf_counter() - t0
+        print(f"✅ {path} -> {meta['n_rows']:,} rows in {dt:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+build_retrieval_index.py
+
+يبني فهرس البحث (BM25) مرة وحدة من مراجع docs/:
+- docs/enterprise-attack.csv: تقنية MITRE ATT&CK لكل مستند
+- docs/ECC-Controls-Arabic.pdf: ضوابط الهيئة (ECC) مقسّمة على أرقام الضوابط
+  (يحتاج pypdf، وبدونه يتخطى الـPDF)
++ جدول يربط أسماء الخصائص (Destination Port, Flow IAT ...) بتقنيات ATT&CK
+
+الفهرس يتحفظ في data/cache/retrieval/ (pipeline/retrieval.py) ويستخدمه
+llm_live_assistant لتعبئة related_texts لكل تنبيه.
+
+التشغيل:
+    python scripts/build_retrieval_index.py            # يبني إذا الفهرس قديم أو غير موجود
+    python scripts/build_retrieval_index.py --force
+    python scripts/build_retrieval_index.py --query "DoS-like Behavior"
+"""
+
+import os
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.retrieval import INDEX_DIR, RetrievalIndex, build_index, is_fresh
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the BM25 index over MITRE ATT&CK and NCA ECC")
+    parser.add_argument("--out", default=INDEX_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the index is fresh")
+    parser.add_argument("--query", default=None, help="test query after building")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.force or not is_fresh(args.out):
+        t0 = time.perf_counter()
+        meta = build_index(args.out)
+        print(f"✅ Index built: {args.out} ({time.perf_counter() - t0:.1f}s)")
+        print(f"- documents: {meta['n_docs']:,} " + ", ".join(f"{c}: {n:,}" for c, n in meta["categories"].items()))
+        print(f"- terms: {meta['n_terms']:,}, postings: {meta['n_postings']:,}")
+        print(f"- features mapped to techniques: {len(meta['features'])}")
+        for s in meta["skipped"]:
+            print(f"⚠️ skipped: {s}")
+    else:
+        print(f"🗂️ Index is up to date: {args.out}")
+
+    if args.query:
+        index = RetrievalIndex(args.out)
+        t0 = time.perf_counter()
+        hits = index.search(args.query, k=args.k)
+        dt = (time.perf_counter() - t0) * 1e3
+        print(f"\n🔎 {args.query!r} ({dt:.2f} ms)")
+        for h in hits:
+            print(f"  {h['match_score']:.3f}  [{h['category']}] {h['id']}  {h['title']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,272 @@
-import pandas as pd
-import joblib
+"""
+evaluate_models.py
+
+تقييم النماذج على كل العتبات دفعة وحدة بدل نقطة تشغيل وحدة (predict أو q):
+- كل نموذج (IF / LOF / KMeans) يقيّم البيانات مرة وحدة، والدرجات تنحفظ
+  في data/cache/eval/ (تتجدد تلقائيًا إذا تغيّر الملف أو إصدار النماذج)
+- الدرجات تترتب مرة وحدة وكل المقاييس تطلع من مجاميع تراكمية
+  (pipeline/evaluation.py): precision / recall / F1 / FPR،
+  alerts-per-million، و recall لكل نوع هجوم، لمئات العتبات بنفس التكلفة
+- الـensemble: نفس توحيد المقياس والدمج في Detector.score_ensemble
+  (pipeline/ensemble.py): منحنى للمتوسط الموزون + تصويت الأغلبية عند --q
+- الناتج: تقرير JSON مختصر + رسوم (إذا matplotlib موجود) في data/reports/
+
+التشغيل:
+    python scripts/evaluate_models.py
+    python scripts/evaluate_models.py --data data/clean/Friday-WorkingHours-Afternoon-DDos.pcap_ISCX_cleaned.csv
+    python scripts/evaluate_models.py --q 0.005 --no-plots --rescore
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
 import numpy as np
-from sklearn.metrics import classification_report
 
-# 1. تحميل بيانات الاختبار
-test_path = 'data/clean/Wednesday-WorkingHours.pcap_ISCX_cleaned.csv'
-data_test = pd.read_csv(test_path)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.columnar import read_clean, read_meta
+from pipeline.detect import Detector, IF_PATH, KMEANS_PATH, LOF_PATH
+from pipeline.ensemble import batch_cdf, fuse, normalize_weights, reference_cdf, vote
+from pipeline.evaluation import DEFAULT_QS, ScoreCurve, attack_mask
+
+CLEAN_DIR = os.path.join(BASE_DIR, "data", "clean")
+SCORES_DIR = os.path.join(BASE_DIR, "data", "cache", "eval")
+REPORTS_DIR = os.path.join(BASE_DIR, "data", "reports")
+
+WEDNESDAY_CLEAN = os.path.join(CLEAN_DIR, "Wednesday-WorkingHours.pcap_ISCX_cleaned.csv")
+
+MODELS = ("Isolation Forest", "LOF", "K-Means")
+ENSEMBLE_NAMES = {"Isolation Forest": "isolation_forest", "LOF": "lof", "K-Means": "kmeans"}
+ENSEMBLE = "Ensemble (mean)"
+
+# نقاط التشغيل اللي تنطبع في الجدول وتنحفظ لكل نوع هجوم
+REPORT_QS = (0.001, 0.005, 0.01, 0.05)
+
+
+def _source_stamp(path: str) -> dict:
+    if os.path.exists(path):
+        st = os.stat(path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    meta = read_meta(path) or {}
+    return {"size": meta.get("source_size"), "mtime_ns": meta.get("source_mtime_ns")}
+
+
+def scores_key(data_path: str, detector: Detector) -> str:
+    """يتغير إذا تغيّر ملف البيانات أو النماذج."""
+    payload = {"data": _source_stamp(data_path), "model_version": detector.model_version}
+    if detector.bundle is None:
+        payload["legacy"] = [
+            os.stat(p).st_mtime_ns if os.path.exists(p) else None
+            for p in (IF_PATH, LOF_PATH, KMEANS_PATH)
+        ]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def score_models(df, detector: Detector) -> dict:
+    """درجة كل نموذج لكل صف (الأقل = أكثر شذوذ)."""
+    fixed = detector.calibration is not None
+    X_scaled = detector._prepare(df, fixed=fixed)
+
+    scores = {"Isolation Forest": detector._if_scores(X_scaled)}
+
+    if detector.lof_model is not None:
+        scores["LOF"] = np.asarray(detector.lof_model.decision_function(X_scaled), dtype=np.float64)
+    else:
+        print("⚠️ LOF model not available, skipped")
+
+    if detector.kmeans_model is not None:
+        # المسافة لأقرب مركز: كل ما بعدت أكثر شذوذ
+        scores["K-Means"] = -np.asarray(detector.kmeans_model.transform(X_scaled), dtype=np.float64).min(axis=1)
+    else:
+        print("⚠️ KMeans model not available, skipped")
+
+    return scores
+
+
+def load_or_score(data_path: str, detector: Detector, df, rescore: bool = False) -> tuple:
+    """(scores dict, from_cache)."""
+    os.makedirs(SCORES_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    path = os.path.join(SCORES_DIR, f"{stem}-{scores_key(data_path, detector)}.npz")
 
-X_test = data_test.drop(['Label'], axis=1)
-y_true = [1 if x != 'BENIGN' else 0 for x in data_test['Label']]
+    if not rescore and os.path.exists(path):
+        with np.load(path) as cached:
+            scores = {name: cached[name] for name in cached.files}
+        if all(len(s) == len(df) for s in scores.values()):
+            return scores, True
 
-# مخزن لحفظ توقعات كل موديل عشان نصوت في الأخير
-all_model_predictions = {}
+    scores = score_models(df, detector)
+    np.savez(path, **scores)
+    return scores, False
 
-# 2. تقييم كل موديل وحفظ توقعه
-models_to_test = {
-    "Isolation Forest": "models/if_model.pkl",
-    "LOF": "models/lof_model.pkl",
-    "K-Means": "models/kmeans_model.pkl"
-}
 
-for name, path in models_to_test.items():
-    print(f"\n--- 📊 تقييم موديل: {name} ---")
+def normalize_scores(scores: dict, detector: Detector) -> dict:
+    """
+    نفس مقياس Detector.score_ensemble: توزيع التدريب المرجعي لكل نموذج
+    إذا موجود في المعايرة، وإلا ترتيب الدرجات داخل البيانات نفسها.
+    """
+    normalized = {}
+    for name, s in scores.items():
+        key = ENSEMBLE_NAMES[name]
+        ref = detector.ensemble_reference(key)
+        normalized[key] = reference_cdf(s, ref) if ref is not None else batch_cdf(s)
+    return normalized
+
+
+def ensemble_vote(normalized: dict, y_true: np.ndarray, q: float) -> dict:
+    """تصويت الأغلبية عند q: كل نموذج يعلّم أكثر q شذوذ عنده."""
+    weights = normalize_weights(None, normalized)
+    flagged = vote(normalized, weights, q) > 0.5
+    tp = int((flagged & y_true).sum())
+    alerts = int(flagged.sum())
+    n_pos = int(y_true.sum())
+    precision = tp / alerts if alerts else 1.0
+    recall = tp / n_pos if n_pos else 0.0
+    return {
+        "q": q,
+        "models": list(weights),
+        "alerts": alerts,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+
+def save_plots(curves: dict, report: dict, out_prefix: str) -> list:
     try:
-        model = joblib.load(path)
-        preds = model.predict(X_test)
-        
-        # توحيد النتائج (1 للهجوم، 0 للطبيعي)
-        if name == "K-Means":
-            y_pred = [1 if x == 1 else 0 for x in preds]
-        else:
-            y_pred = [1 if x == -1 else 0 for x in preds]
-        
-        # حفظ التوقع في المخزن
-        all_model_predictions[name] = y_pred
-        
-        print(classification_report(y_true, y_pred))
-    except Exception as e:
-        print(f"❌ تعذر تقييم {name}: {e}")
-
-# --- 🏆 الجزء الجديد: نظام تصويت الأغلبية (2 من 3) ---
-print("\n" + "="*40)
-print("🛡️ تقييم نظام سياج الموحد (Ensemble Voting)")
-print("="*40)
-
-# تحويل التوقعات لمصفوفة لحساب المجموع
-preds_matrix = np.array([
-    all_model_predictions["Isolation Forest"],
-    all_model_predictions["LOF"],
-    all_model_predictions["K-Means"]
-])
-
-# إذا كان مجموع الأصوات 2 أو أكثر، القرار النهائي هجوم (1)
-final_vote = (np.sum(preds_matrix, axis=0) >= 2).astype(int)
-
-print(classification_report(y_true, final_vote))
-print("\n💡 فكرة النظام: لا يتم تأكيد الهجوم إلا بموافقة موديلين على الأقل لتقليل الأخطاء.")
\ No newline at end of file
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ matplotlib not installed: plots skipped")
+        return []
+
+    paths = []
+    fig, axes = plt.subplots(1, 3, figsize=(16, 4.5))
+    for name, curve in curves.items():
+        c = curve.curve(max_points=2000)
+        axes[0].plot(c["recall"], c["precision"], label=name)
+        axes[1].plot(c["fpr"], c["recall"], label=name)
+        axes[2].plot(c["alerts_per_million"], c["recall"], label=name)
+    axes[0].set(xlabel="Recall", ylabel="Precision", title="Precision / Recall")
+    axes[1].set(xlabel="False positive rate", ylabel="Recall", title="ROC", xscale="log")
+    axes[2].set(xlabel="Alerts per million flows", ylabel="Recall", title="Alert budget", xscale="log")
+    for ax in axes:
+        ax.grid(alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    paths.append(out_prefix + "_curves.png")
+    fig.savefig(paths[-1], dpi=120)
+    plt.close(fig)
+
+    per_label = report["models"]["Isolation Forest"].get("label_recall")
+    if per_label:
+        names = [n for n in per_label if n != "BENIGN"]
+        cols = [c for c in next(iter(per_label.values())) if c != "rows"]
+        fig, ax = plt.subplots(figsize=(10, 0.4 * len(names) + 1.5))
+        height = 0.8 / max(len(cols), 1)
+        for j, col in enumerate(cols):
+            ax.barh(np.arange(len(names)) + j * height, [per_label[n][col] for n in names], height, label=col)
+        ax.set_yticks(np.arange(len(names)) + 0.4 - height / 2)
+        ax.set_yticklabels(names)
+        ax.set(xlabel="Recall", title="Isolation Forest recall per attack label", xlim=(0, 1))
+        ax.legend()
+        fig.tight_layout()
+        paths.append(out_prefix + "_label_recall.png")
+        fig.savefig(paths[-1], dpi=120)
+        plt.close(fig)
+
+    return paths
+
+
+def _records(frame) -> list:
+    return json.loads(frame.to_json(orient="records"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threshold-sweep evaluation of the anomaly models")
+    parser.add_argument("--data", default=WEDNESDAY_CLEAN, help="labelled cleaned CSV")
+    parser.add_argument("--q", type=float, default=0.01, help="operating point for the ensemble vote")
+    parser.add_argument("--out-dir", default=REPORTS_DIR)
+    parser.add_argument("--rescore", action="store_true", help="ignore cached scores")
+    parser.add_argument("--no-plots", action="store_true")
+    args = parser.parse_args()
+
+    detector = Detector()
+
+    # 1. تحميل بيانات الاختبار
+    t0 = time.perf_counter()
+    df = read_clean(args.data, detector.feature_columns)
+    if "Label" not in df.columns:
+        raise ValueError(f"❌ {args.data} has no Label column")
+    labels = df["Label"].astype(str).str.strip().to_numpy()
+    y_true = attack_mask(labels)
+    print(f"📥 {len(df):,} rows, {int(y_true.sum()):,} attacks ({time.perf_counter() - t0:.1f}s)")
+
+    # 2. الدرجات: مرة وحدة لكل نموذج (أو من الكاش)
+    t0 = time.perf_counter()
+    scores, cached = load_or_score(args.data, detector, df, rescore=args.rescore)
+    print(f"{'🗂️ Cached' if cached else '🧮 Scored'} {', '.join(scores)} ({time.perf_counter() - t0:.1f}s)")
+    del df
+
+    # 3. المنحنيات
+    t0 = time.perf_counter()
+    curves = {name: ScoreCurve(s, y_true, labels) for name, s in scores.items()}
+    normalized = normalize_scores(scores, detector)
+    if len(scores) >= 2:
+        fused, _ = fuse(normalized, normalize_weights(None, normalized))
+        curves[ENSEMBLE] = ScoreCurve(fused, y_true, labels)
+    report = {
+        "data": os.path.basename(args.data),
+        "model_version": detector.model_version,
+        "n_rows": int(len(y_true)),
+        "n_attacks": int(y_true.sum()),
+        "models": {},
+    }
+    for name, curve in curves.items():
+        entry = curve.summary(REPORT_QS)
+        entry["sweep"] = _records(curve.sweep(DEFAULT_QS))
+        entry["label_recall"] = curve.label_recall(REPORT_QS).to_dict(orient="index")
+        report["models"][name] = entry
+    if len(scores) >= 2:
+        report["ensemble_vote"] = ensemble_vote(normalized, y_true, args.q)
+    sweep_s = time.perf_counter() - t0
+    print(f"📈 {len(DEFAULT_QS)} thresholds x {len(curves)} models in {sweep_s:.2f}s")
+
+    # 4. الجدول
+    print(f"\n{'model':<18} {'ROC-AUC':>8} {'AP':>7}   " + "   ".join(f"q={q:<6g} P / R / F1" for q in REPORT_QS))
+    for name, entry in report["models"].items():
+        ops = "   ".join(
+            f"{op['precision']:.2f}/{op['recall']:.2f}/{op['f1']:.2f}".ljust(19)
+            for op in entry["operating_points"]
+        )
+        auc = entry["roc_auc"] if entry["roc_auc"] is not None else float("nan")
+        ap = entry["average_precision"] if entry["average_precision"] is not None else float("nan")
+        print(f"{name:<18} {auc:8.4f} {ap:7.4f}   {ops}")
+
+    if "ensemble_vote" in report:
+        v = report["ensemble_vote"]
+        print(f"\n🛡️ Ensemble vote @ q={v['q']:g}: precision={v['precision']:.3f} "
+              f"recall={v['recall']:.3f} f1={v['f1']:.3f} ({v['alerts']:,} alerts)")
+
+    # 5. الحفظ
+    os.makedirs(args.out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.data))[0]
+    out_prefix = os.path.join(args.out_dir, f"eval_{stem}_{detector.model_version}")
+    with open(out_prefix + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Report saved: {out_prefix}.json")
+
+    if not args.no_plots:
+        for p in save_plots(curves, report, out_prefix):
+            print(f"🖼️ {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,16 @@ make_artifacts.py
 - feature_columns.json
   يحدد ترتيب وأسماء الأعمدة اللي تتوقعها النماذج
 
+- calibration.json
+  وسيط كل عمود (median) من بيانات التدريب + توزيع مرجعي لدرجات
+  Isolation Forest (إذا كان if_model.pkl موجود)، عشان نقدر نقيّم
+  flow واحد أو دفعة صغيرة بعتبة ثابتة (Detector.score_one)
+
+Detector يقرأ models/bundle قبل الملفات القديمة: إذا الحزمة فيها نفس
+الـScaler ونفس Isolation Forest، تنكتب المعايرة فيها بعد؛ وإذا لا، يطلع
+تحذير إن الحزمة تغطي على هذه الملفات (أعد بناءها بـmake_bundle.py
+أو درّب الكل بـtrain_models.py)
+
 ملاحظات:
 ---------
 - هذا الملف لا يدرّب النماذج نفسها
@@ -32,6 +42,7 @@ make_artifacts.py
 """
 
 import os
+import sys
 import json
 import joblib
 import pandas as pd
@@ -40,6 +51,11 @@ from sklearn.preprocessing import StandardScaler
 
 # مسار المشروع الأساسي
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.bundle import BUNDLE_DIR, ModelBundle, feature_hash, has_bundle, write_calibration
+from pipeline.forest import CompiledForest
 
 # المسارات
 CLEAN_DIR = os.path.join(BASE_DIR, "data", "clean")
@@ -51,6 +67,31 @@ MONDAY_CLEAN = os.path.join(
 
 SCALER_PATH = os.path.join(MODELS_DIR, "scaler.pkl")
 FEATS_PATH = os.path.join(MODELS_DIR, "feature_columns.json")
+CALIBRATION_PATH = os.path.join(MODELS_DIR, "calibration.json")
+IF_PATH = os.path.join(MODELS_DIR, "if_model.pkl")
+
+# شبكة الـquantiles للتوزيع المرجعي (دقة 0.0005)
+REFERENCE_QUANTILES = np.linspace(0.0, 1.0, 2001)
+DEFAULT_Q = 0.01
+
+
+def _bundle_matches(bundle: ModelBundle, feature_columns, scaler, forest) -> bool:
+    """نفس الأعمدة + نفس الـScaler + نفس Isolation Forest؟"""
+    if forest is None or bundle.feature_hash != feature_hash(feature_columns):
+        return False
+    b_scaler = bundle.get("scaler")
+    b_forest = bundle.get("isolation_forest")
+    if b_scaler is None or b_forest is None:
+        return False
+    return (
+        np.allclose(b_scaler.mean_, scaler.mean_)
+        and np.allclose(b_scaler.scale_, scaler.scale_)
+        and b_forest.offset == forest.offset
+        and all(
+            np.array_equal(getattr(b_forest, k), getattr(forest, k))
+            for k in ("feature", "threshold", "child", "leaf_value", "roots")
+        )
+    )
 
 
 def main():
@@ -74,7 +115,8 @@ def main():
 
     # تنظيف بسيط وآمن
     X = X.replace([np.inf, -np.inf], np.nan)
-    X = X.fillna(X.median(numeric_only=True))
+    medians = X.median(numeric_only=True)
+    X = X.fillna(medians)
 
     # حفظ أسماء الأعمدة (الترتيب مهم)
     feature_columns = list(X.columns)
@@ -90,10 +132,52 @@ def main():
     with open(FEATS_PATH, "w", encoding="utf-8") as f:
         json.dump(feature_columns, f, ensure_ascii=False, indent=2)
 
+    # المعايرة: الوسيط + توزيع الدرجات المرجعي
+    calibration = {
+        "feature_columns": feature_columns,
+        "medians": {c: float(medians[c]) for c in feature_columns},
+    }
+
+    forest = None
+    if os.path.exists(IF_PATH):
+        if_model = joblib.load(IF_PATH)
+        forest = CompiledForest.from_sklearn(if_model)
+        scores = forest.decision_function(
+            scaler.transform(X)
+        )
+        calibration["reference"] = {
+            "n_rows": int(len(scores)),
+            "quantiles": REFERENCE_QUANTILES.tolist(),
+            "scores": np.quantile(scores, REFERENCE_QUANTILES).tolist(),
+        }
+        calibration["threshold"] = {
+            "q": DEFAULT_Q,
+            "value": float(np.quantile(scores, DEFAULT_Q)),
+        }
+    else:
+        print(f"⚠️ {IF_PATH} not found: calibration saved without reference scores")
+
+    with open(CALIBRATION_PATH, "w", encoding="utf-8") as f:
+        json.dump(calibration, f, ensure_ascii=False, indent=2)
+
     # طباعة تأكيد
     print("✅ Artifacts saved successfully:")
     print(f"- {SCALER_PATH}")
     print(f"- {FEATS_PATH}")
+    print(f"- {CALIBRATION_PATH}")
+
+    # Detector يفضّل الحزمة: لازم تكون بنفس المعايرة أو ننبّه إنها تغطي على الملفات
+    if has_bundle(BUNDLE_DIR):
+        bundle = ModelBundle(BUNDLE_DIR)
+        if _bundle_matches(bundle, feature_columns, scaler, forest):
+            write_calibration(BUNDLE_DIR, calibration)
+            print(f"- {os.path.join(BUNDLE_DIR, 'calibration.json')} (bundle {bundle.version})")
+        else:
+            print(
+                f"⚠️ {BUNDLE_DIR} (bundle {bundle.version}) was built from other models and "
+                "Detector loads it instead of these files: rebuild it with scripts/make_bundle.py "
+                "or retrain everything with scripts/train_models.py"
+            )
 
 
 if __name__ == "__main__":
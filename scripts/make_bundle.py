@@ -0,0 +1,117 @@
+"""
+make_bundle.py
+
+يحوّل ملفات النماذج القديمة (models/*.pkl) إلى حزمة نماذج واحدة بإصدار
+(models/bundle) يقرأها Detector بشكل lazy + memory-mapped:
+
+- scaler      -> mean/scale فقط
+- IF          -> مصفوفات الـCompiledForest (pipeline/forest.py)
+- KMeans      -> centroids فقط (بدون labels_ وحالة التدريب)
+- LOF         -> إذا كان lof_model.pkl موجود
+                 (+ LOF تقريبي بمجموعة مرجعية صغيرة مع --approx-lof N)
+- calibration -> إذا كان calibration.json موجود
+
+التشغيل:
+    python scripts/make_bundle.py
+    python scripts/make_bundle.py --with-sklearn-if   # يحفظ نسخة sklearn لـengine="sklearn"
+    python scripts/make_bundle.py --approx-lof 5000   # LOF تقريبي + تقرير الدقة مقابل LOF الكامل
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import joblib
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.bundle import BUNDLE_DIR, save_bundle
+from pipeline.lof import ApproxLOF, accuracy_report
+
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+FEATS_PATH = os.path.join(MODELS_DIR, "feature_columns.json")
+SCALER_PATH = os.path.join(MODELS_DIR, "scaler.pkl")
+CALIBRATION_PATH = os.path.join(MODELS_DIR, "calibration.json")
+IF_PATH = os.path.join(MODELS_DIR, "if_model.pkl")
+LOF_PATH = os.path.join(MODELS_DIR, "lof_model.pkl")
+KMEANS_PATH = os.path.join(MODELS_DIR, "kmeans_model.pkl")
+
+
+def _load(path):
+    if not os.path.exists(path):
+        print(f"⚠️ Not found, skipped: {path}")
+        return None
+    return joblib.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build models/bundle from legacy pickles")
+    parser.add_argument("--out", default=BUNDLE_DIR)
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--with-sklearn-if", action="store_true")
+    parser.add_argument("--approx-lof", type=int, default=0, metavar="N",
+                        help="build an approximate LOF with N reference rows")
+    parser.add_argument("--accuracy-rows", type=int, default=2000,
+                        help="held-out training rows used to compare approx vs exact LOF")
+    args = parser.parse_args()
+
+    for p in [FEATS_PATH, SCALER_PATH, IF_PATH]:
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"❌ File not found: {p}")
+
+    with open(FEATS_PATH, "r", encoding="utf-8") as f:
+        feature_columns = json.load(f)
+
+    calibration = None
+    if os.path.exists(CALIBRATION_PATH):
+        with open(CALIBRATION_PATH, "r", encoding="utf-8") as f:
+            calibration = json.load(f)
+
+    lof_model = _load(LOF_PATH)
+    lof_approx = None
+    if args.approx_lof and lof_model is not None:
+        # صفوف للتقييم ما تدخل المجموعة المرجعية للـLOF التقريبي
+        rng = np.random.default_rng(0)
+        n_fit = len(lof_model._fit_X)
+        held_out = np.zeros(n_fit, dtype=bool)
+        held_out[rng.choice(n_fit, min(args.accuracy_rows, n_fit // 2), replace=False)] = True
+        lof_approx = ApproxLOF.from_sklearn(
+            lof_model, n_reference=args.approx_lof, rows=np.flatnonzero(~held_out)
+        )
+
+        # LOF الكامل: negative_outlier_factor_ يحسب كل صف تدريب بدونه هو
+        # (leave-one-out)، لأن decision_function على صف تدريب يلقى الصف نفسه
+        # كأقرب جار (مسافة 0) فتطلع الدقة أعلى من الواقع
+        exact = lof_model.negative_outlier_factor_[held_out] - lof_model.offset_
+        approx = lof_approx.decision_function(lof_model._fit_X[held_out])
+        lof_approx.accuracy = accuracy_report(exact, approx)
+        print(f"📏 Approx LOF accuracy (held-out rows): {lof_approx.accuracy}")
+
+    manifest = save_bundle(
+        args.out,
+        feature_columns=feature_columns,
+        scaler=_load(SCALER_PATH),
+        if_model=_load(IF_PATH),
+        kmeans_model=_load(KMEANS_PATH),
+        lof_model=lof_model,
+        lof_approx=lof_approx,
+        calibration=calibration,
+        version=args.version,
+        include_sklearn_if=args.with_sklearn_if,
+    )
+
+    size = sum(
+        os.path.getsize(os.path.join(args.out, f)) for f in os.listdir(args.out)
+    )
+    print(f"✅ Bundle {manifest['version']} saved: {args.out} ({size / 1024:.0f} KB)")
+    print(f"- models: {', '.join(manifest['models'])}")
+    print(f"- feature hash: {manifest['feature_hash']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+migrate_store.py
+
+يستورد ملفات الحوادث القديمة (data/actions/incident_*.json) وسجل الإجراءات
+(actions_log.jsonl مع الملفات المدوّرة) إلى قاعدة SQLite الموحدة
+(data/siyaj.sqlite) حتى يصير البحث بالمنفذ / الفرضية / الشدة عبر الفهارس
+بدل قراءة كل الملفات.
+
+آمن للتشغيل أكثر من مرة (الحوادث بمعرّفها، والإجراءات المكررة تُتجاهل).
+
+التشغيل:
+    python scripts/migrate_store.py
+    python scripts/migrate_store.py --actions-dir data/actions --db data/siyaj.sqlite
+"""
+
+import os
+import sys
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.store import STORE_PATH, IncidentStore
+
+ACTIONS_DIR = os.path.join(BASE_DIR, "data", "actions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JSON incidents + action log into the SQLite store")
+    parser.add_argument("--actions-dir", default=ACTIONS_DIR)
+    parser.add_argument("--db", default=STORE_PATH)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.actions_dir):
+        raise FileNotFoundError(f"❌ Directory not found: {args.actions_dir}")
+
+    store = IncidentStore(args.db)
+    report = store.migrate_json(args.actions_dir)
+
+    print(f"✅ Imported into {args.db}")
+    print(f"- incidents: {report['incidents']} (total {store.count('incidents'):,})")
+    print(f"- actions:   {report['actions']} new (total {store.count('actions'):,})")
+    for line in report["skipped"]:
+        print(f"⚠️ Skipped {line}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+pcap_to_flows.py
+
+يحسب ميزات التدفق (78 ميزة بنفس ترتيب models/feature_columns.json) من ملف
+pcap مباشرة عبر pipeline/flowmeter.py، بدل الاعتماد على CSV جاهز من
+CICFlowMeter. الناتج CSV بنفس شكل ملفات CICIDS (مع Flow ID / IPs)،
+ومع --score يتم تمرير كل دفعة على Detector مباشرة.
+
+التشغيل:
+    python scripts/pcap_to_flows.py capture.pcap
+    python scripts/pcap_to_flows.py capture.pcap --out data/flows/capture_flows.csv --score
+"""
+
+import os
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.flowmeter import FlowMeter, PcapReader, flow_frames
+
+FLOWS_DIR = os.path.join(BASE_DIR, "data", "flows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute CICIDS-style flow features from a pcap file")
+    parser.add_argument("pcap")
+    parser.add_argument("--out", default=None, help="output CSV (default: data/flows/<name>_flows.csv)")
+    parser.add_argument("--active-timeout", type=float, default=120.0)
+    parser.add_argument("--idle-timeout", type=float, default=60.0)
+    parser.add_argument("--max-flows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--score", action="store_true", help="score each batch with Detector")
+    parser.add_argument("--q", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.pcap):
+        raise FileNotFoundError(f"❌ File not found: {args.pcap}")
+
+    out = args.out
+    if out is None:
+        name = os.path.splitext(os.path.basename(args.pcap))[0]
+        out = os.path.join(FLOWS_DIR, f"{name}_flows.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+    detector = None
+    if args.score:
+        from pipeline.detect import Detector
+        detector = Detector()
+
+    meter = FlowMeter(
+        active_timeout=args.active_timeout,
+        idle_timeout=args.idle_timeout,
+        max_flows=args.max_flows,
+    )
+
+    t0 = time.time()
+    n_flows, n_alerts, header = 0, 0, True
+    with PcapReader(args.pcap) as reader:
+        for frame in flow_frames(reader, meter=meter, batch_size=args.batch_size):
+            if detector is not None:
+                # دفعات صغيرة/حية: العتبة والوسيطات من المعايرة إن وجدت
+                fixed = detector.calibration is not None
+                result = detector.score(frame, q=args.q, fixed_threshold=fixed)
+                frame["if_score"] = result["if_scores"]
+                frame["is_anomaly"] = result["is_anomaly"]
+                n_alerts += int(result["is_anomaly"].sum())
+
+            frame.to_csv(out, mode="w" if header else "a", header=header, index=False)
+            header = False
+            n_flows += len(frame)
+        skipped = reader.n_skipped
+
+    print(f"✅ Flows saved: {out}")
+    print(f"- packets: {meter.stats['packets']:,} (skipped non TCP/UDP: {skipped:,})")
+    print(f"- flows:   {n_flows:,} (evicted early: {meter.stats['evicted']:,})")
+    if detector is not None:
+        print(f"- alerts:  {n_alerts:,}")
+    print(f"⏱️ {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
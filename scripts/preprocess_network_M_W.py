@@ -1,58 +1,227 @@
-import pandas as pd
-import numpy as np
+"""
+preprocess_network_M_W.py
+
+ينظّف ملفات CICIDS الخام (data/row/*.csv) لكل الأيام، مو بس Monday و
+Wednesday:
+- يقرأ كل ملف على دفعات (chunks) بأنواع محددة مسبقًا (float32 للقيم
+  الكسرية / int64 للعدّادات) بدل قراءة الملف كامل بالأنواع الافتراضية،
+  فالذاكرة لكل عملية محدودة بحجم الدفعة
+- يعالج الملفات بالتوازي (عملية مستقلة لكل ملف)
+- يكتب CSV المنظف في data/clean/ + نسخة ثنائية عمودية في data/cache/
+  (نفس صيغة pipeline/columnar.py) فما يحتاج build_cache.py بعده
+- يطبع لكل ملف: الصفوف المحذوفة والسرعة وأعلى ذاكرة
+
+التشغيل:
+    python scripts/preprocess_network_M_W.py                 # كل ملفات data/row
+    python scripts/preprocess_network_M_W.py Monday-WorkingHours.pcap_ISCX.csv --jobs 2
+    python scripts/preprocess_network_M_W.py --chunksize 50000 --no-columnar
+"""
+
 import os
+import sys
+import glob
+import time
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 # تحديد مسار المشروع تلقائياً
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.columnar import CACHE_DIR, ColumnarWriter, cache_dir_for, load_feature_columns
 
 DATA_ROW_DIR = os.path.join(BASE_DIR, 'data', 'row')
 DATA_CLEAN_DIR = os.path.join(BASE_DIR, 'data', 'clean')
 
+CHUNKSIZE = 50_000
 
-def clean_data(filename):
+# أعمدة نصية/تعريفية في نسخة TrafficLabelling (ما تدخل في الميزات)
+META_COLUMNS = {'Flow ID', 'Source IP', 'Destination IP', 'Timestamp'}
 
-    file_path = os.path.join(DATA_ROW_DIR, filename)
+# الأعمدة اللي قيمها كسرية (معدلات/متوسطات/انحرافات) -> float32، والباقي عدّادات -> int64
+FLOAT_MARKERS = ('Mean', 'Std', 'Variance', '/s', 'Ratio', 'Average', 'Avg', 'Rate')
 
-    if not os.path.exists(file_path):
-        print(f"❌ الملف غير موجود: {file_path}")
-        return
 
-    print(f"\n--- جاري تنظيف: {filename} ---")
+def column_dtypes(columns) -> dict:
+    """Output dtype of each numeric column (stripped names)."""
+    return {
+        c: np.float32 if any(m in c for m in FLOAT_MARKERS) else np.int64
+        for c in columns
+    }
 
-    df = pd.read_csv(file_path)
 
-    # تنظيف الأعمدة
-    df.columns = df.columns.str.strip()
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak if sys.platform == 'darwin' else peak * 1024) / 2 ** 20
 
-    # إزالة القيم الغير صالحة
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df.dropna(inplace=True)
 
-    # فصل الليبل
-    if 'Label' in df.columns:
-        labels = df['Label']
-        numeric = df.select_dtypes(include=[np.number])
-        df_final = pd.concat([numeric, labels], axis=1)
-    else:
-        df_final = df.select_dtypes(include=[np.number])
+def clean_data(filename, chunksize=CHUNKSIZE, columnar=True):
+    """
+    ينظف ملف واحد على دفعات ويرجع إحصائياته (dict)، أو None إذا الملف غير موجود.
+    """
+    file_path = filename if os.path.isabs(filename) else os.path.join(DATA_ROW_DIR, filename)
+    filename = os.path.basename(file_path)
+
+    if not os.path.exists(file_path):
+        print(f"❌ الملف غير موجود: {file_path}")
+        return None
+
+    t0 = time.perf_counter()
+
+    # الهيدر فقط: أسماء الأعمدة الخام (فيها مسافات بالبداية) -> الأنواع
+    raw_columns = pd.read_csv(file_path, nrows=0, encoding_errors='replace').columns
+    stripped = raw_columns.str.strip()
+    keep = [r for r, c in zip(raw_columns, stripped) if c not in META_COLUMNS]
+    numeric = [c for c in stripped if c not in META_COLUMNS and c != 'Label']
+    out_dtypes = column_dtypes(numeric)
+
+    # القراءة: الكسري float32، والعدّادات float64 (تتحمل صفوف فاضية / NaN
+    # وتحفظ الأعداد الصحيحة بدقة) ثم تتحول int64 بعد حذف الصفوف الغير صالحة
+    read_dtypes = {
+        r: (str if c == 'Label' else np.float32 if out_dtypes[c] is np.float32 else np.float64)
+        for r, c in zip(raw_columns, stripped) if r in keep
+    }
+    int_columns = [c for c, t in out_dtypes.items() if t is np.int64]
 
     # إنشاء مجلد clean إذا غير موجود (بدون التأثير على الموجود)
     os.makedirs(DATA_CLEAN_DIR, exist_ok=True)
-
     output_name = filename.replace('.csv', '_cleaned.csv')
     output_path = os.path.join(DATA_CLEAN_DIR, output_name)
+    tmp_path = output_path + '.tmp'
+
+    writer = None
+    if columnar:
+        feature_columns = load_feature_columns()
+        if all(c in numeric for c in feature_columns):
+            writer = ColumnarWriter(cache_dir_for(output_path, CACHE_DIR), feature_columns)
+        else:
+            print(f"⚠️ {filename}: feature columns missing, columnar output skipped")
+
+    rows_in = rows_out = nonfinite = no_label = 0
+    fractional = set()
+    header = True
+    reader = pd.read_csv(
+        file_path,
+        usecols=keep,
+        dtype=read_dtypes,
+        chunksize=chunksize,
+        encoding_errors='replace',
+    )
+    for chunk in reader:
+        chunk.columns = chunk.columns.str.strip()
+        rows_in += len(chunk)
+
+        # إزالة القيم الغير صالحة (inf / NaN) بدون نسخ الدفعة كاملة
+        values = chunk[numeric].to_numpy()
+        ok = np.isfinite(values).all(axis=1)
+        nonfinite += int((~ok).sum())
+        if 'Label' in chunk.columns:
+            labelled = chunk['Label'].notna().to_numpy()
+            no_label += int((ok & ~labelled).sum())
+            ok &= labelled
+
+        chunk = chunk[ok]
+        if int_columns:
+            # عدّاد فيه كسور (ملف غير قياسي) يبقى float بدل ما ينقص بصمت
+            block = chunk[int_columns].to_numpy()
+            integral = (block == np.trunc(block)).all(axis=0)
+            chunk = chunk.astype({c: np.int64 for c, i in zip(int_columns, integral) if i})
+            fractional.update(c for c, i in zip(int_columns, integral) if not i)
+
+        # numeric أولًا ثم Label (نفس ترتيب النسخة القديمة)
+        columns = numeric + (['Label'] if 'Label' in chunk.columns else [])
+        chunk = chunk[columns]
+
+        chunk.to_csv(tmp_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        if writer is not None:
+            writer.append(chunk)
+        rows_out += len(chunk)
+
+    os.replace(tmp_path, output_path)
+    # ميتاداتا الكاش تاخذ حجم/وقت CSV النهائي -> is_fresh صحيح
+    if writer is not None:
+        writer.close(output_path)
+
+    seconds = time.perf_counter() - t0
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+    return {
+        'file': filename,
+        'output': output_path,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'dropped_nonfinite': nonfinite,
+        'dropped_no_label': no_label,
+        'seconds': seconds,
+        'rows_per_s': rows_in / seconds if seconds > 0 else 0.0,
+        'mb_per_s': size_mb / seconds if seconds > 0 else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+        'columnar': writer is not None,
+        'fractional_counters': sorted(fractional),
+    }
+
+
+def _clean_worker(args):
+    filename, chunksize, columnar = args
+    return clean_data(filename, chunksize=chunksize, columnar=columnar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean raw CICIDS CSVs (chunked, parallel)")
+    parser.add_argument("files", nargs="*", help="raw CSVs (default: every data/row/*.csv)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--no-columnar", action="store_true", help="CSV output only")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(DATA_ROW_DIR, '*.csv')))
+    if not files:
+        print(f"❌ No raw CSV files found in {DATA_ROW_DIR}")
+        return
 
-    df_final.to_csv(output_path, index=False)
+    tasks = [(f, args.chunksize, not args.no_columnar) for f in files]
+    jobs = max(1, min(args.jobs, len(tasks)))
+    print(f"\n--- جاري تنظيف {len(tasks)} ملف ({jobs} عمليات متوازية) ---")
 
-    print(f"✅ تم الحفظ: {output_path}")
+    t0 = time.perf_counter()
+    results = []
+    if jobs == 1:
+        results = [_clean_worker(t) for t in tasks]
+    else:
+        # maxtasksperchild=1: عملية جديدة لكل ملف -> ذاكرة كل ملف تُقاس لحالها
+        with mp.Pool(jobs, maxtasksperchild=1) as pool:
+            results = list(pool.imap_unordered(_clean_worker, tasks))
+
+    total_in = total_out = 0
+    for r in sorted((r for r in results if r is not None), key=lambda r: r['file']):
+        dropped = r['rows_in'] - r['rows_out']
+        total_in += r['rows_in']
+        total_out += r['rows_out']
+        print(
+            f"✅ {r['file']}: {r['rows_out']:,}/{r['rows_in']:,} rows kept "
+            f"(dropped {dropped:,}: non-finite {r['dropped_nonfinite']:,}, no label {r['dropped_no_label']:,}) "
+            f"| {r['rows_per_s']:,.0f} rows/s, {r['mb_per_s']:.1f} MB/s | peak {r['peak_rss_mb']:.0f} MB"
+        )
+        print(f"   تم الحفظ: {r['output']}" + (" (+ columnar cache)" if r['columnar'] else ""))
+        if r['fractional_counters']:
+            print(f"   ⚠️ kept as float (non-integer values): {', '.join(r['fractional_counters'][:5])}"
+                  + (" ..." if len(r['fractional_counters']) > 5 else ""))
+
+    dt = time.perf_counter() - t0
+    print(f"\n⏱️ {total_in:,} rows in {dt:.1f}s ({total_in / dt if dt > 0 else 0:,.0f} rows/s), "
+          f"kept {total_out:,}")
 
 
 if __name__ == "__main__":
-
-    files = [
-        'Monday-WorkingHours.pcap_ISCX.csv',
-        'Wednesday-workingHours.pcap_ISCX.csv'
-    ]
-
-    for f in files:
-        clean_data(f)
+    main()
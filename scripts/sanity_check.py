@@ -1,10 +1,15 @@
 import os
+import sys
 import json
 import joblib
 import pandas as pd
 import numpy as np
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.columnar import read_clean
 
 CLEAN_DIR = os.path.join(BASE_DIR, "data", "clean")
 MODELS_DIR = os.path.join(BASE_DIR, "models")
@@ -25,7 +30,7 @@ def main():
     scaler = joblib.load(SCALER_PATH)
     if_model = joblib.load(IF_MODEL_PATH)
 
-    df = pd.read_csv(WEDNESDAY_CLEAN)
+    df = read_clean(WEDNESDAY_CLEAN, feature_columns)
 
     labels = None
     if "Label" in df.columns:
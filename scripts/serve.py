@@ -0,0 +1,75 @@
+"""
+serve.py
+
+يشغّل خدمة التقييم (pipeline/server.py): تستقبل التدفقات عبر HTTP
+(POST /score بصيغة NDJSON أو JSON) أو عبر TCP (سطر JSON لكل تدفق)،
+وتجمعها في دفعات صغيرة (max-batch صف أو max-wait-ms) قبل تمريرها على
+Detector دفعة واحدة، وترجع لكل تدفق: score / decision / severity.
+
+التشغيل:
+    python scripts/serve.py
+    python scripts/serve.py --http-port 8080 --tcp-port 9009 --max-batch 512 --max-wait-ms 5
+
+    curl -s localhost:8080/score --data-binary @flows.ndjson
+    curl -s localhost:8080/stats
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.detect import Detector
+from pipeline.server import OVERFLOW_POLICIES, MicroBatcher, ScoringServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Siyaj micro-batching scoring service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=8080, help="-1 disables HTTP")
+    parser.add_argument("--tcp-port", type=int, default=9009, help="-1 disables the line protocol")
+    parser.add_argument("--max-batch", type=int, default=512)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=8192, help="queued flows before backpressure")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default="reject")
+    parser.add_argument("--max-inflight", type=int, default=4096, help="per TCP connection")
+    parser.add_argument("--q", type=float, default=0.01)
+    parser.add_argument("--threshold", type=float, default=None, help="override the alert threshold")
+    args = parser.parse_args()
+
+    detector = Detector()
+
+    batcher = MicroBatcher(
+        detector,
+        max_batch=args.max_batch,
+        max_wait=args.max_wait_ms / 1e3,
+        max_queue=args.max_queue,
+        overflow=args.overflow,
+        q=args.q,
+        threshold=args.threshold,
+    )
+    server = ScoringServer(
+        batcher,
+        host=args.host,
+        http_port=None if args.http_port < 0 else args.http_port,
+        tcp_port=None if args.tcp_port < 0 else args.tcp_port,
+        max_inflight=args.max_inflight,
+    )
+
+    if detector.calibration is None and args.threshold is None:
+        print("⚠️ No calibration found: using the Isolation Forest boundary (threshold 0.0)")
+    print(f"✅ Serving model {detector.model_version} on {args.host} "
+          f"(http={args.http_port}, tcp={args.tcp_port}, threshold={batcher.threshold:.4f})")
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped")
+
+
+if __name__ == "__main__":
+    main()
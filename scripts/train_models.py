@@ -1,39 +1,308 @@
-import pandas as pd
-import joblib
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
-from sklearn.cluster import KMeans
+"""
+train_models.py
+
+أمر تدريب واحد لكل نماذج سياج بدل (make_artifacts.py + train_models.py +
+make_bundle.py) اللي كانت تدرّب كل نموذج لحاله وعلى بيانات غير موحّدة:
+
+1. يقرأ بيانات Monday مرة وحدة (من الكاش العمودي memory-mapped إذا موجود)
+2. يملأ القيم الناقصة بالوسيط ويدرّب الـScaler
+3. يدرّب IF و LOF و KMeans (+ LOF تقريبي) على نفس المصفوفة بعد الـScaler،
+   أي نفس اللي يشوفه Detector وقت التشغيل (ما فيه train/inference skew)
+4. التدريب متوازي: كل نموذج في عملية مستقلة (مع n_jobs الخاص فيه)،
+   والمصفوفة تنحفظ مرة وحدة .npy وكل عملية تفتحها memory-mapped
+5. يكتب حزمة واحدة بإصدار (models/bundle) فيها: feature hash + المعايرة
+   (الوسيط + توزيع الدرجات المرجعي لكل نموذج وللدرجة المدموجة،
+   لـDetector.score_ensemble)
+   + إحصائيات التدريب
+
+التشغيل:
+    python scripts/train_models.py
+    python scripts/train_models.py --jobs 8 --approx-lof 5000
+    python scripts/train_models.py --skip-lof --no-legacy
+"""
+
 import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+
+from pipeline.bundle import BUNDLE_DIR, save_bundle
+from pipeline.columnar import build_cache, is_fresh, load_cached
+from pipeline.ensemble import fuse, reference_cdf
+from pipeline.forest import CompiledForest
+from pipeline.lof import ApproxLOF
+
+CLEAN_DIR = os.path.join(BASE_DIR, "data", "clean")
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+MONDAY_CLEAN = os.path.join(CLEAN_DIR, "Monday-WorkingHours.pcap_ISCX_cleaned.csv")
+
+# شبكة الـquantiles للتوزيع المرجعي (نفس make_artifacts.py)
+REFERENCE_QUANTILES = np.linspace(0.0, 1.0, 2001)
+DEFAULT_Q = 0.01
+
+MODEL_PARAMS = {
+    "isolation_forest": {"contamination": 0.01, "random_state": 42},
+    "lof": {"n_neighbors": 20, "novelty": True},
+    "kmeans": {"n_clusters": 2, "random_state": 42},
+}
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak if sys.platform == "darwin" else peak * 1024) / 2 ** 20
+
+
+def load_training_matrix(csv_path: str):
+    """
+    (X, medians, feature_columns, labels): X float64 بدون inf/NaN (الوسيط
+    مكانها). يقرأ من الكاش العمودي (memory-mapped) ويبنيه أول مرة إذا مو موجود.
+    """
+    if not is_fresh(csv_path):
+        print(f"🗂️ Building columnar cache for {csv_path} ...")
+        build_cache(csv_path)
+    X_raw, labels, meta = load_cached(csv_path, mmap=True)
+
+    X = np.asarray(X_raw, dtype=np.float64)  # النسخة الوحيدة في الذاكرة
+    bad = ~np.isfinite(X)
+    if bad.any():
+        X[bad] = np.nan
+        medians = np.nanmedian(X, axis=0)
+        X = np.where(bad, medians, X)
+    else:
+        medians = np.median(X, axis=0)
+    return X, medians, meta["columns"], labels
+
+
+# --------------------------------------------------------------
+# عمليات التدريب (كل نموذج في عملية مستقلة)
+# --------------------------------------------------------------
+def _reference(scores: np.ndarray) -> dict:
+    """توزيع الدرجات المرجعي (للمعايرة ولتوحيد مقياس الـensemble)."""
+    return {
+        "n_rows": int(len(scores)),
+        "quantiles": REFERENCE_QUANTILES.tolist(),
+        "scores": np.quantile(scores, REFERENCE_QUANTILES).tolist(),
+    }
+
+
+def _fit_worker(name: str, params: dict, n_jobs: int, data_path: str, out_dir: str, approx_rows: int):
+    from threadpoolctl import threadpool_limits
+    from sklearn.ensemble import IsolationForest
+    from sklearn.neighbors import LocalOutlierFactor
+    from sklearn.cluster import KMeans
+
+    X = np.load(data_path, mmap_mode="r")
+    extra = {}
+    t0 = time.perf_counter()
+
+    # BLAS/OpenMP threads = n_jobs, so concurrent models don't oversubscribe the CPU
+    with threadpool_limits(limits=n_jobs):
+        if name == "isolation_forest":
+            model = IsolationForest(n_jobs=n_jobs, **params).fit(X)
+            # توزيع الدرجات المرجعي على نفس بيانات التدريب (للمعايرة)
+            scores = CompiledForest.from_sklearn(model).decision_function(X)
+            extra["reference"] = _reference(scores)
+            extra["threshold"] = {"q": DEFAULT_Q, "value": float(np.quantile(scores, DEFAULT_Q))}
+        elif name == "lof":
+            model = LocalOutlierFactor(n_jobs=n_jobs, **params).fit(X)
+            # decision_function of the training rows themselves (leave-one-out LOF)
+            scores = model.negative_outlier_factor_ - model.offset_
+            extra["references"] = {name: _reference(scores)}
+        elif name == "lof_approx":
+            model = ApproxLOF.fit(X, n_reference=approx_rows, **params)
+            scores = model.decision_function(X)
+            extra["references"] = {name: _reference(scores)}
+        elif name == "kmeans":
+            model = KMeans(**params).fit(X)
+            # ensemble score: minus the distance to the nearest centroid
+            scores = -model.transform(X).min(axis=1)
+            extra["references"] = {name: _reference(scores)}
+        else:
+            raise ValueError(f"Unknown model: {name!r}")
+
+    # درجات التدريب نفسها، لتوزيع الـensemble المدموج (_ensemble_references)
+    np.save(os.path.join(out_dir, f"{name}.scores.npy"), np.asarray(scores, dtype=np.float64))
+
+    fit_s = time.perf_counter() - t0
+    path = os.path.join(out_dir, f"{name}.joblib")
+    joblib.dump(model, path)
+    return name, path, {"fit_s": round(fit_s, 3), "n_jobs": n_jobs, "peak_rss_mb": round(_peak_rss_mb(), 1)}, extra
+
+
+def _ensemble_references(staging: str, references: dict) -> list:
+    """
+    توزيع الدرجة المدموجة (fusion="mean"، أوزان متساوية) على بيانات التدريب،
+    لكل تركيبة نماذج ممكنة (LOF دقيق / تقريبي / بدون). متوسط الـCDFs مو
+    موزّع بانتظام، فالعتبة الثابتة لازم تنحسب من هذا التوزيع مو من q مباشرة.
+    """
+    lof_options = [name for name in ("lof", "lof_approx") if name in references] + [None]
+    out = []
+    for lof in lof_options:
+        models = ["isolation_forest", "kmeans"] + ([lof] if lof else [])
+        weights = {name: 1.0 / len(models) for name in models}
+        normalized = {
+            name: reference_cdf(np.load(os.path.join(staging, f"{name}.scores.npy")), references[name])
+            for name in models
+        }
+        fused, _ = fuse(normalized, weights)
+        out.append({"weights": weights, "reference": _reference(fused)})
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train scaler + IF + LOF + KMeans into one model bundle")
+    parser.add_argument("--source", default=MONDAY_CLEAN, help="cleaned training CSV (benign traffic)")
+    parser.add_argument("--out", default=BUNDLE_DIR)
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="CPU cores shared by all models")
+    parser.add_argument("--skip-lof", action="store_true", help="no exact LOF (slowest model)")
+    parser.add_argument("--approx-lof", type=int, default=5000, metavar="N",
+                        help="reference rows of the approximate LOF (0 = none)")
+    parser.add_argument("--no-legacy", action="store_true",
+                        help="do not refresh models/*.pkl, feature_columns.json, calibration.json")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source) and not is_fresh(args.source):
+        raise FileNotFoundError(f"❌ Training file not found: {args.source}")
+
+    t_start = time.perf_counter()
+
+    # 1) البيانات مرة وحدة
+    t0 = time.perf_counter()
+    X, medians, feature_columns, labels = load_training_matrix(args.source)
+    load_s = time.perf_counter() - t0
+    print(f"📥 {X.shape[0]:,} rows x {X.shape[1]} features ({load_s:.1f}s)")
+
+    # 2) Scaler ثم مصفوفة واحدة لكل النماذج
+    t0 = time.perf_counter()
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    del X
+    scale_s = time.perf_counter() - t0
+
+    staging = tempfile.mkdtemp(prefix="siyaj-train-", dir=os.path.dirname(os.path.abspath(args.out)))
+    try:
+        data_path = os.path.join(staging, "X_scaled.npy")
+        np.save(data_path, X_scaled)
+        n_rows = len(X_scaled)
+        del X_scaled
+
+        # 3) التدريب المتوازي
+        jobs = {"isolation_forest": MODEL_PARAMS["isolation_forest"], "kmeans": MODEL_PARAMS["kmeans"]}
+        if not args.skip_lof:
+            jobs["lof"] = MODEL_PARAMS["lof"]
+        if args.approx_lof:
+            jobs["lof_approx"] = {"n_neighbors": MODEL_PARAMS["lof"]["n_neighbors"]}
+        n_jobs = max(1, args.jobs // len(jobs))
+
+        print(f"⏳ Training {', '.join(jobs)} in parallel ({n_jobs} core(s) each) ...")
+        t0 = time.perf_counter()
+        models, stats, calibration_extra = {}, {}, {}
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [
+                pool.submit(_fit_worker, name, params, n_jobs, data_path, staging, args.approx_lof)
+                for name, params in jobs.items()
+            ]
+            for fut in as_completed(futures):
+                name, path, s, extra = fut.result()
+                models[name] = joblib.load(path)
+                stats[name] = {**s, "params": jobs[name]}
+                calibration_extra.setdefault("references", {}).update(extra.pop("references", {}))
+                calibration_extra.update(extra)
+                print(f"  ✅ {name:<17} {s['fit_s']:8.1f}s  (peak {s['peak_rss_mb']:.0f} MB)")
+        train_s = time.perf_counter() - t0
+        serial_s = sum(s["fit_s"] for s in stats.values())
+
+        # 4) المعايرة + الحزمة
+        calibration = {
+            "feature_columns": feature_columns,
+            "medians": {c: float(m) for c, m in zip(feature_columns, medians)},
+            **calibration_extra,
+        }
+        calibration["ensemble"] = _ensemble_references(
+            staging, {"isolation_forest": calibration["reference"], **calibration["references"]}
+        )
+
+        label_counts = None
+        if labels is not None:
+            label_counts = {str(k): int(v) for k, v in pd.Series(labels).value_counts().items()}
+
+        training = {
+            "source": os.path.basename(args.source),
+            "n_rows": int(n_rows),
+            "n_features": len(feature_columns),
+            "labels": label_counts,
+            "scaled_inputs": True,
+            "load_s": round(load_s, 3),
+            "scale_s": round(scale_s, 3),
+            "train_wall_s": round(train_s, 3),
+            "train_serial_s": round(serial_s, 3),
+            "models": stats,
+        }
+
+        new_dir = os.path.join(staging, "bundle")
+        manifest = save_bundle(
+            new_dir,
+            feature_columns=feature_columns,
+            scaler=scaler,
+            if_model=models["isolation_forest"],
+            kmeans_model=models["kmeans"],
+            lof_model=models.get("lof"),
+            lof_approx=models.get("lof_approx"),
+            calibration=calibration,
+            version=args.version,
+            include_sklearn_if=True,
+            extra={"training": training},
+        )
+
+        # تبديل الحزمة القديمة بالجديدة دفعة وحدة
+        old_dir = os.path.join(staging, "previous")
+        if os.path.exists(args.out):
+            os.replace(args.out, old_dir)
+        os.replace(new_dir, args.out)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    # 5) الملفات القديمة (models/*.pkl) لنفس النماذج، عشان ما يصير فيه نسختين مختلفتين
+    if not args.no_legacy:
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        joblib.dump(scaler, os.path.join(MODELS_DIR, "scaler.pkl"))
+        joblib.dump(models["isolation_forest"], os.path.join(MODELS_DIR, "if_model.pkl"))
+        joblib.dump(models["kmeans"], os.path.join(MODELS_DIR, "kmeans_model.pkl"))
+        if "lof" in models:
+            joblib.dump(models["lof"], os.path.join(MODELS_DIR, "lof_model.pkl"))
+        with open(os.path.join(MODELS_DIR, "feature_columns.json"), "w", encoding="utf-8") as f:
+            json.dump(feature_columns, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(MODELS_DIR, "calibration.json"), "w", encoding="utf-8") as f:
+            json.dump(calibration, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Bundle {manifest['version']} saved: {args.out}")
+    print(f"- models: {', '.join(manifest['models'])}")
+    print(f"- feature hash: {manifest['feature_hash']}")
+    print(f"- threshold (q={DEFAULT_Q}): {calibration['threshold']['value']:.4f}")
+    print(f"⏱️ training {train_s:.1f}s wall vs {serial_s:.1f}s serial; total {time.perf_counter() - t_start:.1f}s")
+
 
-# التأكد من وجود مجلد الموديلات
-if not os.path.exists('models'):
-    os.makedirs('models')
-
-# 1. تحميل البيانات 
-data = pd.read_csv('data/clean/Monday-WorkingHours.pcap_ISCX_cleaned.csv')
-
-# --- الخطوة السحرية: حذف عمود الكلمات (Label) ---
-# الموديلات تحتاج أرقام فقط للتدريب
-if 'Label' in data.columns:
-    X = data.drop(['Label'], axis=1)
-    print("🗑️ تم حذف عمود Label لتهيئة البيانات للتدريب.")
-else:
-    X = data
-
-# 2. تجهيز الموديلات
-if_model = IsolationForest(contamination=0.01, random_state=42)
-lof_model = LocalOutlierFactor(n_neighbors=20, novelty=True) 
-kmeans_model = KMeans(n_clusters=2, random_state=42)
-
-# 3. التدريب (نستخدم X اللي بدون كلمات)
-print("⏳ جاري تدريب الموديلات الثلاثة (هذا قد يستغرق دقيقة)...")
-if_model.fit(X)
-lof_model.fit(X) 
-kmeans_model.fit(X)
-
-# 4. حفظ الموديلات
-joblib.dump(if_model, 'models/if_model.pkl')
-joblib.dump(lof_model, 'models/lof_model.pkl')
-joblib.dump(kmeans_model, 'models/kmeans_model.pkl')
-
-print("✅ تم تدريب وحفظ جميع الموديلات بنجاح في مجلد models/")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+pipeline.actionlog: buffered writer, rotation, indexed range reads, and logs
+that already hold records from the old unbuffered log_action.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pipeline.actionlog import ActionLogWriter, _index_path, list_segments, read_actions
+
+
+def _legacy_log(path, names, start):
+    # what the old log_action wrote: one JSON line per call, no index
+    with open(path, "w", encoding="utf-8") as f:
+        for i, name in enumerate(names):
+            ts = (start + timedelta(seconds=i)).isoformat()
+            f.write(json.dumps({"action": name, "logged_at": ts}) + "\n")
+
+
+def test_write_flush_read(tmp_path):
+    path = str(tmp_path / "actions.jsonl")
+    with ActionLogWriter(path) as w:
+        for i in range(5):
+            w.write({"action": f"a{i}"})
+        assert w.flush(timeout=5)
+        assert [r["action"] for r in read_actions(path)] == [f"a{i}" for i in range(5)]
+
+
+def test_unserializable_payload_raises_in_caller(tmp_path):
+    path = str(tmp_path / "actions.jsonl")
+    with ActionLogWriter(path) as w:
+        with pytest.raises(TypeError):
+            w.write({"action": object()})
+        w.write({"action": "ok"})
+        assert w.flush(timeout=5)
+    assert [r["action"] for r in read_actions(path)] == ["ok"]
+
+
+def test_flush_after_close_returns(tmp_path):
+    w = ActionLogWriter(str(tmp_path / "actions.jsonl"))
+    w.close()
+    t0 = time.monotonic()
+    assert w.flush() is False
+    assert time.monotonic() - t0 < 1
+
+
+def test_range_reads_across_rotated_segments(tmp_path):
+    path = str(tmp_path / "actions.jsonl")
+    with ActionLogWriter(path, max_bytes=None, max_age=None) as w:
+        for i in range(9):
+            w.write({"action": f"a{i}", "logged_at": 1_000.0 + i})
+            if i % 3 == 2:
+                w.flush(timeout=5)
+                w.rotate()
+
+    segments = list_segments(path)
+    assert len(segments) == 3 and all(s.endswith(".gz") for s in segments)
+    assert [r["action"] for r in read_actions(path)] == [f"a{i}" for i in range(9)]
+    assert [r["action"] for r in read_actions(path, 1_002.5, 1_006)] == ["a3", "a4", "a5", "a6"]
+    assert read_actions(path, 2_000) == []
+
+
+def test_rotation_by_size(tmp_path):
+    path = str(tmp_path / "actions.jsonl")
+    with ActionLogWriter(path, max_bytes=200, compress=False) as w:
+        for i in range(20):
+            w.write({"action": f"a{i}", "pad": "x" * 40})
+            w.flush(timeout=5)
+    assert len(list_segments(path)) > 1
+    assert [r["action"] for r in read_actions(path)] == [f"a{i}" for i in range(20)]
+
+
+def test_legacy_records_are_kept(tmp_path):
+    path = str(tmp_path / "actions.jsonl")
+    start = datetime(2026, 1, 1)
+    _legacy_log(path, ["old1", "old2", "old3"], start)
+
+    with ActionLogWriter(path) as w:
+        w.write({"action": "new"})
+        w.flush(timeout=5)
+
+    with open(_index_path(path), encoding="utf-8") as f:
+        assert f.readline().split() == [f"{datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp():.6f}", "0"]
+    assert [r["action"] for r in read_actions(path)] == ["old1", "old2", "old3", "new"]
+    window = read_actions(path, start, start + timedelta(seconds=1.5))
+    assert [r["action"] for r in window] == ["old1", "old2"]
+
+
+def test_legacy_records_behind_an_unseeded_index(tmp_path):
+    # index written by an earlier version that did not cover the old records
+    path = str(tmp_path / "actions.jsonl")
+    _legacy_log(path, ["old1", "old2"], datetime(2026, 1, 1))
+    size = os.path.getsize(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"action": "new", "logged_at": "2026-06-01T00:00:00"}) + "\n")
+    with open(_index_path(path), "w", encoding="utf-8") as f:
+        f.write(f"{datetime(2026, 6, 1, tzinfo=timezone.utc).timestamp():.6f} {size}\n")
+
+    assert [r["action"] for r in read_actions(path)] == ["old1", "old2", "new"]
@@ -0,0 +1,75 @@
+"""
+pipeline.aggregate: grouping anomalies by signature, and group alerts whose
+evidence matches the group they stand for.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.aggregate import aggregate_anomalies, build_group_alerts
+from pipeline.alerts import build_alerts
+from pipeline.detect import Detector
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return Detector()
+
+
+@pytest.fixture(scope="module")
+def scored(detector):
+    rng = np.random.default_rng(5)
+    cols = detector.feature_columns
+    df = pd.DataFrame(rng.standard_cauchy((3_000, len(cols))) * 100, columns=cols)
+    df["Destination Port"] = rng.choice([80.0, 443.0], len(df))
+    # a burst of identical flows
+    df.iloc[:200] = df.iloc[0].to_numpy()
+    return df, detector.score(df, q=0.1)
+
+
+def test_groups_cover_every_anomaly(detector, scored):
+    df, result = scored
+    groups = aggregate_anomalies(df, result, detector=detector)
+
+    assert groups["count"].sum() == result["is_anomaly"].sum()
+    assert groups["score_min"].is_monotonic_increasing
+    assert groups.attrs == {"k": 3, "evidence": "attribution"}
+
+
+def test_identical_rows_form_one_group(detector, scored):
+    df, result = scored
+    indices = np.r_[0:200, 1_000:1_050]
+    groups = aggregate_anomalies(df, result, indices=indices, detector=detector)
+
+    # (other rows may share its signature, the burst is never split)
+    burst = groups[groups["first_index"] == 0].iloc[0]
+    assert burst["count"] >= 200
+    assert groups["count"].sum() == len(indices)
+
+
+@pytest.mark.parametrize("k, evidence", [(3, None), (5, "zscore")])
+def test_group_alert_evidence_matches_the_group(detector, scored, k, evidence):
+    df, result = scored
+    groups = aggregate_anomalies(df, result, detector=detector, k=k, evidence=evidence)
+    alerts = build_group_alerts(df, result, groups, detector=detector)
+
+    for alert, g in zip(alerts, groups.itertuples(index=False)):
+        assert alert["row_index"] == g.representatives[0]
+        assert len(alert["evidence"]["top_features"]) == k
+        assert sorted(alert["evidence"]["top_features"]) == sorted(g.top_features)
+        assert alert["evidence"]["method"] == groups.attrs["evidence"]
+        assert alert["aggregation"]["count"] == g.count
+
+
+def test_group_alerts_reuse_the_batch(detector, scored):
+    df, result = scored
+    batch = build_alerts(df, result, detector=detector)
+    groups = aggregate_anomalies(df, result, batch=batch)
+    assert groups.attrs == {"k": 5, "evidence": "attribution"}
+
+    alerts = build_group_alerts(df, result, groups.iloc[[0, 2]], batch=batch)
+    head = groups.loc[0, "representatives"][0]
+    assert alerts[0]["evidence"] == batch.get(head)["evidence"]
+    assert alerts[1]["aggregation"]["group_id"] == 2
+    # the cached batch alert is left untouched
+    assert "aggregation" not in batch.get(head)
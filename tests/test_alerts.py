@@ -0,0 +1,64 @@
+"""
+pipeline.alerts: attribution evidence whenever a detector is given, computed
+on the rows exactly as they were scored.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.alerts import _attribution, build_alert, build_alerts
+from pipeline.attribution import attribute
+from pipeline.detect import Detector
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return Detector()
+
+
+@pytest.fixture(scope="module")
+def scored(detector):
+    rng = np.random.default_rng(11)
+    cols = detector.feature_columns
+    df = pd.DataFrame(rng.standard_cauchy((2_000, len(cols))) * 100, columns=cols)
+    df["Destination Port"] = rng.choice([22, 80, 443, 8080], len(df))
+    df.iloc[rng.integers(0, len(df), 200), rng.integers(0, len(cols), 200)] = np.nan
+    df.iloc[rng.integers(0, len(df), 50), rng.integers(0, len(cols), 50)] = np.inf
+    return df, detector.score(df, q=0.05)
+
+
+def test_attribution_uses_the_scoring_medians(detector, scored):
+    df, result = scored
+    bad = ~np.isfinite(df.to_numpy()).all(axis=1)
+    rows = np.r_[np.flatnonzero(bad)[:20], np.flatnonzero(~bad)[:5]]
+
+    values, columns = _attribution(df, rows, detector)
+    X_scaled = detector._prepare(df).to_numpy()[rows]
+    np.testing.assert_array_equal(values, attribute(detector.if_compiled, X_scaled))
+    assert list(columns) == detector.feature_columns
+
+
+def test_detector_means_attribution(detector, scored):
+    df, result = scored
+    assert build_alerts(df, result, detector=detector).evidence == "attribution"
+    assert build_alerts(df, result).evidence == "zscore"
+    assert build_alerts(df, result, detector=detector, evidence="zscore").evidence == "zscore"
+
+
+def test_build_alert_matches_the_batch(detector, scored):
+    df, result = scored
+    batch = build_alerts(df, result, detector=detector)
+    for pos in (0, len(batch) // 2, len(batch) - 1):
+        index = int(batch.indices[pos])
+        single = build_alert(df, result, index, detector=detector)
+        assert single["evidence"] == batch[pos]["evidence"]
+        assert single["hypothesis"] == batch[pos]["hypothesis"]
+        assert single["dst_port"] == batch[pos]["dst_port"]
+
+
+def test_build_alert_without_detector_keeps_raw_magnitudes(scored):
+    df, result = scored
+    index = int(np.flatnonzero(result["is_anomaly"])[0])
+    alert = build_alert(df, result, index)
+    expected = df.iloc[index].abs().sort_values(ascending=False).head(5).index.tolist()
+    assert alert["evidence"] == {"top_features": expected}
@@ -0,0 +1,168 @@
+"""
+pipeline.flowmeter: CICIDS features of a small hand-built pcap, and the
+flow table's timeouts and bound.
+"""
+import socket
+import struct
+
+import numpy as np
+import pytest
+
+from pipeline.flowmeter import (
+    ACK, FIN, META_COLUMNS, PSH, SYN, FlowMeter, Packet, PcapReader, flow_frames, read_pcap,
+)
+
+CLIENT, SERVER, DNS = "10.0.0.1", "10.0.0.2", "10.0.0.3"
+T0 = 1_499_000_000
+
+
+def _tcp(src, dst, sport, dport, flags, payload=0, window=1000):
+    tcp = struct.pack("!HHIIBBHHH", sport, dport, 0, 0, 5 << 4, flags, window, 0, 0) + b"x" * payload
+    return _ipv4(src, dst, 6, tcp)
+
+
+def _udp(src, dst, sport, dport, payload):
+    udp = struct.pack("!HHHH", sport, dport, 8 + payload, 0) + b"x" * payload
+    return _ipv4(src, dst, 17, udp)
+
+
+def _ipv4(src, dst, proto, l4):
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(l4), 0, 0, 64, proto, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return b"\x00" * 12 + b"\x08\x00" + ip + l4
+
+
+def _write_pcap(path, records):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for usec, frame in records:
+            f.write(struct.pack("<IIII", T0 + usec // 1_000_000, usec % 1_000_000, len(frame), len(frame)))
+            f.write(frame)
+
+
+@pytest.fixture
+def pcap(tmp_path):
+    c, s = (CLIENT, SERVER, 40000, 80), (SERVER, CLIENT, 80, 40000)
+    records = [
+        (0, _tcp(*c, SYN, window=1000)),
+        (100_000, _tcp(*s, SYN | ACK, window=2000)),
+        (200_000, _tcp(*c, ACK)),
+        (300_000, _tcp(*c, PSH | ACK, payload=100)),
+        (500_000, _tcp(*s, PSH | ACK, payload=300)),
+        (550_000, b"\x00" * 12 + b"\x08\x06" + b"\x00" * 28),  # ARP: skipped
+        (600_000, _tcp(*c, FIN | ACK)),
+        (650_000, _udp(DNS, CLIENT, 53, 5353, payload=40)),
+        (700_000, _tcp(*s, FIN | ACK)),
+    ]
+    path = str(tmp_path / "small.pcap")
+    _write_pcap(path, records)
+    return path
+
+
+def test_reader(pcap):
+    with PcapReader(pcap) as reader:
+        packets = list(reader)
+        assert reader.n_skipped == 1
+    assert len(packets) == 8
+    syn = packets[0]
+    assert (syn.sport, syn.dport, syn.proto, syn.header, syn.length, syn.window) == (40000, 80, 6, 20, 0, 1000)
+    assert syn.ts == pytest.approx(T0)
+
+
+def test_tcp_flow_features(pcap):
+    meter = FlowMeter()
+    flows = list(meter.process(read_pcap(pcap)))
+    # the TCP flow ends on the second FIN, the UDP one on flush
+    assert [f.proto for f in flows] == [6, 17]
+    f = meter.feature_dict(flows[0])
+
+    expected = {
+        "Destination Port": 80,
+        "Flow Duration": 700_000,
+        "Total Fwd Packets": 4,
+        "Total Backward Packets": 3,
+        "Total Length of Fwd Packets": 100,
+        "Total Length of Bwd Packets": 300,
+        "Fwd Packet Length Max": 100,
+        "Fwd Packet Length Min": 0,
+        "Fwd Packet Length Mean": 25,
+        "Bwd Packet Length Max": 300,
+        "Flow Bytes/s": 400 / 0.7,
+        "Flow Packets/s": 7 / 0.7,
+        "Flow IAT Mean": 700_000 / 6,
+        "Flow IAT Max": 200_000,
+        "Flow IAT Min": 100_000,
+        "Fwd IAT Total": 600_000,
+        "Bwd IAT Total": 600_000,
+        "Fwd PSH Flags": 1,
+        "Bwd PSH Flags": 1,
+        "Fwd Header Length": 80,
+        "Bwd Header Length": 60,
+        "FIN Flag Count": 2,
+        "SYN Flag Count": 2,
+        "PSH Flag Count": 2,
+        "ACK Flag Count": 6,
+        "Down/Up Ratio": 0,
+        "Average Packet Size": 400 / 7,
+        "Init_Win_bytes_forward": 1000,
+        "Init_Win_bytes_backward": 2000,
+        "act_data_pkt_fwd": 1,
+        "min_seg_size_forward": 20,
+        "Subflow Fwd Packets": 4,
+        "Active Max": 700_000,
+        "Idle Max": 0,
+    }
+    for name, value in expected.items():
+        assert f[name] == pytest.approx(value, rel=1e-6, abs=1e-3), name
+    assert f["Fwd Packet Length Std"] == pytest.approx(np.std([0, 0, 100, 0], ddof=1))
+
+
+def test_rows_follow_feature_columns(pcap):
+    meter = FlowMeter()
+    (frame,) = list(flow_frames(read_pcap(pcap), meter=meter))
+
+    assert list(frame.columns) == META_COLUMNS + meter.feature_columns
+    assert len(meter.feature_columns) == 78
+    assert not frame.loc[0, meter.feature_columns].isna().any()
+    assert frame["Flow ID"].tolist() == [
+        f"{CLIENT}-{SERVER}-40000-80-6",
+        f"{DNS}-{CLIENT}-53-5353-17",
+    ]
+    # one packet: zero duration, so rates are Infinity / NaN like CICFlowMeter's
+    assert np.isinf(frame.loc[1, "Flow Bytes/s"])
+    assert np.isnan(frame.loc[1, "Bwd Packets/s"])
+
+
+def _pkt(ts, sport, flags=ACK):
+    src, dst = socket.inet_aton(CLIENT), socket.inet_aton(SERVER)
+    return Packet(ts, src, dst, sport, 80, 6, 10, 20, flags, 1000)
+
+
+def test_idle_and_active_timeouts():
+    meter = FlowMeter(active_timeout=10.0, idle_timeout=3.0)
+    done = []
+    for ts in (0.0, 1.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0):
+        done += meter.update(_pkt(ts, 1234))
+    done += meter.flush()
+
+    # the idle gap 1 -> 5 ends the first flow; the second (started at 5)
+    # never reaches the active timeout and ends on flush
+    assert [f.all_len.n for f in done] == [2, 7]
+    assert meter.stats["timed_out"] == 1
+
+    meter = FlowMeter(active_timeout=2.0)
+    done = []
+    for ts in (0.0, 1.0, 2.0, 2.5, 3.0):
+        done += meter.update(_pkt(ts, 1234))
+    done += meter.flush()
+    assert [f.all_len.n for f in done] == [3, 2]
+
+
+def test_table_is_bounded():
+    meter = FlowMeter(max_flows=3)
+    done = []
+    for i in range(10):
+        done += meter.update(_pkt(i * 0.01, 1000 + i))
+    assert len(meter) == 3
+    assert meter.stats["evicted"] == 7
+    assert [f.sport for f in done] == list(range(1000, 1007))
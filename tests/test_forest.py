@@ -0,0 +1,77 @@
+"""
+pipeline.forest.CompiledForest scores like sklearn's IsolationForest,
+rows with NaN included, and survives the bundle round trip.
+"""
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import IsolationForest
+
+from pipeline.bundle import ModelBundle, has_bundle
+from pipeline.forest import BLOCK_ROWS, CompiledForest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _data(n, d, seed):
+    rng = np.random.default_rng(seed)
+    X = rng.standard_cauchy((n, d))
+    X[:, 0] = np.round(X[:, 0])  # ties on the split thresholds
+    return X
+
+
+def _with_nan(X, seed, frac=0.05):
+    X = X.copy()
+    mask = np.random.default_rng(seed).random(X.shape) < frac
+    X[mask] = np.nan
+    X[0] = np.nan  # a row with nothing but NaN
+    return X
+
+
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"max_features": 0.5, "bootstrap": True},
+    {"max_samples": 64, "n_estimators": 37},
+])
+def test_matches_sklearn(kwargs):
+    X = _data(2_000, 8, seed=0)
+    model = IsolationForest(random_state=0, **kwargs).fit(X)
+    forest = CompiledForest.from_sklearn(model)
+
+    X_test = _data(BLOCK_ROWS + 500, 8, seed=1)  # spans two traversal blocks
+    np.testing.assert_allclose(forest.decision_function(X_test), model.decision_function(X_test), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(forest.score_samples(X_test), model.score_samples(X_test), rtol=0, atol=1e-12)
+
+
+def test_nan_rows_follow_the_recorded_split():
+    # grown on data with NaN, so splits send missing values either way
+    X = _with_nan(_data(3_000, 6, seed=2), seed=3, frac=0.1)
+    model = IsolationForest(random_state=0).fit(X)
+    forest = CompiledForest.from_sklearn(model)
+    assert forest.missing_right.any()
+
+    X_test = _with_nan(_data(1_000, 6, seed=4), seed=5)
+    np.testing.assert_allclose(forest.decision_function(X_test), model.decision_function(X_test), rtol=0, atol=1e-12)
+
+
+def test_rejects_wrong_width():
+    model = IsolationForest(n_estimators=5, random_state=0).fit(_data(200, 4, seed=0))
+    with pytest.raises(ValueError):
+        CompiledForest.from_sklearn(model).decision_function(np.zeros((3, 5)))
+
+
+def test_committed_model_and_bundle():
+    path = os.path.join(BASE_DIR, "models", "if_model.pkl")
+    bundle_dir = os.path.join(BASE_DIR, "models", "bundle")
+    if not os.path.exists(path) or not has_bundle(bundle_dir):
+        pytest.skip("trained models not available")
+
+    model = joblib.load(path)
+    X = _with_nan(_data(1_000, model.n_features_in_, seed=6), seed=7)
+    expected = model.decision_function(X)
+
+    np.testing.assert_allclose(CompiledForest.from_sklearn(model).decision_function(X), expected, rtol=0, atol=1e-12)
+    bundled = ModelBundle(bundle_dir).get("isolation_forest")
+    np.testing.assert_allclose(bundled.decision_function(X), expected, rtol=0, atol=1e-12)
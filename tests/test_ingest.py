@@ -0,0 +1,65 @@
+"""
+pipeline.ingest: the one-pass LogProcessor.extract_many / extract_stream
+give the same rows as the per-line extract_features.
+"""
+import io
+
+import numpy as np
+import pytest
+
+from pipeline.ingest import LogProcessor
+
+FEATURES = ["Destination Port", "Flow Duration", "Total Fwd Packets", "Total Backward Packets", "Flow Bytes/s"]
+
+LINES = [
+    "ALERT TCP SYN FLOOD PORT:80 DUR:12 FWD:4200 BACK:0",
+    "DUR:5 PORT:443",                          # any field order
+    "PORT:22 PORT:23 FWD:1",                   # first occurrence wins
+    "no fields on this line",
+    "SRC=10.0.0.1 BACK:7",
+    "PORT:8080 DUR:119999998 FWD:3 BACK:2",     # beyond float32's exact integers
+    "",
+]
+
+
+@pytest.fixture
+def processor():
+    return LogProcessor(FEATURES)
+
+
+def _expected(processor, lines):
+    # float32 like the batch matrix
+    return np.vstack([processor.extract_features(line).to_numpy(dtype=np.float32) for line in lines])
+
+
+def test_extract_many_matches_extract_features(processor):
+    batch = processor.extract_many(LINES)
+    parsed = [i for i, line in enumerate(LINES) if ":" in line]
+
+    assert batch.n_lines == len(LINES)
+    assert batch.n_malformed == len(LINES) - len(parsed)
+    np.testing.assert_array_equal(batch.line_numbers, parsed)
+    np.testing.assert_array_equal(batch.X, _expected(processor, [LINES[i] for i in parsed]))
+
+    frame = batch.to_frame()
+    assert list(frame.columns) == FEATURES
+    assert frame.loc[2, "Destination Port"] == 22
+
+
+def test_unknown_columns_are_ignored():
+    processor = LogProcessor(["Flow Duration"])
+    batch = processor.extract_many(["PORT:80", "PORT:80 DUR:9"])
+    assert batch.n_malformed == 1
+    np.testing.assert_array_equal(batch.X, [[9.0]])
+
+
+def test_extract_stream_keeps_global_line_numbers(processor):
+    lines = LINES * 5
+    text = io.StringIO("\n".join(lines) + "\n")
+    batches = list(processor.extract_stream(text, chunk_lines=4))
+
+    assert len(batches) == -(-len(lines) // 4)
+    assert sum(b.n_lines for b in batches) == len(lines)
+    whole = processor.extract_many(lines)
+    np.testing.assert_array_equal(np.concatenate([b.line_numbers for b in batches]), whole.line_numbers)
+    np.testing.assert_array_equal(np.vstack([b.X for b in batches]), whole.X)
@@ -0,0 +1,209 @@
+"""
+pipeline.llm_cache against an in-process stand-in for the Chat Completions API
+(a real OpenAI client pointed at it with base_url).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from pipeline import llm_cache
+from pipeline.llm_cache import NoClient, ResponseCache, alert_signature, cached_completion
+
+ALERT = {
+    "ml": {"severity": "High", "score": -0.12},
+    "evidence": {"top_features": ["Flow Duration", "Destination Port", "Total Fwd Packets"]},
+}
+MESSAGES = [{"role": "user", "content": "explain"}]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            n = server.calls
+            fail = n <= server.fail_first
+        time.sleep(server.delay)
+
+        if fail:
+            status, reply = 500, {"error": {"message": "stub failure", "type": "server_error"}}
+        else:
+            status, reply = 200, {
+                "id": f"chatcmpl-{n}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"answer {n}"},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            }
+        data = json.dumps(reply).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.delay = 0.0
+    server.fail_first = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub):
+    return openai.OpenAI(
+        base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        api_key="test",
+        max_retries=0,
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = ResponseCache(str(tmp_path / "llm.sqlite"))
+    yield c
+    c.close()
+
+
+def _complete(signature, client, cache):
+    return cached_completion(MESSAGES, "gpt-4o-mini", signature, client=client, cache=cache)
+
+
+def test_miss_then_hit(stub, client, cache):
+    signature = alert_signature(ALERT, "DoS-like Behavior", "gpt-4o-mini", "test/v1")
+
+    first = _complete(signature, client, cache)
+    second = _complete(signature, client, cache)
+
+    assert first == {"text": "answer 1", "cached": False, "key": first["key"]}
+    assert second["cached"] and second["text"] == "answer 1"
+    assert stub.calls == 1
+
+
+def test_equivalent_alert_hits(stub, client, cache):
+    reordered = {
+        "ml": {"severity": "high", "score": -0.3},
+        "evidence": {"top_features": ["Total Fwd Packets", "Flow Duration", "Destination Port"]},
+    }
+    _complete(alert_signature(ALERT, "DoS-like Behavior", "gpt-4o-mini", "test/v1"), client, cache)
+    out = _complete(alert_signature(reordered, "dos-like behavior", "gpt-4o-mini", "test/v1"), client, cache)
+
+    assert out["cached"]
+    assert stub.calls == 1
+
+
+def test_different_signature_misses(stub, client, cache):
+    _complete(alert_signature(ALERT, "DoS-like Behavior", "gpt-4o-mini", "test/v1"), client, cache)
+    out = _complete(alert_signature(ALERT, "DoS-like Behavior", "gpt-4o-mini", "test/v2"), client, cache)
+
+    assert not out["cached"]
+    assert out["text"] == "answer 2"
+    assert stub.calls == 2
+
+
+def test_related_texts_in_signature():
+    dos = [{"id": "T1498", "title": "Network Denial of Service"}, {"id": "2-5-3-8"}]
+    recon = [{"id": "T1046", "title": "Network Service Discovery"}]
+
+    base = alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1")
+    with_dos = alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1", dos)
+
+    assert with_dos != base
+    assert with_dos != alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1", recon)
+    assert with_dos == alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1", dos[::-1])
+    assert alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1", []) == base
+
+
+def test_ttl_expiry(stub, client, tmp_path):
+    cache = ResponseCache(str(tmp_path / "ttl.sqlite"), ttl=0.2)
+    signature = alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1")
+
+    assert not _complete(signature, client, cache)["cached"]
+    assert _complete(signature, client, cache)["cached"]
+    time.sleep(0.3)
+    out = _complete(signature, client, cache)
+    cache.close()
+
+    assert not out["cached"]
+    assert out["text"] == "answer 2"
+    assert stub.calls == 2
+
+
+def test_concurrent_misses_coalesce(stub, client, cache):
+    stub.delay = 0.3
+    signature = alert_signature(ALERT, "Reconnaissance / Scanning", "gpt-4o-mini", "test/v1")
+    results = []
+
+    def run():
+        results.append(_complete(signature, client, cache))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert stub.calls == 1
+    assert [r["text"] for r in results] == ["answer 1"] * 8
+    assert sum(not r["cached"] for r in results) == 1
+
+
+def test_failed_request_is_not_cached(stub, client, cache):
+    stub.fail_first = 1
+    signature = alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1")
+
+    with pytest.raises(openai.APIStatusError):
+        _complete(signature, client, cache)
+    out = _complete(signature, client, cache)
+
+    assert not out["cached"]
+    assert out["text"] == "answer 2"
+    assert len(cache) == 1
+
+
+def test_no_client_raises(cache, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_cache, "_CLIENT", None)
+    signature = alert_signature(ALERT, "Unknown", "gpt-4o-mini", "test/v1")
+
+    with pytest.raises(NoClient):
+        cached_completion(MESSAGES, "gpt-4o-mini", signature, cache=cache)
+    assert len(cache) == 0
+
+
+def test_assistant_without_key_returns_before_retrieval(monkeypatch):
+    pytest.importorskip("dotenv")
+    from pipeline import llm_live_assistant
+
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("called without an API key")
+
+    monkeypatch.setattr(llm_live_assistant, "get_index", unexpected)
+    monkeypatch.setattr(llm_live_assistant, "get_cache", unexpected)
+    out = llm_live_assistant.generate_soc_assistant(ALERT, {"predicted_attack_type": "DoS"})
+    assert out["status"] == "no_api_key"
+    assert out["attack_type"] == "DoS"
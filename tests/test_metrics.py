@@ -0,0 +1,62 @@
+"""
+pipeline.metrics: stage timings, per-run summaries and the Prometheus text.
+"""
+import pytest
+
+from pipeline.metrics import PREFIX, Registry
+
+
+def test_stage_counts_rows_and_errors():
+    reg = Registry()
+    for _ in range(3):
+        with reg.stage("detect.score", rows=10):
+            pass
+    with pytest.raises(ValueError):
+        with reg.stage("detect.score", rows=10):
+            raise ValueError
+
+    (row,) = reg.run_summary()["stages"]
+    assert row["stage"] == "detect.score"
+    assert row["calls"] == 3 and row["rows"] == 30
+    assert reg.run_summary()["counters"] == {'stage_errors_total{stage="detect.score"}': 1}
+
+
+def test_run_summary_is_relative_to_begin_run():
+    reg = Registry()
+    with reg.stage("a", rows=5):
+        pass
+    reg.inc("alerts_built_total", 2, severity="High")
+    reg.begin_run()
+    with reg.stage("b", rows=1, memory=False):
+        pass
+    reg.inc("alerts_built_total", severity="High")
+
+    summary = reg.run_summary()
+    assert [r["stage"] for r in summary["stages"]] == ["b"]
+    assert summary["counters"] == {'alerts_built_total{severity="High"}': 1}
+
+
+def test_prometheus_exposition():
+    reg = Registry(buckets=(0.1, 1.0))
+    reg.observe("detect.prepare", 0.05, rows=100, mem=2 ** 20)
+    reg.observe("detect.prepare", 0.5, rows=100, mem=0)
+    reg.inc("llm_requests_total", status="ok")
+    text = reg.to_prometheus()
+
+    h = f"{PREFIX}_stage_seconds"
+    assert f'{h}_bucket{{stage="detect.prepare",le="0.1"}} 1' in text
+    assert f'{h}_bucket{{stage="detect.prepare",le="+Inf"}} 2' in text
+    assert f'{h}_count{{stage="detect.prepare"}} 2' in text
+    assert f'{PREFIX}_stage_rows_total{{stage="detect.prepare"}} 200' in text
+    # process-wide high-water-mark growth, not a per-stage peak
+    assert f'{PREFIX}_stage_process_rss_hwm_growth_bytes{{stage="detect.prepare"}} {2 ** 20}' in text
+    assert f'{PREFIX}_llm_requests_total{{status="ok"}} 1' in text
+
+
+def test_disabled_registry_records_nothing():
+    reg = Registry(enabled=False)
+    with reg.stage("x", rows=1):
+        pass
+    reg.inc("y")
+    assert reg.run_summary()["stages"] == []
+    assert reg.to_prometheus() == "\n"
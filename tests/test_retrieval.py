@@ -0,0 +1,136 @@
+"""
+pipeline.retrieval: tokenization, BM25 scores against a direct computation,
+the feature -> technique table, and index freshness.
+"""
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.retrieval import (
+    ATTACK, B, ECC, FEATURE_WEIGHT, K1, RetrievalIndex, attack_documents, build_index, is_fresh, tokenize,
+)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TECHNIQUES = [
+    ("Network Service Discovery", "T1046", "Discovery",
+     "Adversaries may scan for services running on remote hosts, e.g. a port scan. (Citation: Nmap)"),
+    ("Network Denial of Service", "T1498", "Impact",
+     "Adversaries may flood the network to degrade availability of services."),
+    ("Direct Network Flood", "T1498.001", "Impact",
+     "A SYN flood sends a high volume of packets directly at the target network flood flood."),
+    ("Application Layer Protocol", "T1071", "Command and Control",
+     "Adversaries may communicate using application layer protocols to avoid detection."),
+]
+
+
+@pytest.fixture(scope="module")
+def attack_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp("docs") / "enterprise-attack.csv"
+    pd.DataFrame([
+        {"name": n, "id": i, "url": f"https://attack.mitre.org/techniques/{i}", "platforms": "Network",
+         "kill chain phases": k, "description": d, "data sources": "Network Traffic", "detection": ""}
+        for n, i, k, d in TECHNIQUES
+    ]).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def index_dir(attack_csv, tmp_path_factory):
+    out = str(tmp_path_factory.mktemp("index"))
+    meta = build_index(out, attack_csv=attack_csv, ecc_pdf=os.path.join(out, "missing.pdf"),
+                       feature_columns=["SYN Flag Count", "Destination Port", "Label"])
+    assert meta["n_docs"] == len(TECHNIQUES)
+    assert meta["skipped"] == ["missing.pdf (not found)"]
+    return out
+
+
+def test_tokenize_english_and_arabic():
+    assert tokenize("Adversaries may use the Scans of PORTS") == ["scan", "port"]
+    # hamza / taa marbuta folded, diacritics and the article removed
+    assert tokenize("الشَّبكة وأمن") == tokenize("شبكه وامن") == ["شبكه", "وامن"]
+    assert tokenize("٢٠٢٤") == ["2024"]
+
+
+def _bm25(docs, query):
+    counts = [Counter(tokenize(d["text"])) for d in docs]
+    lengths = [sum(c.values()) for c in counts]
+    avgdl = sum(lengths) / len(lengths)
+    scores = np.zeros(len(docs))
+    for term, qtf in Counter(tokenize(query)).items():
+        df = sum(term in c for c in counts)
+        if df == 0:
+            continue
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        for d, c in enumerate(counts):
+            tf = c[term]
+            scores[d] += qtf * idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[d] / avgdl))
+    return scores
+
+
+@pytest.mark.parametrize("query", ["network flood", "port scan", "flood flood discovery", "nothing matches"])
+def test_scores_are_bm25(index_dir, attack_csv, query):
+    index = RetrievalIndex(index_dir)
+    np.testing.assert_allclose(index.scores(query), _bm25(attack_documents(attack_csv), query), rtol=1e-6)
+
+
+def test_search_ranks_and_filters(index_dir):
+    index = RetrievalIndex(index_dir)
+    hits = index.search("SYN flood", k=2)
+    assert [h["id"] for h in hits] == ["T1498.001", "T1498"]
+    assert hits[0]["match_score"] == 1.0
+    assert "Citation" not in index.search("port scan", k=1)[0]["snippet"]
+    assert index.search("SYN flood", category=ECC) == []
+    assert index.search("nothing matches") == []
+
+
+def test_feature_table(index_dir):
+    index = RetrievalIndex(index_dir)
+    assert set(index.features) == {"SYN Flag Count", "Destination Port"}
+
+    shares = index.feature_scores(["SYN Flag Count", "Label"])
+    ids = [d["id"] for d in index.docs]
+    assert shares[ids.index("T1498.001")] == 0.5
+    assert shares[ids.index("T1071")] == 0.0
+
+    # with no text match the features alone pick the technique
+    related = index.related_texts({"evidence": {"top_features": ["SYN Flag Count"]}}, hypothesis="")
+    assert [r["id"] for r in related] == ["T1046", "T1498.001"]
+    assert related[0]["match_score"] == FEATURE_WEIGHT
+    assert all(r["category"] == ATTACK for r in related)
+
+
+def test_freshness_and_version(index_dir, attack_csv):
+    missing = os.path.join(index_dir, "missing.pdf")
+    assert is_fresh(index_dir, attack_csv=attack_csv, ecc_pdf=missing)
+    version = RetrievalIndex(index_dir).version
+
+    with open(attack_csv, "a", encoding="utf-8") as f:
+        f.write('"Extra","T9999","","","","more text","",""\n')
+    try:
+        assert not is_fresh(index_dir, attack_csv=attack_csv, ecc_pdf=missing)
+        out = os.path.join(index_dir, "rebuilt")
+        build_index(out, attack_csv=attack_csv, ecc_pdf=missing, feature_columns=[])
+        assert RetrievalIndex(out).version != version
+    finally:
+        build_index(index_dir, attack_csv=attack_csv, ecc_pdf=missing,
+                    feature_columns=["SYN Flag Count", "Destination Port", "Label"])
+
+
+def test_missing_index_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RetrievalIndex(str(tmp_path))
+
+
+def test_shipped_attack_documents(tmp_path):
+    csv = os.path.join(BASE_DIR, "docs", "enterprise-attack.csv")
+    if not os.path.exists(csv):
+        pytest.skip("docs/enterprise-attack.csv not available")
+    build_index(str(tmp_path), attack_csv=csv, ecc_pdf=str(tmp_path / "missing.pdf"))
+    index = RetrievalIndex(str(tmp_path))
+    assert "T1046" in [h["id"] for h in index.search("port scan", k=3)]
+    assert "T1498" in {h["id"].split(".")[0] for h in index.search("SYN flood DoS", k=3)}
@@ -0,0 +1,122 @@
+"""
+pipeline.server.MicroBatcher: batches close on size or wait, the queue
+rejects or blocks when full, and a flow scores the same in any batch.
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from pipeline.detect import Detector
+from pipeline.server import MicroBatcher, Overloaded
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return Detector()
+
+
+def _flows(detector, n, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.standard_cauchy((n, len(detector.feature_columns))) * 100
+    return [
+        dict(zip(detector.feature_columns, row.tolist()), id=i) for i, row in enumerate(values)
+    ]
+
+
+def _run(batcher, coro_fn):
+    async def main():
+        await batcher.start()
+        try:
+            return await coro_fn()
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_batches_close_at_max_batch(detector):
+    batcher = MicroBatcher(detector, max_batch=4, max_wait=0.05)
+    results = _run(batcher, lambda: batcher.submit(_flows(detector, 10)))
+
+    assert [r["id"] for r in results] == list(range(10))
+    stats = batcher.stats()
+    assert stats["flows"] == 10
+    assert stats["batches"] == 3
+
+
+def test_lone_flow_waits_at_most_max_wait(detector):
+    batcher = MicroBatcher(detector, max_batch=1_000, max_wait=0.05)
+
+    async def one():
+        t0 = time.perf_counter()
+        result = await batcher.submit(_flows(detector, 1))
+        return result, time.perf_counter() - t0
+
+    (result,), elapsed = _run(batcher, one)
+    assert "score" in result
+    assert 0.05 <= elapsed < 1.0
+    assert batcher.stats()["batches"] == 1
+
+
+def test_reject_when_queue_is_full(detector):
+    batcher = MicroBatcher(detector, max_batch=8, max_queue=5, overflow="reject")
+
+    async def too_many():
+        with pytest.raises(Overloaded):
+            await batcher.enqueue(_flows(detector, 6))
+        return await batcher.submit(_flows(detector, 5))
+
+    assert len(_run(batcher, too_many)) == 5
+    assert batcher.stats()["rejected"] == 6
+
+
+def test_block_waits_for_room(detector):
+    batcher = MicroBatcher(detector, max_batch=2, max_queue=2, overflow="block")
+    results = _run(batcher, lambda: batcher.submit(_flows(detector, 11)))
+
+    assert [r["id"] for r in results] == list(range(11))
+    assert batcher.stats()["max_queue_depth"] <= 2
+
+
+def test_bad_flows_get_errors(detector):
+    flows = _flows(detector, 3)
+    del flows[0][detector.feature_columns[0]]
+    flows[1][detector.feature_columns[1]] = "abc"
+
+    batcher = MicroBatcher(detector)
+    results = _run(batcher, lambda: batcher.submit(flows))
+    assert results[0]["error"].startswith("Missing required column")
+    assert results[1]["error"] == "Feature values must be numeric"
+    assert "score" in results[2]
+
+
+def test_non_finite_flow_needs_calibration(detector):
+    flows = _flows(detector, 3)
+    flows[0][detector.feature_columns[2]] = float("nan")
+
+    batcher = MicroBatcher(detector)
+    results = _run(batcher, lambda: batcher.submit(flows))
+    assert "calibration" in results[0]["error"]
+    assert all("score" in r for r in results[1:])
+
+
+def test_score_does_not_depend_on_the_batch(detector):
+    medians = {c: 1.0 for c in detector.feature_columns}
+    detector.calibration = {"medians": medians}
+    detector._medians = np.ones(len(detector.feature_columns))
+    try:
+        flows = _flows(detector, 50, seed=3)
+        flows[0][detector.feature_columns[5]] = float("nan")
+        flows[0][detector.feature_columns[9]] = float("inf")
+
+        alone = MicroBatcher(detector, threshold=0.0)
+        (single,) = _run(alone, lambda: alone.submit(flows[:1]))
+        together = MicroBatcher(detector, threshold=0.0)
+        batch = _run(together, lambda: together.submit(flows))
+    finally:
+        detector.calibration = None
+        detector._medians = None
+
+    assert single["score"] == batch[0]["score"]
+    assert single["decision"] == batch[0]["decision"]
@@ -0,0 +1,114 @@
+"""
+pipeline.store: keyset pagination, filters, and migrating the JSON files of
+an existing deployment (including an action log written before the index).
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from pipeline.actionlog import ActionLogWriter
+from pipeline.store import IncidentStore
+
+
+def _alert(i, severity, port):
+    ts = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i)
+    return {
+        "timestamp": ts.isoformat(),
+        "row_index": i,
+        "dst_port": port,
+        "ml": {"score": -0.1 - i / 1000, "threshold": -0.05, "severity": severity},
+        "evidence": {"top_features": ["Flow Duration"]},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = IncidentStore(str(tmp_path / "store.sqlite"))
+    yield s
+    s.close()
+
+
+def test_keyset_pages_cover_every_row_once(store):
+    # same timestamp for pairs of alerts: the id breaks ties across pages
+    alerts = [_alert(i // 2, "High" if i % 3 else "Low", 80 if i % 2 else 443) for i in range(25)]
+    assert store.insert_alerts(alerts, model_version="v1") == 25
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = store.query_alerts(limit=4, cursor=cursor)
+        seen.extend(rows)
+        if cursor is None:
+            break
+    assert len(seen) == 25
+    assert len({r["id"] for r in seen}) == 25
+    keys = [(r["created_at"], r["id"]) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_filters_and_count(store):
+    alerts = [_alert(i, "High" if i % 3 else "Low", 80 if i % 2 else 443) for i in range(30)]
+    store.insert_alerts(alerts, model_version="v1")
+
+    rows, cursor = store.query_alerts(limit=100, dst_port=80, severity="High")
+    assert cursor is None
+    expected = [i for i in range(30) if i % 2 and i % 3]
+    assert sorted(r["row_index"] for r in rows) == expected
+    assert store.count("alerts", dst_port=80, severity="High") == len(expected)
+    assert store.count("alerts", severity=["High", "Low"]) == 30
+
+    start = datetime(2024, 1, 1, 0, 0, 10, tzinfo=timezone.utc)
+    assert store.count("alerts", start=start) == 20
+
+    with pytest.raises(ValueError):
+        store.query_alerts(colour="red")
+
+
+def test_migrate_pre_existing_actions_dir(store, tmp_path):
+    actions_dir = tmp_path / "actions"
+    actions_dir.mkdir()
+    log = str(actions_dir / "actions_log.jsonl")
+
+    # records from the old unbuffered log_action, then the buffered writer
+    with open(log, "w", encoding="utf-8") as f:
+        for i in range(3):
+            f.write(json.dumps({"action": f"old{i}", "logged_at": f"2024-01-01T00:00:0{i}"}) + "\n")
+    with ActionLogWriter(log) as w:
+        for i in range(2):
+            w.write({"action": f"new{i}", "logged_at": f"2024-01-02T00:00:0{i}"})
+
+    for n, report in enumerate([
+        {"incident_id": "inc-1", "created_at": "2024-01-01T00:00:00", "alert": _alert(1, "High", 80)},
+        {"created_at": "2024-01-01T00:00:01", "alert": _alert(2, "Low", 443)},
+    ]):
+        with open(actions_dir / f"incident_{n}.json", "w", encoding="utf-8") as f:
+            json.dump(report, f)
+    (actions_dir / "incident_broken.json").write_text("{", encoding="utf-8")
+
+    summary = store.migrate_json(str(actions_dir))
+    assert summary["incidents"] == 2
+    assert summary["actions"] == 5
+    assert len(summary["skipped"]) == 1 and "incident_broken.json" in summary["skipped"][0]
+
+    rows, _ = store.query_actions(limit=10)
+    assert sorted(r["action"] for r in rows) == ["new0", "new1", "old0", "old1", "old2"]
+    assert {r["id"] for r in store.query_incidents(limit=10)[0]} == {"inc-1", "legacy-incident_1"}
+    assert store.count("incidents", dst_port=80) == 1
+
+    # running it again imports nothing new
+    again = store.migrate_json(str(actions_dir))
+    assert again["actions"] == 0
+    assert store.count("actions") == 5
+    assert store.count("incidents") == 2
+
+
+def test_live_action_is_not_duplicated_by_migration(store, tmp_path):
+    log = str(tmp_path / "actions_log.jsonl")
+    record = {"action": "block_ip", "status": "simulated", "logged_at": "2024-01-01T00:00:00"}
+    with ActionLogWriter(log) as w:
+        w.write(record)
+    assert store.insert_actions([record]) == 1
+
+    assert store.migrate_json(str(tmp_path), actions_log=log)["actions"] == 0
+    assert store.count("actions") == 1
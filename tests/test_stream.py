@@ -0,0 +1,112 @@
+"""
+pipeline.sketch and Detector.score_stream: the KLL quantile sketch, and the
+two-pass streaming threshold matching a whole-file score().
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline.detect import Detector
+from pipeline.sketch import KLLSketch
+
+
+def test_sketch_rank_error():
+    values = np.random.default_rng(0).standard_cauchy(200_000)
+    sketch = KLLSketch(k=256)
+    for part in np.array_split(values, 37):
+        sketch.update(part)
+
+    assert len(sketch) == len(values)
+    assert sketch.size < 10 * 256
+    for q in (0.001, 0.01, 0.5, 0.99):
+        rank = np.mean(values <= sketch.quantile(q))
+        assert abs(rank - q) < 2 / 256
+
+
+def test_sketch_merge_matches_single_stream():
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(size=50_000), rng.normal(3, 1, size=70_000)
+    merged = KLLSketch(k=512)
+    merged.update(a)
+    other = KLLSketch(k=512)
+    other.update(b)
+    merged.merge(other)
+
+    values = np.concatenate([a, b])
+    assert len(merged) == len(values)
+    for q in (0.01, 0.25, 0.75):
+        assert abs(np.mean(values <= merged.quantile(q)) - q) < 2 / 512
+
+
+def test_sketch_ignores_nan_and_rejects_empty():
+    sketch = KLLSketch(k=64)
+    with pytest.raises(ValueError):
+        sketch.quantile(0.5)
+    sketch.update([np.nan, 1.0, 2.0, np.nan])
+    assert len(sketch) == 2
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return Detector()
+
+
+@pytest.fixture(scope="module")
+def flows(detector, tmp_path_factory):
+    rng = np.random.default_rng(7)
+    cols = detector.feature_columns
+    df = pd.DataFrame(rng.standard_cauchy((3_000, len(cols))) * 100, columns=cols)
+    df.iloc[rng.integers(0, len(df), 60), rng.integers(0, len(cols), 60)] = np.nan
+    df.iloc[rng.integers(0, len(df), 30), rng.integers(0, len(cols), 30)] = np.inf
+    path = tmp_path_factory.mktemp("stream") / "flows.csv"
+    df.to_csv(path, index=False)
+    return str(path), pd.read_csv(path)
+
+
+@pytest.fixture
+def calibrated(detector, flows):
+    # training medians for the streamed file
+    medians = flows[1][detector.feature_columns].replace([np.inf, -np.inf], np.nan).median()
+    detector.calibration = {"medians": medians.to_dict()}
+    detector._medians = medians.to_numpy(dtype=np.float64)
+    yield detector
+    detector.calibration = None
+    detector._medians = None
+
+
+def _collect(result):
+    parts = list(result["anomalies"])
+    return pd.concat(parts) if parts else None
+
+
+@pytest.mark.parametrize("chunksize", [500, 1_237])
+def test_stream_matches_score(calibrated, flows, chunksize):
+    path, df = flows
+    q = 0.01
+    scores = calibrated.raw_scores(df, fixed=True, lof=False)["if_scores"]
+    threshold = float(np.quantile(scores, q))
+
+    result = calibrated.score_stream(path, q=q, chunksize=chunksize)
+    assert result["threshold_exact"]
+    assert result["threshold"] == threshold
+    assert result["n_rows"] == len(df)
+
+    flagged = _collect(result)
+    expected = np.flatnonzero(scores <= threshold)
+    np.testing.assert_array_equal(flagged.index.to_numpy(), expected)
+    np.testing.assert_array_equal(flagged["if_score"].to_numpy(), scores[expected])
+
+
+@pytest.mark.parametrize("chunksize", [500, 1_237])
+def test_second_pass_when_buffer_is_too_small(calibrated, flows, chunksize):
+    path, df = flows
+    scores = calibrated.raw_scores(df, fixed=True, lof=False)["if_scores"]
+
+    result = calibrated.score_stream(path, q=0.05, chunksize=chunksize, max_candidates=20)
+    assert not result["threshold_exact"]
+    assert abs(np.mean(scores <= result["threshold"]) - 0.05) < 0.01
+
+    flagged = _collect(result)
+    expected = np.flatnonzero(scores <= result["threshold"])
+    np.testing.assert_array_equal(flagged.index.to_numpy(), expected)
+    np.testing.assert_array_equal(flagged["if_score"].to_numpy(), scores[expected])